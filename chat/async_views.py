@@ -0,0 +1,140 @@
+import json
+import asyncio
+import logging
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.http import Http404, JsonResponse
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework.exceptions import AuthenticationFailed
+
+from chat import authentication, metrics, providers, ratelimit, telegram, turns
+from chat.streaming import astream_reply, sse_response
+
+logger = logging.getLogger(__name__)
+
+
+async def aauthenticate(request):
+    """Resolve ``Authorization: Token <key>`` the way DRF's TokenAuthentication does, through the token cache."""
+    auth = request.headers.get("Authorization", "").split()
+    if not auth or auth[0].lower() != "token":
+        return AnonymousUser()
+    if len(auth) != 2:
+        raise AuthenticationFailed("Invalid token header.")
+    user, _ = await authentication.aauthenticate_key(auth[1])
+    return user
+
+
+@method_decorator(csrf_exempt, name="dispatch")
+class AsyncAPIView(View):
+    """
+    Minimal async stand-in for DRF's ``APIView``: token auth, JSON body
+    parsing into ``request.data`` and JSON errors, without pinning a
+    worker thread while the upstream LLM call is in flight.
+    """
+    authentication_required = False
+    rate_limited = False
+
+    async def dispatch(self, request, *args, **kwargs):
+        try:
+            with metrics.timed("auth"):
+                request.user = await aauthenticate(request)
+        except AuthenticationFailed as e:
+            return JsonResponse({"detail": str(e)}, status=401)
+        if self.authentication_required and not request.user.is_authenticated:
+            return JsonResponse({"detail": "Authentication credentials were not provided."}, status=401)
+
+        try:
+            request.data = json.loads(request.body or b"{}")
+        except ValueError:
+            return JsonResponse({"detail": "JSON parse error"}, status=400)
+        if not isinstance(request.data, dict):
+            return JsonResponse({"detail": "Expected a JSON object"}, status=400)
+
+        handler = getattr(self, request.method.lower(), self.http_method_not_allowed)
+        try:
+            if self.rate_limited:
+                ident = ratelimit.identity(request)
+                await ratelimit.ahit(ident, ratelimit.rate_for(ident))
+            response = handler(request, *args, **kwargs)
+            if asyncio.iscoroutine(response):
+                response = await response
+        except Http404:
+            return JsonResponse({"detail": "No Conversation matches the given query."}, status=404)
+        except ratelimit.RateLimited as e:
+            return JsonResponse({"detail": str(e.detail)}, status=429, headers={"Retry-After": str(e.retry_after)})
+        return response
+
+
+class AsyncChatAPIView(AsyncAPIView):
+    authentication_required = True
+    rate_limited = True
+    route = "openrouter"
+    conversation_required = True
+    log_prefix = ""
+
+    async def post(self, request):
+        try:
+            user_message, conversation_id = turns.parse(request.data, self.conversation_required)
+        except turns.InvalidTurn as e:
+            return JsonResponse({"error": str(e)}, status=400)
+        conversation = await turns.aget_conversation(conversation_id, request.user.pk)
+
+        logger.info(f"{self.log_prefix}User message: {user_message}")
+
+        messages = await turns.abuild_messages(conversation, request.data, user_message)
+
+        async def save_turn(reply):
+            await turns.asave_turn(conversation, user_message, reply)
+
+        ident = ratelimit.identity(request)
+        await ratelimit.aacquire_slot(ident)
+        if request.data.get("stream"):
+            events = astream_reply(providers.astream(self.route, messages), on_complete=save_turn, log_prefix=self.log_prefix)
+            return sse_response(ratelimit.areleasing(events, ident))
+
+        try:
+            reply = await turns.acomplete(self.route, messages, conversation)
+            await save_turn(reply)
+            return JsonResponse({"reply": reply})
+        except Exception as e:
+            body, status, headers = turns.error_response(e, self.log_prefix)
+            return JsonResponse(body, status=status, headers=headers)
+        finally:
+            await ratelimit.arelease_slot(ident)
+
+
+class AsyncGroqChatAPIView(AsyncChatAPIView):
+    authentication_required = False
+    route = "groq-8b"
+    conversation_required = False
+    log_prefix = "[GROQ] "
+
+
+class AsyncGroqChatTwoAPIView(AsyncGroqChatAPIView):
+    route = "groq-70b"
+
+
+class AsyncTelegramBotAPIView(AsyncAPIView):
+    async def get(self, request):
+        return JsonResponse({"message": "Telegram Bot Webhook is ready."})
+
+    async def post(self, request):
+        update_id, chat_id, message = telegram.parse_update(request.data)
+
+        if not message or not chat_id or update_id is None:
+            logger.warning("Invalid Telegram request: Missing update_id, chat_id or message")
+            return JsonResponse({"status": "ignored"})
+
+        try:
+            await ratelimit.ahit(f"telegram:{chat_id}", settings.RATE_LIMIT_TELEGRAM)
+        except ratelimit.RateLimited:
+            logger.warning(f"Telegram chat {chat_id} is over its rate limit; update {update_id} dropped")
+            return JsonResponse({"status": "rate_limited"})
+
+        if not await telegram.aenqueue(update_id, chat_id, message):
+            logger.info(f"Duplicate Telegram update {update_id} ignored")
+            return JsonResponse({"status": "duplicate"})
+        return JsonResponse({"status": "queued"})
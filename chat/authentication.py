@@ -0,0 +1,138 @@
+"""
+Token authentication without a database query per request.
+
+``CachedTokenAuthentication`` resolves DRF tokens through two cache
+layers: a small in-process LRU (``AUTH_TOKEN_LOCAL_TTL``) and the shared
+default cache (``AUTH_TOKEN_CACHE_TTL``), falling back to the usual
+``authtoken_token``/``auth_user`` join on a miss. Only a projection is
+cached (user id, ``is_active``, token creation time), never the user row
+and its password hash; the request's user is built from it with every
+other field deferred. Entries are dropped when the token is deleted
+(logout) or its user is deactivated. The in-process layer of *other* workers is not reached
+by that, so a revoked token can keep working there for up to
+``AUTH_TOKEN_LOCAL_TTL`` seconds.
+"""
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+from chat import metrics
+
+_local = OrderedDict()  # cache key -> (projection, expires_at)
+_local_lock = threading.Lock()
+
+
+def _cache_key(key) -> str:
+    # Hashed so raw tokens never show up in Redis
+    return f"chat:auth:{hashlib.sha256(key.encode()).hexdigest()}"
+
+
+def _local_get(cache_key):
+    with _local_lock:
+        entry = _local.get(cache_key)
+        if entry is None:
+            return None
+        if entry[1] < time.monotonic():
+            del _local[cache_key]
+            return None
+        _local.move_to_end(cache_key)
+        return entry[0]
+
+
+def _local_set(cache_key, projection):
+    with _local_lock:
+        _local[cache_key] = (projection, time.monotonic() + settings.AUTH_TOKEN_LOCAL_TTL)
+        _local.move_to_end(cache_key)
+        while len(_local) > settings.AUTH_TOKEN_LOCAL_MAX:
+            _local.popitem(last=False)
+
+
+def _projection_query(key):
+    return Token.objects.filter(key=key).values_list("user_id", "user__is_active", "created")
+
+
+def _resolve(key, projection):
+    """The token's user, with every field but pk and is_active deferred (loaded on first access), and token."""
+    if projection is None:
+        raise exceptions.AuthenticationFailed("Invalid token.")
+    user_id, is_active, created = projection
+    if not is_active:
+        raise exceptions.AuthenticationFailed("User inactive or deleted.")
+    user = User.from_db(DEFAULT_DB_ALIAS, ["id", "is_active"], [user_id, is_active])
+    # Unsaved stand-in for the Token row (the key is its primary key), so request.auth.delete() still works
+    return user, Token(key=key, user=user, created=created)
+
+
+def authenticate_key(key):
+    """Return ``(user, token)`` for an active user's ``key``; raises DRF's ``AuthenticationFailed``."""
+    cache_key = _cache_key(key)
+    projection = _local_get(cache_key)
+    if projection is None:
+        projection = cache.get(cache_key)
+        if projection is None:
+            projection = _projection_query(key).first()
+            # Only active users are cached, so deactivation is the one change to invalidate on
+            if projection is not None and projection[1]:
+                cache.set(cache_key, projection, settings.AUTH_TOKEN_CACHE_TTL)
+        if projection is not None and projection[1]:
+            _local_set(cache_key, projection)
+    return _resolve(key, projection)
+
+
+async def aauthenticate_key(key):
+    cache_key = _cache_key(key)
+    projection = _local_get(cache_key)
+    if projection is None:
+        projection = await cache.aget(cache_key)
+        if projection is None:
+            projection = await _projection_query(key).afirst()
+            if projection is not None and projection[1]:
+                await cache.aset(cache_key, projection, settings.AUTH_TOKEN_CACHE_TTL)
+        if projection is not None and projection[1]:
+            _local_set(cache_key, projection)
+    return _resolve(key, projection)
+
+
+def invalidate(key):
+    cache_key = _cache_key(key)
+    with _local_lock:
+        _local.pop(cache_key, None)
+    cache.delete(cache_key)
+
+
+@receiver(post_delete, sender=Token)
+def _token_deleted(sender, instance, **kwargs):
+    # dj-rest-auth's logout deletes the token
+    invalidate(instance.key)
+
+
+@receiver(post_save, sender=User)
+def _user_saved(sender, instance, created, update_fields=None, **kwargs):
+    # is_active is the only cached user field, and only active users are cached; saves like
+    # update_last_login(update_fields=["last_login"]) on every login don't touch the tokens
+    if created or instance.is_active or (update_fields is not None and "is_active" not in update_fields):
+        return
+    for key in Token.objects.filter(user=instance).values_list("key", flat=True):
+        invalidate(key)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """DRF token auth served from the token cache, timed as the ``auth`` stage of a request."""
+
+    def authenticate(self, request):
+        with metrics.timed("auth"):
+            return super().authenticate(request)
+
+    def authenticate_credentials(self, key):
+        return authenticate_key(key)
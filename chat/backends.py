@@ -1,11 +1,54 @@
-from django.contrib.auth.models import User
+"""
+The only authentication backend (see ``AUTHENTICATION_BACKENDS``).
+
+Email logins look the user up by ``LOWER(email)``, the expression behind
+the case-insensitive unique index from migration 0007 (see
+chat/email_index.py), so a login costs one indexed query and one password
+hash. Username logins (the admin) go through ``ModelBackend`` as before. A miss still runs the hasher once, so
+response times don't reveal whether an address is registered.
+"""
+import logging
+
 from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.models import User
+from django.db.models import F, Lookup, Value
+from django.db.models.functions import Lower
+from django.db.models.lookups import Exact
+
+logger = logging.getLogger(__name__)
+
+
+class NotEqual(Lookup):
+    # ``email <> ''`` as written in the partial index; exclude(email="") renders as NOT (... = ...),
+    # which SQLite's planner doesn't match against the index predicate
+    lookup_name = "ne"
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f"{lhs} <> {rhs}", lhs_params + rhs_params
+
+
+def users_by_email(email):
+    """Users whose address matches ``email`` case-insensitively (at most one once the index is unique)."""
+    return User.objects.filter(Exact(Lower("email"), Lower(Value(email))), NotEqual(F("email"), Value("")))
+
 
 class EmailBackend(ModelBackend):
     def authenticate(self, request, email=None, password=None, **kwargs):
-        try:
-            user = User.objects.get(email=email)
-            if user.check_password(password):
-                return user
-        except User.DoesNotExist:
+        if email is None:
+            return super().authenticate(request, password=password, **kwargs)
+        if not email or password is None:
             return None
+
+        # Only duplicates from before migration 0007 can give more than one; try them oldest first
+        candidates = list(users_by_email(email).order_by("id")[:5])
+        if not candidates:
+            User().set_password(password)
+            return None
+        if len(candidates) > 1:
+            logger.warning(f"⚠️ [AUTH] {len(candidates)}+ accounts share the email of user {candidates[0].id}")
+        for user in candidates:
+            if user.check_password(password) and self.user_can_authenticate(user):
+                return user
+        return None
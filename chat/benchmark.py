@@ -0,0 +1,225 @@
+"""
+Benchmark scenarios for the chat API (see ``manage.py benchmark``).
+
+Each scenario seeds its own data, then fires ``requests`` requests from
+``concurrency`` threads through Django's test ``Client`` (in-process, so
+every request's database queries can be counted) and reports
+throughput, latency percentiles and queries per request. LLM and
+Telegram calls go to the local fake server in chat/fake_llm.py.
+"""
+import time
+import threading
+import statistics
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth.models import User
+from django.db import close_old_connections, connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
+
+from .models import Conversation, Message, TelegramUpdate
+
+SCENARIOS = {}
+
+
+def scenario(name):
+    def register(setup):
+        SCENARIOS[name] = setup
+        return setup
+    return register
+
+
+class Result:
+    def __init__(self, name):
+        self.name = name
+        self.latencies = []
+        self.queries = []
+        self.errors = 0
+        self.elapsed = 0.0
+        self.extra = {}
+        self._lock = threading.Lock()
+
+    def add(self, latency, queries, ok):
+        with self._lock:
+            self.latencies.append(latency)
+            self.queries.append(queries)
+            self.errors += not ok
+
+    def percentile(self, q):
+        if len(self.latencies) < 2:
+            return self.latencies[0] if self.latencies else 0.0
+        return statistics.quantiles(self.latencies, n=100, method="inclusive")[q - 1]
+
+    def summary(self) -> dict:
+        return {
+            "scenario": self.name,
+            "requests": len(self.latencies),
+            "errors": self.errors,
+            "rps": len(self.latencies) / self.elapsed if self.elapsed else 0.0,
+            "p50_ms": self.percentile(50) * 1000,
+            "p95_ms": self.percentile(95) * 1000,
+            "p99_ms": self.percentile(99) * 1000,
+            "queries_per_request": statistics.mean(self.queries) if self.queries else 0.0,
+            **self.extra,
+        }
+
+
+def _users(count, prefix):
+    users = []
+    for i in range(count):
+        user = User.objects.create_user(f"{prefix}{i}-{time.monotonic_ns()}", password="benchmark")
+        users.append((user, Token.objects.create(user=user).key))
+    return users
+
+
+def _seed_messages(conversation, count, length=200):
+    text = ("lorem ipsum dolor sit amet " * (length // 27 + 1))[:length]
+    Message.objects.bulk_create(
+        [Message(conversation=conversation, sender="user" if i % 2 == 0 else "bot", content=text) for i in range(count)],
+        batch_size=1000,
+    )
+
+
+@scenario("chat_turn")
+def chat_turn(options):
+    """POST /api/chat/ on short conversations, one per user."""
+    users = _users(options["users"], "bench-chat")
+    conversations = [(Conversation.objects.create(user=user).id, token) for user, token in users]
+
+    def request(client, i):
+        conversation_id, token = conversations[i % len(conversations)]
+        return client.post(
+            "/api/chat/", {"message": f"benchmark message {i}", "conversation_id": conversation_id},
+            content_type="application/json", HTTP_AUTHORIZATION=f"Token {token}",
+        )
+    return request, None
+
+
+@scenario("login")
+def login(options):
+    """POST /api/auth/login/ with email and password; dominated by the password hasher's cost."""
+    users = _users(options["users"], "bench-login")
+    emails = []
+    for user, _ in users:
+        user.email = f"{user.username}@Example.com"
+        user.save(update_fields=["email"])
+        emails.append(user.email.lower())  # looked up case-insensitively
+
+    def request(client, i):
+        return client.post(
+            "/api/auth/login/", {"email": emails[i % len(emails)], "password": "benchmark"},
+            content_type="application/json",
+        )
+    return request, None
+
+
+@scenario("list_conversations")
+def list_conversations(options):
+    """GET /api/get-conversations/ (first page) for users with many conversations."""
+    users = _users(options["users"], "bench-list")
+    for user, _ in users:
+        conversations = Conversation.objects.bulk_create([Conversation(user=user) for _ in range(100)])
+        for conversation in conversations[:20]:
+            _seed_messages(conversation, 10)
+
+    def request(client, i):
+        _, token = users[i % len(users)]
+        return client.get("/api/get-conversations/?page_size=30", HTTP_AUTHORIZATION=f"Token {token}")
+    return request, None
+
+
+@scenario("get_messages")
+def get_messages(options):
+    """GET /api/get-messages/<id>/ (first page) on a long conversation."""
+    users = _users(options["users"], "bench-messages")
+    conversations = []
+    for user, token in users:
+        conversation = Conversation.objects.create(user=user)
+        _seed_messages(conversation, options["history"])
+        conversations.append((conversation.id, token))
+
+    def request(client, i):
+        conversation_id, token = conversations[i % len(conversations)]
+        return client.get(f"/api/get-messages/{conversation_id}/?page_size=50", HTTP_AUTHORIZATION=f"Token {token}")
+    return request, None
+
+
+@scenario("long_history")
+def long_history(options):
+    """POST /api/groq-chat/ on conversations with ``--history`` stored messages."""
+    users = _users(options["users"], "bench-long")
+    conversations = []
+    for user, token in users:
+        conversation = Conversation.objects.create(user=user)
+        _seed_messages(conversation, options["history"])
+        conversations.append((conversation.id, token))
+
+    def request(client, i):
+        conversation_id, token = conversations[i % len(conversations)]
+        return client.post(
+            "/api/groq-chat/", {"message": f"benchmark message {i}", "conversation_id": conversation_id},
+            content_type="application/json", HTTP_AUTHORIZATION=f"Token {token}",
+        )
+    return request, None
+
+
+@scenario("telegram_burst")
+def telegram_burst(options):
+    """Bursts of Telegram webhook updates over a few chats; also reports the time to drain the queue."""
+    base = int(time.time() * 1000)
+    chats = max(1, options["users"])
+
+    def request(client, i):
+        return client.post("/api/telegram/", {
+            "update_id": base + i,
+            "message": {"chat": {"id": 9_000_000 + i % chats}, "text": f"burst message {i}"},
+        }, content_type="application/json")
+
+    def finish(result, started):
+        deadline = time.monotonic() + options["drain_timeout"]
+        pending = TelegramUpdate.objects.filter(update_id__gte=base).exclude(
+            status__in=[TelegramUpdate.DONE, TelegramUpdate.FAILED]
+        )
+        while pending.exists() and time.monotonic() < deadline:
+            time.sleep(0.05)
+        result.extra["drain_s"] = time.monotonic() - started
+        result.extra["undrained"] = pending.count()
+    return request, finish
+
+
+def run(name, options):
+    """Run one scenario; returns its ``Result``."""
+    request, finish = SCENARIOS[name](options)
+    result = Result(name)
+    local = threading.local()
+
+    def call(i):
+        if not hasattr(local, "client"):
+            local.client = Client()
+        started = time.perf_counter()
+        with CaptureQueriesContext(connection) as queries:
+            response = request(local.client, i)
+            if getattr(response, "streaming", False):
+                b"".join(response.streaming_content)
+        result.add(time.perf_counter() - started, len(queries), response.status_code < 400)
+
+    def worker(indices):
+        try:
+            for i in indices:
+                call(i)
+        finally:
+            close_old_connections()
+
+    for i in range(options["warmup"]):
+        call(options["requests"] + i)  # ids past the measured run, so Telegram updates aren't duplicates
+    result.latencies, result.queries, result.errors = [], [], 0
+
+    concurrency = options["concurrency"]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(worker, [range(offset, options["requests"], concurrency) for offset in range(concurrency)]))
+    result.elapsed = time.perf_counter() - started
+    if finish is not None:
+        finish(result, time.monotonic() - result.elapsed)
+    return result
@@ -0,0 +1,20 @@
+from django.core.checks import Tags, Warning, register
+from django.db import connections
+
+from chat import email_index
+
+
+@register(Tags.database)
+def check_email_index(app_configs, databases=None, **kwargs):
+    warnings = []
+    for alias in databases or []:
+        if connections[alias].vendor not in email_index.VENDORS or email_index.is_unique(alias) is not False:
+            continue
+        duplicates = email_index.duplicate_emails(alias)
+        warnings.append(Warning(
+            f"The {email_index.INDEX} index on auth_user is not unique; "
+            f"{len(duplicates)} emails are shared by several users.",
+            hint="Merge or re-address those accounts, then run manage.py make_email_index_unique.",
+            id="chat.W001",
+        ))
+    return warnings
@@ -0,0 +1,151 @@
+"""
+Server-side assembly of the LLM context window from stored ``Message`` rows.
+
+The window for each conversation is cached; every turn only fetches the
+rows newer than the last cached message id and appends them, then drops
+the oldest turns until the window fits ``CHAT_CONTEXT_TOKEN_BUDGET``.
+Messages already folded into ``Conversation.summary`` are replaced by the
+summary itself.
+"""
+from django.conf import settings
+from django.core.cache import cache
+
+from chat import metrics, persistence
+from .models import Message
+
+ROLES = {"user": "user", "bot": "assistant"}
+
+
+def estimate_tokens(text: str) -> int:
+    # ~4 characters per token for English with the Llama/DeepSeek tokenizers, plus per-message overhead
+    return len(text) // 4 + 4
+
+
+def _cache_key(conversation_id) -> str:
+    return f"chat:context:{conversation_id}"
+
+
+def _turn(role, content, message_id=None) -> dict:
+    return {"id": message_id, "role": role, "content": content, "tokens": estimate_tokens(content)}
+
+
+def trim_to_budget(turns, budget):
+    """Drop the oldest turns until the total fits ``budget``; the newest turn is always kept."""
+    total = sum(turn["tokens"] for turn in turns)
+    start = 0
+    while total > budget and start < len(turns) - 1:
+        total -= turns[start]["tokens"]
+        start += 1
+    return turns[start:]
+
+
+def _history_budget(*system_messages) -> int:
+    return settings.CHAT_CONTEXT_TOKEN_BUDGET - sum(estimate_tokens(text) for text in system_messages)
+
+
+def _summary_message(conversation) -> str:
+    return f"Summary of the earlier part of this conversation: {conversation.summary}" if conversation.summary else ""
+
+
+def _recent_rows(conversation):
+    return (
+        Message.objects.filter(conversation_id=conversation.id, id__gt=conversation.summarized_upto)
+        .order_by("-id")
+        .values_list("id", "sender", "content")[:settings.CHAT_CONTEXT_MAX_MESSAGES]
+    )
+
+
+def _new_rows(conversation_id, last_id):
+    return (
+        Message.objects.filter(conversation_id=conversation_id, id__gt=last_id)
+        .order_by("id")
+        .values_list("id", "sender", "content")
+    )
+
+
+def _merge(entry, rows, budget) -> dict:
+    turns = entry["turns"] + [_turn(ROLES.get(sender, "user"), content, pk) for pk, sender, content in rows]
+    turns = trim_to_budget(turns[-settings.CHAT_CONTEXT_MAX_MESSAGES:], budget)
+    return {"last_id": rows[-1][0] if rows else entry["last_id"], "turns": turns}
+
+
+def _as_messages(system_prompt, turns, summary=""):
+    system = [{"role": "system", "content": system_prompt}]
+    if summary:
+        system.append({"role": "system", "content": summary})
+    return system + [{"role": turn["role"], "content": turn["content"]} for turn in turns]
+
+
+def _window(conversation, system_prompt, entry, pending_user_message):
+    summary = _summary_message(conversation)
+    # A summary written by the background summariser may cover turns that are still cached
+    turns = [turn for turn in entry["turns"] if turn["id"] > conversation.summarized_upto]
+    if pending_user_message:
+        turns.append(_turn("user", pending_user_message))
+    return _as_messages(system_prompt, trim_to_budget(turns, _history_budget(system_prompt, summary)), summary)
+
+
+@metrics.timed("prompt_build")
+def build_messages(conversation, system_prompt, pending_user_message=None):
+    """
+    Return ``[system, summary] + stored turns`` for the conversation, within budget.
+
+    ``pending_user_message`` is appended for views that persist the user's
+    message only after the reply has been generated.
+    """
+    persistence.flush_pending(conversation.id)
+    budget = _history_budget(system_prompt, _summary_message(conversation))
+    key = _cache_key(conversation.id)
+    entry = cache.get(key)
+    if entry is None:
+        entry = _merge({"last_id": 0, "turns": []}, list(reversed(_recent_rows(conversation))), budget)
+        cache.set(key, entry, settings.CHAT_CONTEXT_CACHE_TTL)
+    else:
+        rows = list(_new_rows(conversation.id, entry["last_id"]))
+        if rows:
+            entry = _merge(entry, rows, budget)
+            cache.set(key, entry, settings.CHAT_CONTEXT_CACHE_TTL)
+    return _window(conversation, system_prompt, entry, pending_user_message)
+
+
+async def abuild_messages(conversation, system_prompt, pending_user_message=None):
+    with metrics.timed("prompt_build"):
+        await persistence.aflush_pending(conversation.id)
+        budget = _history_budget(system_prompt, _summary_message(conversation))
+        key = _cache_key(conversation.id)
+        entry = await cache.aget(key)
+        if entry is None:
+            rows = [row async for row in _recent_rows(conversation)]
+            entry = _merge({"last_id": 0, "turns": []}, rows[::-1], budget)
+            await cache.aset(key, entry, settings.CHAT_CONTEXT_CACHE_TTL)
+        else:
+            rows = [row async for row in _new_rows(conversation.id, entry["last_id"])]
+            if rows:
+                entry = _merge(entry, rows, budget)
+                await cache.aset(key, entry, settings.CHAT_CONTEXT_CACHE_TTL)
+        return _window(conversation, system_prompt, entry, pending_user_message)
+
+
+def cached_tokens(conversation_id) -> int:
+    """Tokens held in the cached window, i.e. not yet folded into the summary."""
+    entry = cache.get(_cache_key(conversation_id))
+    return sum(turn["tokens"] for turn in entry["turns"]) if entry else 0
+
+
+async def acached_tokens(conversation_id) -> int:
+    entry = await cache.aget(_cache_key(conversation_id))
+    return sum(turn["tokens"] for turn in entry["turns"]) if entry else 0
+
+
+def messages_from_history(system_prompt, history, user_message):
+    """Budget a client-supplied history; anonymous chats have no stored conversation to read."""
+    turns = [
+        _turn(item["role"], str(item.get("content", "")))
+        for item in history
+        if isinstance(item, dict) and item.get("role") in ("user", "assistant")
+    ]
+    return _as_messages(system_prompt, trim_to_budget(turns + [_turn("user", user_message)], _history_budget(system_prompt)))
+
+
+def invalidate(conversation_id):
+    cache.delete(_cache_key(conversation_id))
@@ -0,0 +1,39 @@
+"""
+The case-insensitive index on ``auth_user.email`` behind email logins.
+
+Migration 0007 creates it unique, or non-unique while some address is
+shared by several users (case-insensitively). Once those accounts are
+merged, ``manage.py make_email_index_unique`` rebuilds it unique; until
+then the ``chat.W001`` check (run by ``migrate`` and ``check --database``)
+keeps reporting it.
+"""
+from django.contrib.auth.models import User
+from django.db import connections, transaction
+from django.db.models import Count
+from django.db.models.functions import Lower
+
+INDEX = "auth_user_email_lower"
+VENDORS = ("postgresql", "sqlite")  # the backends with expression and partial indexes
+
+
+def duplicate_emails(using="default") -> list:
+    """Addresses (lowercased) shared by more than one user."""
+    return list(
+        User.objects.using(using).exclude(email="")
+        .values(address=Lower("email")).annotate(users=Count("id")).filter(users__gt=1)
+        .order_by("address").values_list("address", flat=True)
+    )
+
+
+def is_unique(using="default"):
+    """Whether the index is unique; None where it doesn't exist."""
+    connection = connections[using]
+    with connection.cursor() as cursor:
+        index = connection.introspection.get_constraints(cursor, User._meta.db_table).get(INDEX)
+    return None if index is None else index["unique"]
+
+
+def make_unique(using="default"):
+    with transaction.atomic(using=using), connections[using].cursor() as cursor:
+        cursor.execute(f"DROP INDEX IF EXISTS {INDEX}")
+        cursor.execute(f"CREATE UNIQUE INDEX {INDEX} ON auth_user (LOWER(email)) WHERE email <> ''")
@@ -0,0 +1,180 @@
+"""
+NDJSON export and import of a user's conversations.
+
+One JSON object per line: each conversation record is followed by its
+messages, oldest first::
+
+    {"type": "conversation", "id": 12, "started_at": "2025-07-05T10:23:00+00:00"}
+    {"type": "message", "conversation": 12, "sender": "user", "content": "Hi", "timestamp": "..."}
+
+Export walks two ``iterator(chunk_size=...)`` cursors (``aiterator`` under
+ASGI) over conversations and messages, both ordered by conversation id,
+side by side, and import inserts in ``bulk_create`` batches, so both run
+in constant memory whatever the size of the history. Imports over the
+API are capped (``CHAT_IMPORT_MAX_BYTES``/``CHAT_IMPORT_MAX_LINES``), as
+the whole import is one transaction. Imported conversations get new ids;
+summaries are not carried over and are rebuilt as the chats continue.
+"""
+import json
+
+from django.db import transaction
+from django.utils.dateparse import parse_datetime
+
+from .models import Conversation, Message
+
+CHUNK_SIZE = 2000
+
+
+def _line(record) -> str:
+    return json.dumps(record, ensure_ascii=False) + "\n"
+
+
+def _conversation_line(conversation_id, started_at) -> str:
+    return _line({"type": "conversation", "id": conversation_id, "started_at": started_at.isoformat()})
+
+
+def _message_line(message) -> str:
+    conversation_id, sender, content, timestamp = message
+    return _line({
+        "type": "message",
+        "conversation": conversation_id,
+        "sender": sender,
+        "content": content,
+        "timestamp": timestamp.isoformat(),
+    })
+
+
+CONVERSATION_FIELDS = ("id", "started_at")
+MESSAGE_FIELDS = ("conversation_id", "sender", "content", "timestamp")
+
+
+def _export_querysets(user_id):
+    conversations = Conversation.objects.filter(user_id=user_id).order_by("id")
+    messages = Message.objects.filter(conversation__user_id=user_id).order_by("conversation_id", "id")
+    return conversations, messages
+
+
+def export_lines(user_id, chunk_size=CHUNK_SIZE):
+    """Yield the user's conversations and messages as NDJSON lines."""
+    conversations, messages = _export_querysets(user_id)
+    messages = messages.values_list(*MESSAGE_FIELDS).iterator(chunk_size=chunk_size)
+    message = next(messages, None)
+    for conversation_id, started_at in conversations.values_list(*CONVERSATION_FIELDS).iterator(chunk_size=chunk_size):
+        yield _conversation_line(conversation_id, started_at)
+        # Messages of conversations created after the conversation cursor was opened are skipped
+        while message is not None and message[0] <= conversation_id:
+            if message[0] == conversation_id:
+                yield _message_line(message)
+            message = next(messages, None)
+
+
+async def _arows(queryset, fields, chunk_size):
+    # values() rather than values_list(): the latter's aiterator() opens its cursor on the event loop
+    async for row in queryset.values(*fields).aiterator(chunk_size=chunk_size):
+        yield tuple(row[field] for field in fields)
+
+
+async def aexport_lines(user_id, chunk_size=CHUNK_SIZE):
+    """
+    Async counterpart of ``export_lines``. Under ASGI, Django buffers a sync
+    iterator given to ``StreamingHttpResponse`` into a list, so the export
+    view serves this one there.
+    """
+    conversations, messages = _export_querysets(user_id)
+    messages = _arows(messages, MESSAGE_FIELDS, chunk_size)
+    message = await anext(messages, None)
+    async for conversation_id, started_at in _arows(conversations, CONVERSATION_FIELDS, chunk_size):
+        yield _conversation_line(conversation_id, started_at)
+        while message is not None and message[0] <= conversation_id:
+            if message[0] == conversation_id:
+                yield _message_line(message)
+            message = await anext(messages, None)
+
+
+class InvalidExport(ValueError):
+    pass
+
+
+class ImportTooLarge(InvalidExport):
+    pass
+
+
+def _limited(lines, max_lines, max_bytes):
+    # Checked while reading, so an oversized (or chunked, length-less) body is never read to the end
+    total = 0
+    for line_number, raw in enumerate(lines, 1):
+        total += len(raw)
+        if max_lines is not None and line_number > max_lines:
+            raise ImportTooLarge(f"more than {max_lines} lines")
+        if max_bytes is not None and total > max_bytes:
+            raise ImportTooLarge(f"more than {max_bytes} bytes")
+        yield raw
+
+
+def _parse(line_number, raw):
+    try:
+        record = json.loads(raw)
+    except ValueError as e:
+        raise InvalidExport(f"line {line_number}: invalid JSON ({e})")
+    if not isinstance(record, dict) or record.get("type") not in ("conversation", "message"):
+        raise InvalidExport(f"line {line_number}: expected a conversation or message record")
+    return record
+
+
+def _timestamp(line_number, value):
+    parsed = parse_datetime(value) if isinstance(value, str) else None
+    if parsed is None:
+        raise InvalidExport(f"line {line_number}: invalid timestamp {value!r}")
+    return parsed
+
+
+@transaction.atomic
+def import_lines(user, lines, batch_size=CHUNK_SIZE, max_lines=None, max_bytes=None):
+    """
+    Import NDJSON ``lines`` (str or bytes) as new conversations of ``user``.
+
+    All or nothing: a malformed line raises ``InvalidExport`` and rolls the
+    whole import back, as does going past ``max_lines``/``max_bytes``
+    (``ImportTooLarge``). Returns ``(conversations, messages)`` imported.
+    """
+    ids = {}  # exported conversation id -> new id
+    pending = []
+    conversations = messages = 0
+
+    def flush():
+        # auto_now_add overwrites timestamps on insert, so the originals are written back afterwards
+        timestamps = [message.timestamp for message in pending]
+        created = Message.objects.bulk_create(pending, batch_size=batch_size)
+        for message, timestamp in zip(created, timestamps):
+            message.timestamp = timestamp
+        Message.objects.bulk_update(created, ["timestamp"], batch_size=batch_size)
+        pending.clear()
+
+    for line_number, raw in enumerate(_limited(lines, max_lines, max_bytes), 1):
+        if not raw.strip():
+            continue
+        record = _parse(line_number, raw)
+        if record["type"] == "conversation":
+            started_at = _timestamp(line_number, record.get("started_at"))
+            conversation = Conversation.objects.create(user=user)
+            Conversation.objects.filter(pk=conversation.pk).update(started_at=started_at)
+            ids[record.get("id")] = conversation.pk
+            conversations += 1
+            continue
+
+        if record.get("conversation") not in ids:
+            raise InvalidExport(f"line {line_number}: message before its conversation record")
+        if record.get("sender") not in ("user", "bot") or not isinstance(record.get("content"), str):
+            raise InvalidExport(f"line {line_number}: message needs a user/bot sender and text content")
+        pending.append(Message(
+            conversation_id=ids[record["conversation"]],
+            sender=record["sender"],
+            content=record["content"],
+            timestamp=_timestamp(line_number, record.get("timestamp")),
+        ))
+        messages += 1
+        if len(pending) >= batch_size:
+            flush()
+    if pending:
+        flush()
+    return conversations, messages
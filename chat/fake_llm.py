@@ -0,0 +1,89 @@
+"""
+Local stand-in for an OpenAI-compatible chat completions API (and
+Telegram's ``sendMessage``), for benchmarks and load tests.
+
+Every POST is answered after ``latency`` seconds with a reply of
+``reply_tokens`` words; streamed requests (``"stream": true``) get one SSE
+chunk per word at ``token_rate`` words per second. ``error_rate`` of the
+requests fail with a 503 so failover can be exercised. Point the app at
+it with ``OPENROUTER_API_URL``/``GROQ_API_URL``/``TELEGRAM_API_URL``.
+"""
+import json
+import time
+import random
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeLLMConfig:
+    def __init__(self, latency=0.2, token_rate=200.0, reply_tokens=40, error_rate=0.0):
+        self.latency = latency
+        self.token_rate = token_rate
+        self.reply_tokens = reply_tokens
+        self.error_rate = error_rate
+
+
+class FakeLLMHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, like the real providers
+    config = FakeLLMConfig()
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, data):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _chunk(self, data: bytes):
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+        if self.path.endswith("/sendMessage"):
+            return self._send_json(200, {"ok": True, "result": {"message_id": 1}})
+
+        config = self.config
+        time.sleep(config.latency)
+        if random.random() < config.error_rate:
+            return self._send_json(503, {"error": {"message": "fake upstream failure"}})
+
+        words = [f"word{i}" for i in range(config.reply_tokens)]
+        prompt_tokens = sum(len(str(m.get("content", ""))) // 4 + 4 for m in request.get("messages", []))
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": len(words), "total_tokens": prompt_tokens + len(words)}
+        if not request.get("stream"):
+            return self._send_json(200, {
+                "id": "fake", "object": "chat.completion", "model": request.get("model"),
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": " ".join(words)}, "finish_reason": "stop"}],
+                "usage": usage,
+            })
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for i, word in enumerate(words):
+            delta = {"choices": [{"index": 0, "delta": {"content": word if i == 0 else " " + word}}]}
+            self._chunk(f"data: {json.dumps(delta)}\n\n".encode())
+            if config.token_rate:
+                time.sleep(1 / config.token_rate)
+        self._chunk(b"data: [DONE]\n\n")
+        self._chunk(b"")
+
+
+def make_server(host="127.0.0.1", port=0, config=None):
+    handler = type("ConfiguredFakeLLMHandler", (FakeLLMHandler,), {"config": config or FakeLLMConfig()})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def start_server(host="127.0.0.1", port=0, config=None):
+    """Serve on a daemon thread; returns the server (``server.server_address`` has the bound port)."""
+    server = make_server(host, port, config)
+    threading.Thread(target=server.serve_forever, name="fake-llm", daemon=True).start()
+    return server
@@ -0,0 +1,33 @@
+"""
+Password hashers with their cost taken from settings.
+
+``PASSWORD_HASHER`` picks the hasher new passwords are stored with; the
+others stay in ``PASSWORD_HASHERS`` so existing hashes still verify.
+Django rehashes a password on the next successful login whenever it was
+stored with another hasher or with different parameters
+(``must_update``), so changing either setting migrates users gradually.
+The algorithm names are Django's, so stored hashes stay interchangeable
+with the stock hashers.
+"""
+from django.conf import settings
+from django.contrib.auth import hashers
+
+
+class ScryptPasswordHasher(hashers.ScryptPasswordHasher):
+    work_factor = settings.PASSWORD_SCRYPT_WORK_FACTOR
+    block_size = settings.PASSWORD_SCRYPT_BLOCK_SIZE
+    parallelism = settings.PASSWORD_SCRYPT_PARALLELISM
+    # hashlib.scrypt refuses anything over maxmem; 128 * N * r bytes, plus headroom
+    maxmem = 256 * work_factor * block_size
+
+
+class PBKDF2PasswordHasher(hashers.PBKDF2PasswordHasher):
+    iterations = settings.PASSWORD_PBKDF2_ITERATIONS
+
+
+class Argon2PasswordHasher(hashers.Argon2PasswordHasher):
+    # Needs argon2-cffi, which isn't in requirements.txt; only used when PASSWORD_HASHER=argon2
+    time_cost = settings.PASSWORD_ARGON2_TIME_COST
+    memory_cost = settings.PASSWORD_ARGON2_MEMORY_COST
+    parallelism = settings.PASSWORD_ARGON2_PARALLELISM
+
@@ -0,0 +1,57 @@
+"""
+Process-wide pooled HTTP clients for outbound calls (LLM providers, Telegram).
+
+Reusing one client keeps TCP+TLS connections to openrouter.ai,
+api.groq.com and api.telegram.org alive between chat turns instead of
+paying a handshake on every message.
+"""
+import asyncio
+import threading
+import weakref
+
+import httpx
+from django.conf import settings
+
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:  # httpx falls back to HTTP/1.1 keep-alive
+    HTTP2_AVAILABLE = False
+
+_client = None
+_client_lock = threading.Lock()
+# AsyncClient pools are bound to the event loop that opened them
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def _client_options() -> dict:
+    return {
+        "http2": settings.PROVIDER_HTTP2 and HTTP2_AVAILABLE,
+        "limits": httpx.Limits(
+            max_connections=settings.PROVIDER_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.PROVIDER_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=settings.PROVIDER_KEEPALIVE_EXPIRY,
+        ),
+        "timeout": httpx.Timeout(
+            settings.PROVIDER_READ_TIMEOUT,
+            connect=settings.PROVIDER_CONNECT_TIMEOUT,
+            pool=settings.PROVIDER_CONNECT_TIMEOUT,
+        ),
+    }
+
+
+def get_client() -> httpx.Client:
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = httpx.Client(**_client_options())
+    return _client
+
+
+def get_async_client() -> httpx.AsyncClient:
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = _async_clients[loop] = httpx.AsyncClient(**_client_options())
+    return client
@@ -0,0 +1,170 @@
+"""
+Database-backed queue for work that shouldn't hold up a response.
+
+``enqueue("chat.summaries.summarize", {"conversation_id": 1})`` stores a
+``Job`` row naming a function by import path; it is run with the stored
+keyword arguments by a small in-process pool started right after enqueue
+(``JOB_INLINE_WORKERS``) and/or by ``manage.py run_workers``, which also
+picks up retries and jobs whose worker died.
+
+A failing job is retried up to ``max_attempts`` times with exponential
+backoff (``JOB_RETRY_BASE_DELAY`` doubling per attempt, capped at
+``JOB_RETRY_MAX_DELAY``, with jitter), then marked failed with its last
+error. Tasks must therefore be safe to run more than once. A ``key``
+keeps at most one pending job per key, for work that only needs doing
+once however often it is requested.
+"""
+import random
+import logging
+import threading
+from datetime import timedelta
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+_inline_executor = None
+_inline_lock = threading.Lock()
+
+
+def _new_job(task, kwargs, key, delay, max_attempts):
+    return Job(
+        task=task,
+        kwargs=kwargs or {},
+        key=key,
+        max_attempts=max_attempts or settings.JOB_MAX_ATTEMPTS,
+        run_after=timezone.now() + timedelta(seconds=delay),
+    )
+
+
+def enqueue(task, kwargs=None, key="", delay=0, max_attempts=None):
+    """Queue ``task`` (an import path) to run with ``kwargs``; returns None if ``key`` is already pending."""
+    job = _new_job(task, kwargs, key, delay, max_attempts)
+    try:
+        with transaction.atomic():
+            job.save()
+    except IntegrityError:
+        return None  # the pending job with this key will do
+    if not delay:
+        # Not before the caller's transaction commits, or the worker may not see the row
+        transaction.on_commit(lambda: kick(job.pk))
+    return job
+
+
+async def aenqueue(task, kwargs=None, key="", delay=0, max_attempts=None):
+    job = _new_job(task, kwargs, key, delay, max_attempts)
+    try:
+        await job.asave()
+    except IntegrityError:
+        return None
+    if not delay:
+        kick(job.pk)
+    return job
+
+
+def kick(job_id):
+    """Run the job on the in-process pool, if one is configured."""
+    global _inline_executor
+    if settings.JOB_INLINE_WORKERS <= 0:
+        return
+    if _inline_executor is None:
+        with _inline_lock:
+            if _inline_executor is None:
+                _inline_executor = ThreadPoolExecutor(max_workers=settings.JOB_INLINE_WORKERS, thread_name_prefix="jobs")
+    _inline_executor.submit(_run_inline, job_id)
+
+
+def _claimable():
+    now = timezone.now()
+    stale = now - timedelta(seconds=settings.JOB_CLAIM_TIMEOUT)
+    # Due jobs, and jobs whose worker died mid-run
+    return Q(status=Job.PENDING, run_after__lte=now) | Q(status=Job.RUNNING, claimed_at__lt=stale)
+
+
+def _claim(pks):
+    """Mark the claimable jobs among ``pks`` running; returns the ones this worker got."""
+    now = timezone.now()
+    claimed = []
+    for pk in pks:
+        # One UPDATE per job, so two workers can't both win it
+        if Job.objects.filter(_claimable(), pk=pk).update(
+            status=Job.RUNNING, claimed_at=now, attempts=F("attempts") + 1
+        ):
+            claimed.append(pk)
+    return list(Job.objects.filter(pk__in=claimed, status=Job.RUNNING).order_by("run_after"))
+
+
+def claim_due(limit):
+    return _claim(Job.objects.filter(_claimable()).order_by("run_after").values_list("pk", flat=True)[:limit])
+
+
+def backoff(attempts) -> float:
+    """Seconds before retry number ``attempts``: doubling from the base delay, capped, then jittered."""
+    delay = min(settings.JOB_RETRY_MAX_DELAY, settings.JOB_RETRY_BASE_DELAY * 2 ** (attempts - 1))
+    return delay * random.uniform(0.5, 1.0)
+
+
+def run_job(job):
+    """Run a claimed job and record the outcome; returns True on success."""
+    try:
+        import_string(job.task)(**job.kwargs)
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+        failed = job.attempts >= job.max_attempts
+        try:
+            with transaction.atomic():
+                Job.objects.filter(pk=job.pk).update(
+                    status=Job.FAILED if failed else Job.PENDING,
+                    run_after=timezone.now() + timedelta(seconds=0 if failed else backoff(job.attempts)),
+                    finished_at=timezone.now() if failed else None,
+                    last_error=error,
+                )
+        except IntegrityError:
+            # A job with the same key was queued meanwhile; it redoes the work, so this one is dropped
+            failed = True
+            Job.objects.filter(pk=job.pk).update(
+                status=Job.FAILED, finished_at=timezone.now(), last_error=f"{error} (superseded)"
+            )
+        retry = "giving up" if failed else "will retry"
+        logger.error(f"❌ Job {job.pk} {job.task} failed (attempt {job.attempts}/{job.max_attempts}, {retry}): {str(e)}")
+        return False
+    Job.objects.filter(pk=job.pk).update(status=Job.DONE, finished_at=timezone.now(), last_error="")
+    return True
+
+
+def _run_inline(job_id):
+    try:
+        for job in _claim([job_id]):
+            run_job(job)
+    except Exception as e:
+        logger.error(f"❌ Job worker error for job {job_id}: {str(e)}")
+    finally:
+        close_old_connections()
+
+
+def _run_claimed(job):
+    try:
+        run_job(job)
+    finally:
+        close_old_connections()
+
+
+def run_workers(concurrency, poll_interval, once=False, stop_event=None):
+    """Poll for due jobs and run them on ``concurrency`` threads."""
+    stop_event = stop_event or threading.Event()
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="job-worker") as executor:
+        while not stop_event.is_set():
+            jobs = claim_due(concurrency * 4)
+            list(executor.map(_run_claimed, jobs))
+            close_old_connections()
+            if once:
+                return
+            if not jobs:
+                stop_event.wait(poll_interval)
@@ -0,0 +1,80 @@
+import os
+import json
+import tempfile
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+
+from chat import benchmark, providers
+from chat.fake_llm import FakeLLMConfig, start_server
+
+COLUMNS = ("scenario", "requests", "errors", "rps", "p50_ms", "p95_ms", "p99_ms", "queries_per_request")
+
+
+class Command(BaseCommand):
+    help = "Run load scenarios against a throwaway test database and a local fake LLM; reports RPS, latency percentiles and queries."
+
+    def add_arguments(self, parser):
+        parser.add_argument("scenarios", nargs="*", help=f"Any of {', '.join(sorted(benchmark.SCENARIOS))}. Default: all.")
+        parser.add_argument("--requests", type=int, default=200, help="Measured requests per scenario.")
+        parser.add_argument("--concurrency", type=int, default=8, help="Client threads.")
+        parser.add_argument("--users", type=int, default=8, help="Users (or Telegram chats) the requests are spread over.")
+        parser.add_argument("--history", type=int, default=2000, help="Stored messages per conversation in long_history/get_messages.")
+        parser.add_argument("--warmup", type=int, default=5, help="Unmeasured requests before each scenario.")
+        parser.add_argument("--latency", type=float, default=0.05, help="Fake LLM seconds before the first byte.")
+        parser.add_argument("--token-rate", type=float, default=0, help="Fake LLM streamed words per second (0 = no delay).")
+        parser.add_argument("--reply-tokens", type=int, default=40, help="Fake LLM words per reply.")
+        parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of fake LLM requests that fail with 503.")
+        parser.add_argument("--drain-timeout", type=float, default=60.0, help="Seconds to wait for telegram_burst to drain.")
+        parser.add_argument("--json", action="store_true", help="Print one JSON object per scenario.")
+
+    def handle(self, *args, **options):
+        unknown = sorted(set(options["scenarios"]) - set(benchmark.SCENARIOS))
+        if unknown:
+            raise CommandError(f"Unknown scenarios: {', '.join(unknown)} (choose from {', '.join(sorted(benchmark.SCENARIOS))})")
+        server = start_server(config=FakeLLMConfig(
+            options["latency"], options["token_rate"], options["reply_tokens"], options["error_rate"]
+        ))
+        url = f"http://127.0.0.1:{server.server_address[1]}"
+        llm_providers = {name: {**config, "url": f"{url}/v1/chat/completions"} for name, config in settings.LLM_PROVIDERS.items()}
+
+        setup_test_environment()
+        if connection.vendor == "sqlite":
+            # A file rather than shared-cache memory, so the client threads don't trip over table locks
+            connection.settings_dict["TEST"]["NAME"] = os.path.join(tempfile.mkdtemp(), "benchmark.sqlite3")
+            connection.settings_dict.setdefault("OPTIONS", {}).update(
+                timeout=30, transaction_mode="IMMEDIATE", init_command="PRAGMA journal_mode=WAL;"
+            )
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            # Limits off: we're measuring the request path, not the throttles. Background summaries
+            # are off too, as they would outlive the throwaway database.
+            with override_settings(
+                LLM_PROVIDERS=llm_providers, TELEGRAM_API_URL=url, RATE_LIMIT_USER="", RATE_LIMIT_ANON="",
+                RATE_LIMIT_TELEGRAM="", CHAT_MAX_CONCURRENT_PER_USER=10_000, CHAT_SUMMARY_TRIGGER_TOKENS=10**12,
+            ):
+                providers._registry = None
+                cache.clear()
+                if not options["json"]:
+                    self.stdout.write("  ".join(f"{column:>20}" if i == 0 else f"{column:>10}" for i, column in enumerate(COLUMNS)))
+                for name in options["scenarios"] or sorted(benchmark.SCENARIOS):
+                    self._report(benchmark.run(name, options).summary(), options["json"])
+        finally:
+            providers._registry = None
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+            server.shutdown()
+
+    def _report(self, summary, as_json):
+        if as_json:
+            self.stdout.write(json.dumps(summary))
+            return
+        cells = [f"{summary['scenario']:>20}"] + [
+            f"{summary[column]:>10.1f}" if isinstance(summary[column], float) else f"{summary[column]:>10}"
+            for column in COLUMNS[1:]
+        ]
+        extra = {key: value for key, value in summary.items() if key not in COLUMNS}
+        self.stdout.write("  ".join(cells) + ("  " + json.dumps(extra) if extra else ""))
@@ -0,0 +1,28 @@
+import sys
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from chat import exports
+
+
+class Command(BaseCommand):
+    help = "Stream a user's conversations and messages as NDJSON."
+
+    def add_arguments(self, parser):
+        parser.add_argument("username")
+        parser.add_argument("--output", "-o", help="File to write to (default: stdout).")
+        parser.add_argument("--chunk-size", type=int, default=exports.CHUNK_SIZE, help="Rows fetched per round trip.")
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options["username"])
+        except User.DoesNotExist:
+            raise CommandError(f"No user named {options['username']!r}")
+        out = open(options["output"], "w", encoding="utf-8") if options["output"] else sys.stdout
+        try:
+            for line in exports.export_lines(user.id, chunk_size=options["chunk_size"]):
+                out.write(line)
+        finally:
+            if out is not sys.stdout:
+                out.close()
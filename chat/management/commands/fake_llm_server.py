@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from chat.fake_llm import FakeLLMConfig, make_server
+
+
+class Command(BaseCommand):
+    help = "Run a local fake OpenAI-compatible LLM (and Telegram sendMessage) server for load tests."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--host", default="127.0.0.1")
+        parser.add_argument("--port", type=int, default=8765)
+        parser.add_argument("--latency", type=float, default=0.2, help="Seconds before the first byte.")
+        parser.add_argument("--token-rate", type=float, default=200.0, help="Streamed words per second (0 = no delay).")
+        parser.add_argument("--reply-tokens", type=int, default=40, help="Words per reply.")
+        parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with a 503.")
+
+    def handle(self, *args, **options):
+        config = FakeLLMConfig(options["latency"], options["token_rate"], options["reply_tokens"], options["error_rate"])
+        server = make_server(options["host"], options["port"], config)
+        url = f"http://{options['host']}:{server.server_address[1]}"
+        self.stdout.write(f"Fake LLM listening on {url}")
+        self.stdout.write(f"  OPENROUTER_API_URL={url}/v1/chat/completions GROQ_API_URL={url}/v1/chat/completions TELEGRAM_API_URL={url}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            self.stdout.write("Fake LLM stopped")
+        finally:
+            server.server_close()
@@ -0,0 +1,25 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from chat import exports
+
+
+class Command(BaseCommand):
+    help = "Import an NDJSON export (see export_conversations) as new conversations of a user."
+
+    def add_arguments(self, parser):
+        parser.add_argument("username")
+        parser.add_argument("path", help="NDJSON file to import.")
+        parser.add_argument("--batch-size", type=int, default=exports.CHUNK_SIZE, help="Messages inserted per statement.")
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options["username"])
+        except User.DoesNotExist:
+            raise CommandError(f"No user named {options['username']!r}")
+        with open(options["path"], encoding="utf-8") as lines:
+            try:
+                conversations, messages = exports.import_lines(user, lines, batch_size=options["batch_size"])
+            except exports.InvalidExport as e:
+                raise CommandError(f"Nothing imported: {e}")
+        self.stdout.write(f"Imported {conversations} conversations and {messages} messages")
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from chat import email_index
+
+
+class Command(BaseCommand):
+    help = "Rebuild the case-insensitive email index as unique once no address is shared by several users."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--database", default=DEFAULT_DB_ALIAS, help="Database to update.")
+
+    def handle(self, *args, **options):
+        using = options["database"]
+        if connections[using].vendor not in email_index.VENDORS:
+            raise CommandError(f"{connections[using].vendor} databases have no {email_index.INDEX} index")
+        if email_index.is_unique(using):
+            self.stdout.write(f"{email_index.INDEX} is already unique")
+            return
+        duplicates = email_index.duplicate_emails(using)
+        if duplicates:
+            for address in duplicates:
+                self.stderr.write(f"  {address}")
+            raise CommandError(f"{len(duplicates)} emails (above) are shared by several users; merge them first")
+        email_index.make_unique(using)
+        self.stdout.write(self.style.SUCCESS(f"{email_index.INDEX} is now unique"))
@@ -0,0 +1,31 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from chat import retention
+
+
+class Command(BaseCommand):
+    help = "Delete conversations (and their messages) with no activity for the retention period, in small chunks."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=settings.CHAT_RETENTION_DAYS, help="Inactivity period in days.")
+        parser.add_argument("--batch-size", type=int, default=200, help="Conversations deleted per batch.")
+        parser.add_argument("--chunk-size", type=int, default=5000, help="Messages deleted per statement.")
+        parser.add_argument("--pause", type=float, default=0.0, help="Seconds to sleep between batches.")
+        parser.add_argument("--dry-run", action="store_true", help="Only count what would be deleted.")
+
+    def handle(self, *args, **options):
+        conversations, messages = retention.purge_old_conversations(
+            options["days"],
+            batch_size=options["batch_size"],
+            chunk_size=options["chunk_size"],
+            pause=options["pause"],
+            dry_run=options["dry_run"],
+        )
+        verb = "Would delete" if options["dry_run"] else "Deleted"
+        self.stdout.write(f"{verb} {conversations} conversations and {messages} messages older than {options['days']} days")
+        if not options["dry_run"]:
+            updates = retention.purge_telegram_updates(settings.TELEGRAM_RETENTION_DAYS, chunk_size=options["chunk_size"])
+            self.stdout.write(f"Deleted {updates} processed Telegram updates older than {settings.TELEGRAM_RETENTION_DAYS} days")
+            jobs = retention.purge_jobs(settings.JOB_RETENTION_DAYS, chunk_size=options["chunk_size"])
+            self.stdout.write(f"Deleted {jobs} finished jobs older than {settings.JOB_RETENTION_DAYS} days")
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from chat import telegram
+
+
+class Command(BaseCommand):
+    help = "Process queued Telegram webhook updates (retries, and updates missed by the in-process pool)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--concurrency", type=int, default=4, help="Worker threads.")
+        parser.add_argument("--poll-interval", type=float, default=1.0, help="Seconds to sleep when the queue is empty.")
+        parser.add_argument("--once", action="store_true", help="Drain what is claimable now, then exit.")
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"Telegram worker started with {options['concurrency']} threads")
+        try:
+            telegram.run_worker(options["concurrency"], options["poll_interval"], once=options["once"])
+        except KeyboardInterrupt:
+            self.stdout.write("Telegram worker stopped")
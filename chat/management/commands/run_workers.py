@@ -0,0 +1,38 @@
+import threading
+
+from django.core.management.base import BaseCommand
+
+from chat import jobs, telegram
+
+
+class Command(BaseCommand):
+    help = "Run queued background jobs (with retries) and, unless --no-telegram, the Telegram update queue."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--concurrency", type=int, default=4, help="Job worker threads.")
+        parser.add_argument("--telegram-concurrency", type=int, default=4, help="Telegram worker threads.")
+        parser.add_argument("--no-telegram", action="store_true", help="Leave Telegram updates to run_telegram_worker.")
+        parser.add_argument("--poll-interval", type=float, default=1.0, help="Seconds to sleep when a queue is empty.")
+        parser.add_argument("--once", action="store_true", help="Run what is due now, then exit.")
+
+    def handle(self, *args, **options):
+        stop = threading.Event()
+        threads = []
+        if not options["no_telegram"]:
+            threads.append(threading.Thread(
+                target=telegram.run_worker,
+                args=(options["telegram_concurrency"], options["poll_interval"]),
+                kwargs={"once": options["once"], "stop_event": stop},
+                name="telegram-poller",
+                daemon=True,
+            ))
+        for thread in threads:
+            thread.start()
+        self.stdout.write(f"Job worker started with {options['concurrency']} threads")
+        try:
+            jobs.run_workers(options["concurrency"], options["poll_interval"], once=options["once"], stop_event=stop)
+            for thread in threads:
+                thread.join()
+        except KeyboardInterrupt:
+            stop.set()
+            self.stdout.write("Workers stopped")
@@ -0,0 +1,220 @@
+"""
+In-process metrics exposed in the Prometheus text format at ``/metrics``.
+
+Histograms cover request latency per view (``MetricsMiddleware``), the
+stages of a chat turn (``timed("prompt_build")`` etc.) and upstream LLM
+calls; counters cover provider token usage. Provider health, the
+response caches and single-flight counters are read at scrape time.
+
+Values are per process: with several workers each one reports its own,
+so scrape them individually or aggregate with ``sum``/``histogram_quantile``
+over the instance label. Scrapes must send ``Authorization: Bearer
+<METRICS_TOKEN>``; without a configured token the endpoint is closed.
+"""
+import hmac
+import time
+import threading
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connection
+from django.http import HttpResponse, HttpResponseForbidden
+
+# Seconds; LLM calls sit in the upper half
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_lock = threading.Lock()
+
+
+def _labels(names, values) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name, self.documentation, self.labelnames = name, documentation, tuple(labelnames)
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        with _lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with _lock:
+            values = dict(self._values)
+        for key, value in sorted(values.items()):
+            yield self.name, _labels(self.labelnames, key), value
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=BUCKETS):
+        self.name, self.documentation, self.labelnames = name, documentation, tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._values = {}  # labels -> [bucket counts..., count, sum]
+
+    def observe(self, value, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        with _lock:
+            series = self._values.get(key)
+            if series is None:
+                series = self._values[key] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += 1
+            series[-1] += value
+
+    def samples(self):
+        with _lock:
+            values = {key: list(series) for key, series in self._values.items()}
+        for key, series in sorted(values.items()):
+            for bound, count in zip(self.buckets, series):
+                yield f"{self.name}_bucket", _labels(self.labelnames + ("le",), key + (bound,)), count
+            yield f"{self.name}_bucket", _labels(self.labelnames + ("le",), key + ("+Inf",)), series[-2]
+            yield f"{self.name}_count", _labels(self.labelnames, key), series[-2]
+            yield f"{self.name}_sum", _labels(self.labelnames, key), series[-1]
+
+
+REQUEST_SECONDS = Histogram(
+    "chat_http_request_seconds", "Time to the response (headers, for streams) per view.", ("view", "method", "status")
+)
+REQUEST_DB_SECONDS = Histogram("chat_http_db_seconds", "Database time per request (sync views).", ("view",))
+REQUEST_DB_QUERIES = Histogram(
+    "chat_http_db_queries", "Database queries per request (sync views).", ("view",), buckets=(1, 2, 3, 5, 8, 13, 21, 50)
+)
+STAGE_SECONDS = Histogram("chat_stage_seconds", "Time spent in each stage of a chat turn.", ("stage",))
+LLM_SECONDS = Histogram("chat_llm_request_seconds", "Upstream LLM call duration.", ("provider", "outcome"))
+LLM_TTFB_SECONDS = Histogram("chat_llm_ttfb_seconds", "Time to the first streamed delta.", ("provider",))
+LLM_TOKENS = Counter("chat_llm_tokens_total", "Tokens reported in the provider's usage field.", ("provider", "kind"))
+SEMANTIC_SIMILARITY = Histogram(
+    "chat_semantic_cache_similarity", "Best cosine similarity per semantic cache lookup (for tuning the threshold).",
+    buckets=(0.5, 0.6, 0.7, 0.75, 0.8, 0.85, 0.9, 0.95, 0.99),
+)
+
+METRICS = [
+    REQUEST_SECONDS, REQUEST_DB_SECONDS, REQUEST_DB_QUERIES, STAGE_SECONDS, LLM_SECONDS, LLM_TTFB_SECONDS, LLM_TOKENS,
+    SEMANTIC_SIMILARITY,
+]
+
+
+@contextmanager
+def timed(stage):
+    """Record the duration of the block under ``chat_stage_seconds{stage=...}`` (works around awaits too)."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - started, stage=stage)
+
+
+def record_usage(provider, usage):
+    """Count ``prompt_tokens``/``completion_tokens`` from an OpenAI-style ``usage`` object."""
+    for kind in ("prompt_tokens", "completion_tokens"):
+        if isinstance((usage or {}).get(kind), int):
+            LLM_TOKENS.inc(usage[kind], provider=provider, kind=kind.replace("_tokens", ""))
+
+
+def _gauges():
+    # Imported here: providers and response_cache import this module
+    from chat import providers, response_cache, semantic_cache
+
+    for name, snapshot in providers.get_registry().stats().items():
+        labels = _labels(("provider",), (name,))
+        for field in ("p50", "p95"):
+            if snapshot[field] is not None:
+                yield f"chat_provider_latency_{field}_seconds", labels, snapshot[field]
+        yield "chat_provider_error_rate", labels, snapshot["error_rate"]
+        yield "chat_provider_cooling_down", labels, int(snapshot["cooling_down"])
+    for name, value in response_cache.stats().items():
+        yield "chat_response_cache_total", _labels(("result",), (name,)), value
+    for name, value in semantic_cache.stats().items():
+        if name == "entries":
+            yield "chat_semantic_cache_entries", "", value
+        else:
+            yield "chat_semantic_cache_total", _labels(("result",), (name,)), value
+    for name, value in providers.flight_stats().items():
+        yield f"chat_single_flight_{name}", "", value
+
+
+def render() -> str:
+    lines = []
+    for metric in METRICS:
+        lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(f"{name}{labels} {value}" for name, labels, value in metric.samples())
+    lines.extend(f"{name}{labels} {value}" for name, labels, value in _gauges())
+    return "\n".join(lines) + "\n"
+
+
+def metrics_view(request):
+    token = settings.METRICS_TOKEN
+    # No token configured means no access: the endpoint is public otherwise
+    if not token or not hmac.compare_digest(request.headers.get("Authorization", ""), f"Bearer {token}"):
+        return HttpResponseForbidden()
+    return HttpResponse(render(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+def _view_label(request) -> str:
+    match = getattr(request, "resolver_match", None)
+    # The route pattern, not the path, so ids don't explode the label set
+    return match.route if match is not None else "unmatched"
+
+
+class _QueryTimer:
+    def __init__(self):
+        self.queries = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.seconds += time.perf_counter() - started
+
+
+class MetricsMiddleware:
+    """Per-view latency, plus DB time and query count for sync views."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        started = time.perf_counter()
+        timer = _QueryTimer()
+        with connection.execute_wrapper(timer):
+            response = self.get_response(request)
+        view = _view_label(request)
+        REQUEST_SECONDS.observe(time.perf_counter() - started, view=view, method=request.method, status=response.status_code)
+        REQUEST_DB_SECONDS.observe(timer.seconds, view=view)
+        REQUEST_DB_QUERIES.observe(timer.queries, view=view)
+        return response
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        response = await self.get_response(request)
+        REQUEST_SECONDS.observe(
+            time.perf_counter() - started, view=_view_label(request), method=request.method, status=response.status_code
+        )
+        return response
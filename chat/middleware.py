@@ -0,0 +1,51 @@
+"""
+A shorter middleware stack for the JSON API.
+
+``MIDDLEWARE`` is what the admin and the allauth pages need: static files,
+sessions, CSRF, messages, clickjacking headers. Token-authenticated API
+requests use none of it, so ``APIMiddlewareRouter`` (placed near the top
+of ``MIDDLEWARE``) hands paths under ``API_PREFIX`` to a second handler
+built from ``API_MIDDLEWARE`` instead of running the rest of the stack.
+Paths in ``API_FULL_STACK_PREFIXES`` (login, signup, Google) keep the
+full stack, as dj-rest-auth and allauth rely on sessions there.
+"""
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.handlers.base import BaseHandler
+from django.test.utils import override_settings
+
+
+class _APIHandler(BaseHandler):
+    def __init__(self, is_async):
+        super().__init__()
+        self.load_middleware(is_async=is_async)
+
+    def load_middleware(self, is_async=False):
+        # BaseHandler builds its chain from MIDDLEWARE. This runs once, while the server's own handler
+        # loads its middleware at startup, before any request is served
+        with override_settings(MIDDLEWARE=settings.API_MIDDLEWARE):
+            super().load_middleware(is_async=is_async)
+
+
+class APIMiddlewareRouter:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+        # The handler's chain ends in its own URL resolution and view middleware, like the full stack's
+        self.api_response = _APIHandler(self.is_async)._middleware_chain
+        self.prefix = settings.API_PREFIX
+        self.full_stack_prefixes = tuple(settings.API_FULL_STACK_PREFIXES)
+
+    def is_api(self, request) -> bool:
+        path = request.path_info
+        return path.startswith(self.prefix) and not path.startswith(self.full_stack_prefixes)
+
+    def __call__(self, request):
+        if self.is_api(request):
+            return self.api_response(request)
+        return self.get_response(request)
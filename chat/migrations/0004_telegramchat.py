@@ -0,0 +1,26 @@
+# Generated by Django 5.2.2 on 2026-10-18 18:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0003_telegramupdate'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TelegramChat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('chat_id', models.BigIntegerField(unique=True)),
+                ('history', models.JSONField(blank=True, default=list)),
+                ('locked_until', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='telegramupdate',
+            index=models.Index(fields=['chat_id', 'status'], name='chat_telegr_chat_id_cffb47_idx'),
+        ),
+    ]
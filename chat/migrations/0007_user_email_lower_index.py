@@ -0,0 +1,47 @@
+import logging
+
+from django.db import migrations
+
+logger = logging.getLogger(__name__)
+
+INDEX = "auth_user_email_lower"
+
+
+def _duplicates(schema_editor):
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT LOWER(email) FROM auth_user WHERE email <> '' GROUP BY LOWER(email) HAVING COUNT(*) > 1"
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def create_index(apps, schema_editor):
+    if schema_editor.connection.vendor not in ("postgresql", "sqlite"):
+        return  # no expression/partial indexes there; logins still work, just without the index
+    # Existing case-insensitive duplicates would make a unique index fail; index them non-unique
+    # until the accounts are merged, then `manage.py make_email_index_unique` rebuilds it unique
+    # (check chat.W001 reports it until then)
+    duplicates = _duplicates(schema_editor)
+    if duplicates:
+        logger.warning(f"⚠️ {len(duplicates)} emails are shared by several users; creating a non-unique {INDEX} index")
+    unique = "" if duplicates else "UNIQUE "
+    schema_editor.execute(
+        f"CREATE {unique}INDEX IF NOT EXISTS {INDEX} ON auth_user (LOWER(email)) WHERE email <> ''"
+    )
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor in ("postgresql", "sqlite"):
+        schema_editor.execute(f"DROP INDEX IF EXISTS {INDEX}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('chat', '0006_message_search'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
@@ -1,9 +1,16 @@
 from django.db import models
 from django.contrib.auth.models import User
+from django.utils import timezone
 
 class Conversation(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='conversations')
     started_at = models.DateTimeField(auto_now_add=True)
+    # Rolling summary of every message up to and including id ``summarized_upto`` (see chat/summaries.py)
+    summary = models.TextField(blank=True, default="")
+    summarized_upto = models.BigIntegerField(default=0)
+
+    class Meta:
+        indexes = [models.Index(fields=['user', '-started_at'])]
 
     def __str__(self):
         return f"Conversation {self.id} by {self.user.username}"
@@ -14,5 +21,84 @@ class Message(models.Model):
     content = models.TextField()
     timestamp = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [models.Index(fields=['conversation', 'timestamp'])]
+
     def __str__(self):
         return f"{self.sender}: {self.content[:30]}"
+
+
+class TelegramUpdate(models.Model):
+    """Telegram webhook update queued for processing by chat/telegram.py."""
+    PENDING = 'pending'
+    PROCESSING = 'processing'
+    DONE = 'done'
+    FAILED = 'failed'
+
+    update_id = models.BigIntegerField(unique=True)  # Telegram retries deliver the same id
+    chat_id = models.BigIntegerField()
+    text = models.TextField()
+    status = models.CharField(
+        max_length=10,
+        choices=[(PENDING, 'Pending'), (PROCESSING, 'Processing'), (DONE, 'Done'), (FAILED, 'Failed')],
+        default=PENDING,
+        db_index=True,
+    )
+    attempts = models.PositiveSmallIntegerField(default=0)
+    received_at = models.DateTimeField(auto_now_add=True)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['chat_id', 'status'])]
+
+    def __str__(self):
+        return f"Update {self.update_id} from {self.chat_id} ({self.status})"
+
+
+class TelegramChat(models.Model):
+    """Per-chat processing lease and bounded reply context for Telegram."""
+    chat_id = models.BigIntegerField(unique=True)
+    history = models.JSONField(default=list, blank=True)  # last TELEGRAM_HISTORY_MESSAGES turns
+    locked_until = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Telegram chat {self.chat_id}"
+
+
+class Job(models.Model):
+    """Background task queued by chat/jobs.py: a function's import path and its keyword arguments."""
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+
+    task = models.CharField(max_length=200)
+    kwargs = models.JSONField(default=dict, blank=True)
+    # Optional dedupe key: at most one pending job per key
+    key = models.CharField(max_length=200, blank=True, default="")
+    status = models.CharField(
+        max_length=10,
+        choices=[(PENDING, 'Pending'), (RUNNING, 'Running'), (DONE, 'Done'), (FAILED, 'Failed')],
+        default=PENDING,
+    )
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=5)
+    run_after = models.DateTimeField(default=timezone.now)  # pushed back between retries
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True, default="")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['status', 'run_after'])]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['key'],
+                condition=models.Q(status='pending') & ~models.Q(key=''),
+                name='chat_job_pending_key_unique',
+            ),
+        ]
+
+    def __str__(self):
+        return f"Job {self.id} {self.task} ({self.status})"
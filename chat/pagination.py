@@ -0,0 +1,54 @@
+from rest_framework.pagination import CursorPagination, LimitOffsetPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+def wants_pagination(request) -> bool:
+    # Clients that don't ask for pages still get the original plain list
+    return "cursor" in request.query_params or "page_size" in request.query_params
+
+
+class ConversationCursorPagination(CursorPagination):
+    """Keyset pages over ``Conversation(user, -started_at)``."""
+    ordering = ("-started_at", "-id")
+    page_size = 30
+    page_size_query_param = "page_size"
+    max_page_size = 100
+
+
+class MessageCursorPagination(CursorPagination):
+    """Keyset pages over ``Message(conversation, timestamp)``, oldest first."""
+    ordering = ("timestamp", "id")
+    page_size = 50
+    page_size_query_param = "page_size"
+    max_page_size = 200
+
+
+class SearchPagination(LimitOffsetPagination):
+    """
+    Offset pages over ranked search hits (relevance has no stable keyset).
+
+    One extra hit is fetched to tell whether there is a next page, instead of
+    running a COUNT over every match.
+    """
+    default_limit = 20
+    max_limit = 50
+
+    def paginate_hits(self, search, request):
+        """``search(limit, offset)`` returns the hits; the page is trimmed back to ``limit``."""
+        self.request = request
+        self.limit = self.get_limit(request)
+        self.offset = self.get_offset(request)
+        hits = search(self.limit + 1, self.offset)
+        self.has_next = len(hits) > self.limit
+        return hits[:self.limit]
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        url = replace_query_param(url, self.limit_query_param, self.limit)
+        return replace_query_param(url, self.offset_query_param, self.offset + self.limit)
+
+    def get_paginated_response(self, data):
+        return Response({"next": self.get_next_link(), "previous": self.get_previous_link(), "results": data})
@@ -0,0 +1,120 @@
+"""
+Persistence of chat turns.
+
+A turn's user and bot messages are written together with a single
+``bulk_create`` (one INSERT, one transaction). With ``CHAT_WRITE_BEHIND``
+enabled, turns are instead buffered in-process and flushed in batches by
+a background thread every ``CHAT_WRITE_BEHIND_INTERVAL`` seconds or once
+``CHAT_WRITE_BEHIND_BATCH`` messages are waiting.
+"""
+import atexit
+import logging
+import threading
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections, transaction
+
+from chat import metrics
+from .models import Message
+
+logger = logging.getLogger(__name__)
+
+
+def _turn_messages(conversation_id, user_message, reply):
+    return [
+        Message(conversation_id=conversation_id, sender="user", content=user_message),
+        Message(conversation_id=conversation_id, sender="bot", content=reply),
+    ]
+
+
+class WriteBehindBuffer:
+    def __init__(self, max_batch, interval):
+        self.max_batch = max_batch
+        self.interval = interval
+        self._messages = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def add(self, messages):
+        with self._lock:
+            self._messages.extend(messages)
+            full = len(self._messages) >= self.max_batch
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="chat-write-behind", daemon=True)
+                self._thread.start()
+        if full:
+            self._wake.set()
+
+    def has_pending(self, conversation_id) -> bool:
+        with self._lock:
+            return any(message.conversation_id == conversation_id for message in self._messages)
+
+    def flush(self):
+        # Serialise flushes so a batch can't be overtaken by a later one
+        with self._flush_lock:
+            with self._lock:
+                batch, self._messages = self._messages, []
+            if not batch:
+                return
+            try:
+                with transaction.atomic():
+                    Message.objects.bulk_create(batch, batch_size=self.max_batch)
+            except Exception as e:
+                logger.warning(f"⚠️ Batched flush of {len(batch)} messages failed, retrying per conversation: {str(e)}")
+                self._flush_per_conversation(batch)
+
+    def _flush_per_conversation(self, batch):
+        # One bad conversation (e.g. deleted while its turns were buffered) must not take the others down
+        by_conversation = {}
+        for message in batch:
+            by_conversation.setdefault(message.conversation_id, []).append(message)
+        for conversation_id, messages in by_conversation.items():
+            try:
+                with transaction.atomic():
+                    Message.objects.bulk_create(messages)
+            except Exception as e:
+                logger.error(f"❌ Dropped {len(messages)} buffered messages of conversation {conversation_id}: {str(e)}")
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            self.flush()
+            close_old_connections()
+
+
+_buffer = WriteBehindBuffer(settings.CHAT_WRITE_BEHIND_BATCH, settings.CHAT_WRITE_BEHIND_INTERVAL)
+atexit.register(_buffer.flush)
+
+
+def flush_pending(conversation_id):
+    """Write out buffered turns of this conversation before its context is read."""
+    if settings.CHAT_WRITE_BEHIND and _buffer.has_pending(conversation_id):
+        _buffer.flush()
+
+
+async def aflush_pending(conversation_id):
+    if settings.CHAT_WRITE_BEHIND and _buffer.has_pending(conversation_id):
+        await sync_to_async(_buffer.flush)()
+
+
+@metrics.timed("persistence")
+def save_turn(conversation_id, user_message, reply):
+    """Persist the user message and the bot reply in one INSERT."""
+    messages = _turn_messages(conversation_id, user_message, reply)
+    if settings.CHAT_WRITE_BEHIND:
+        _buffer.add(messages)
+    else:
+        Message.objects.bulk_create(messages)
+
+
+async def asave_turn(conversation_id, user_message, reply):
+    messages = _turn_messages(conversation_id, user_message, reply)
+    if settings.CHAT_WRITE_BEHIND:
+        _buffer.add(messages)
+    else:
+        with metrics.timed("persistence"):
+            await Message.objects.abulk_create(messages)
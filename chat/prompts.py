@@ -0,0 +1,81 @@
+"""
+System prompt templates.
+
+Templates are static text, normalised once at import, so the prompt prefix
+is byte-identical across requests (provider-side prompt caching and our
+response cache both rely on that). The current time is not part of any
+template: it is appended to every prompt as a short trailing system
+message. ``TIME_SENSITIVE`` only marks questions about the time or date,
+whose replies must not come from the response cache.
+"""
+import re
+import hashlib
+from datetime import datetime
+
+import pytz
+
+PAKISTAN_TZ = pytz.timezone('Asia/Karachi')
+
+# Questions about the current time or date. This only keeps their replies out of the response
+# cache (they go stale within a minute); the model gets the time on every turn either way
+TIME_SENSITIVE = re.compile(
+    r"\b(?:"
+    r"(?:what|which)(?:'s| is)?(?: the)?(?: current| exact)? (?:time|date)\b"  # what time, what's the date
+    r"|(?:tell|give|show) me the (?:current )?(?:time|date)\b"
+    r"|(?:today|tomorrow|yesterday)'?s date\b|date (?:today|tomorrow|yesterday)\b"  # today's date
+    r"|(?:current|local) (?:time|date)\b|time (?:is it|right now|now)\b|date is it\b"  # current time, time now
+    r"|(?:what|which)(?:'s| is)? (?:day|month|year) (?:is |was |will be )?(?:it|today|tomorrow|yesterday)\b"
+    r"|what(?:'s| is) today\b(?!')|day of the week is\b|(?:days?|weeks?|months?) (?:until|till|left until|since)\b"
+    r"|(?:when|what) is it now\b"
+    r"|(?:kya|kitne) (?:time|baje|date|tareekh)\b|(?:time|date|tareekh) kya\b"  # Roman Urdu: "kya time hua hai"
+    r")"
+    r"|^\W*(?:the )?(?:time|date)\W*(?:please|pls|now)?\W*$",  # a bare "time?" or "date please"
+    re.IGNORECASE,
+)
+
+
+class PromptTemplate:
+    def __init__(self, name, text):
+        self.name = name
+        self.text = " ".join(text.split())
+        # Changes whenever the wording does, so cache keys built from it never outlive an edit
+        self.version = f"{name}:{hashlib.sha1(self.text.encode()).hexdigest()[:12]}"
+
+    def message(self) -> dict:
+        return {"role": "system", "content": self.text}
+
+
+ASSISTANT = PromptTemplate("assistant", """
+    You are a friendly and helpful assistant.
+    When a system message gives the current time in Pakistan (Asia/Karachi), use it to answer questions about the time or date.
+    Only mention the time or date when the user directly asks about it.
+    - Do NOT include the time/date in general greetings or unrelated responses.
+    - For time, respond like: 'It's 2:30 PM in Pakistan!'
+    - For dates, use formats like 'June 23, 2025' or 'Monday, June 23rd'.
+    - If the user asks for **both date and time**, respond like: 'It's 2:30 PM on June 23, 2025 in Pakistan.'
+    - NEVER say you lack real-time access.
+    Examples:
+    1. User: 'What time is it?' → 'It's 2:08 PM in Pakistan!'
+    2. User: 'What's today's date?' → 'Today is June 23, 2025.'
+    3. User: 'What's the current date and time in Pakistan?' → 'It's 2:30 PM on June 23, 2025 in Pakistan.'
+    4. User: 'Hey' → 'Hello! How can I help you today?' (❌ Do NOT mention time here)
+""")
+
+
+def mentions_time(text: str) -> bool:
+    return bool(TIME_SENSITIVE.search(text))
+
+
+def time_message() -> dict:
+    now = datetime.now(PAKISTAN_TZ)
+    return {
+        "role": "system",
+        "content": f"Current date and time in Pakistan (Asia/Karachi): {now.strftime('%A, %B %d, %Y %I:%M %p')}.",
+    }
+
+
+def with_time_context(messages) -> list:
+    """Append the current time as a short trailing system message."""
+    # Always, as the template tells the model never to say it lacks the time; being last, it
+    # leaves the cacheable prompt prefix alone, and response cache keys skip system messages
+    return messages + [time_message()]
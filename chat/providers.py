@@ -0,0 +1,336 @@
+"""
+LLM provider registry.
+
+Every OpenAI-compatible backend (OpenRouter, Groq 8b/70b, ...) is declared
+once in ``settings.LLM_PROVIDERS`` and grouped into routes in
+``settings.LLM_ROUTES``. Views ask for a route; the registry tries the
+route's providers fastest-healthy-first using rolling latency/error stats
+and fails over to the next one on 429, 5xx, timeouts and connection errors.
+Concurrent identical completions are coalesced into one upstream call
+(see chat/singleflight.py).
+"""
+import os
+import json
+import math
+import time
+import hashlib
+import logging
+import threading
+from collections import deque
+
+import httpx
+from django.conf import settings
+
+from chat import metrics
+from chat.http_clients import get_async_client, get_client
+from chat.singleflight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+
+class ProviderError(Exception):
+    """No provider on the route could produce a reply."""
+
+    def __init__(self, message, status_code=503, retry_after=None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+    def headers(self) -> dict:
+        return {"Retry-After": str(self.retry_after)} if self.retry_after else {}
+
+
+def _is_retryable(exc) -> bool:
+    if isinstance(exc, httpx.HTTPStatusError):
+        status = exc.response.status_code
+        return status in (408, 429) or status >= 500
+    return isinstance(exc, httpx.TransportError)
+
+
+def _retry_after(exc) -> float:
+    header = exc.response.headers.get("Retry-After", "") if isinstance(exc, httpx.HTTPStatusError) else ""
+    try:
+        seconds = float(header)
+    except ValueError:
+        seconds = settings.LLM_COOLDOWN_SECONDS
+    return min(seconds, settings.LLM_MAX_COOLDOWN_SECONDS)
+
+
+_DONE = object()
+
+
+def _parse_line(line):
+    """Return the content delta of one SSE line, ``_DONE`` at the end of the stream, or None."""
+    # Providers interleave keep-alive comments (": OPENROUTER PROCESSING") with data lines
+    if not line.startswith("data:"):
+        return None
+    data = line[len("data:"):].strip()
+    if data == "[DONE]":
+        return _DONE
+    choices = json.loads(data).get("choices") or [{}]
+    return choices[0].get("delta", {}).get("content")
+
+
+class ProviderStats:
+    """Rolling window of (recorded_at, latency, ok) samples for one provider/model."""
+
+    def __init__(self, window, max_age):
+        self.max_age = max_age
+        self.cooldown_until = 0.0
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, latency, ok):
+        with self._lock:
+            self._samples.append((time.monotonic(), latency, ok))
+
+    def cool_down(self, seconds):
+        self.cooldown_until = max(self.cooldown_until, time.monotonic() + seconds)
+
+    def snapshot(self) -> dict:
+        now = time.monotonic()
+        with self._lock:
+            # Old samples age out so a provider that was slow an hour ago gets re-probed
+            while self._samples and now - self._samples[0][0] > self.max_age:
+                self._samples.popleft()
+            samples = list(self._samples)
+
+        latencies = sorted(latency for _, latency, ok in samples if ok)
+        errors = sum(1 for _, _, ok in samples if not ok)
+
+        def percentile(q):
+            return latencies[min(len(latencies) - 1, int(q * len(latencies)))] if latencies else None
+
+        return {
+            "samples": len(samples),
+            "p50": percentile(0.50),
+            "p95": percentile(0.95),
+            "error_rate": errors / len(samples) if samples else 0.0,
+            "cooling_down": now < self.cooldown_until,
+        }
+
+
+class Provider:
+    def __init__(self, name, url, model, api_key_env, headers=None):
+        self.name = name
+        self.url = url
+        self.model = model
+        self.api_key_env = api_key_env
+        self.extra_headers = headers or {}
+        self.stats = ProviderStats(settings.LLM_STATS_WINDOW, settings.LLM_STATS_MAX_AGE)
+
+    def headers(self) -> dict:
+        return {
+            "Authorization": f"Bearer {os.getenv(self.api_key_env)}",
+            "Content-Type": "application/json",
+            **self.extra_headers,
+        }
+
+    def payload(self, messages, stream=False) -> dict:
+        data = {"model": self.model, "messages": messages}
+        if stream:
+            data["stream"] = True
+        return data
+
+    def is_healthy(self, snapshot) -> bool:
+        if snapshot["cooling_down"]:
+            return False
+        return snapshot["samples"] < settings.LLM_MIN_SAMPLES or snapshot["error_rate"] <= settings.LLM_MAX_ERROR_RATE
+
+
+class ProviderRegistry:
+    def __init__(self, providers, routes):
+        self.providers = {provider.name: provider for provider in providers}
+        self.routes = routes
+
+    @classmethod
+    def from_settings(cls):
+        providers = [Provider(name, **config) for name, config in settings.LLM_PROVIDERS.items()]
+        return cls(providers, settings.LLM_ROUTES)
+
+    def candidates(self, route):
+        """Providers of ``route``, healthy before unhealthy, then fastest p95 first."""
+        def rank(item):
+            index, provider = item
+            snapshot = provider.stats.snapshot()
+            # Providers without enough samples rank first (in declared order) so they get measured
+            known = snapshot["samples"] >= settings.LLM_MIN_SAMPLES and snapshot["p95"] is not None
+            return (not provider.is_healthy(snapshot), snapshot["p95"] if known else 0.0, index)
+
+        providers = [self.providers[name] for name in self.routes[route]]
+        return [provider for _, provider in sorted(enumerate(providers), key=rank)]
+
+    def stats(self) -> dict:
+        return {name: provider.stats.snapshot() for name, provider in self.providers.items()}
+
+    def _record_success(self, provider, started, usage=None):
+        latency = time.monotonic() - started
+        provider.stats.record(latency, ok=True)
+        metrics.LLM_SECONDS.observe(latency, provider=provider.name, outcome="ok")
+        metrics.record_usage(provider.name, usage)
+
+    def _record_failure(self, provider, exc, started):
+        latency = time.monotonic() - started
+        provider.stats.record(latency, ok=False)
+        metrics.LLM_SECONDS.observe(latency, provider=provider.name, outcome="error")
+        if isinstance(exc, httpx.HTTPStatusError) and exc.response.status_code == 429:
+            provider.stats.cool_down(_retry_after(exc))
+        logger.warning(f"[LLM] ⚠️ {provider.name} failed: {str(exc)}")
+        if not _is_retryable(exc):
+            raise ProviderError(f"{provider.name}: {str(exc)}", status_code=502) from exc
+
+    def _exhausted(self, route, errors):
+        logger.error(f"[LLM] ❌ All providers failed for route '{route}'")
+        now = time.monotonic()
+        cooldowns = [self.providers[name].stats.cooldown_until - now for name in self.routes[route]]
+        if all(cooldown > 0 for cooldown in cooldowns):
+            # Every provider is rate limiting us: pass that on rather than reporting an outage
+            return ProviderError(
+                "All LLM providers are rate limited: " + "; ".join(errors),
+                status_code=429,
+                retry_after=math.ceil(min(cooldowns)),
+            )
+        return ProviderError("All LLM providers failed: " + "; ".join(errors))
+
+    def complete(self, route, messages) -> str:
+        errors = []
+        for provider in self.candidates(route):
+            started = time.monotonic()
+            try:
+                response = get_client().post(provider.url, headers=provider.headers(), json=provider.payload(messages))
+                response.raise_for_status()
+                data = response.json()
+                reply = data["choices"][0]["message"]["content"].strip()
+            except Exception as e:
+                self._record_failure(provider, e, started)
+                errors.append(f"{provider.name}: {str(e)}")
+                continue
+            self._record_success(provider, started, data.get("usage"))
+            return reply
+        raise self._exhausted(route, errors)
+
+    async def acomplete(self, route, messages) -> str:
+        errors = []
+        for provider in self.candidates(route):
+            started = time.monotonic()
+            try:
+                response = await get_async_client().post(
+                    provider.url, headers=provider.headers(), json=provider.payload(messages)
+                )
+                response.raise_for_status()
+                data = response.json()
+                reply = data["choices"][0]["message"]["content"].strip()
+            except Exception as e:
+                self._record_failure(provider, e, started)
+                errors.append(f"{provider.name}: {str(e)}")
+                continue
+            self._record_success(provider, started, data.get("usage"))
+            return reply
+        raise self._exhausted(route, errors)
+
+    def stream(self, route, messages):
+        """Yield content deltas; fails over only until the first delta has been sent."""
+        errors = []
+        for provider in self.candidates(route):
+            started = time.monotonic()
+            emitted = False
+            try:
+                payload = provider.payload(messages, stream=True)
+                with get_client().stream("POST", provider.url, headers=provider.headers(), json=payload) as response:
+                    response.raise_for_status()
+                    for line in response.iter_lines():
+                        delta = _parse_line(line)
+                        if delta is _DONE:
+                            break
+                        if delta:
+                            if not emitted:
+                                metrics.LLM_TTFB_SECONDS.observe(time.monotonic() - started, provider=provider.name)
+                            emitted = True
+                            yield delta
+            except Exception as e:
+                self._record_failure(provider, e, started)
+                if emitted:
+                    raise ProviderError(f"{provider.name}: {str(e)}", status_code=502) from e
+                errors.append(f"{provider.name}: {str(e)}")
+                continue
+            self._record_success(provider, started)
+            return
+        raise self._exhausted(route, errors)
+
+    async def astream(self, route, messages):
+        errors = []
+        for provider in self.candidates(route):
+            started = time.monotonic()
+            emitted = False
+            try:
+                payload = provider.payload(messages, stream=True)
+                async with get_async_client().stream(
+                    "POST", provider.url, headers=provider.headers(), json=payload
+                ) as response:
+                    response.raise_for_status()
+                    async for line in response.aiter_lines():
+                        delta = _parse_line(line)
+                        if delta is _DONE:
+                            break
+                        if delta:
+                            if not emitted:
+                                metrics.LLM_TTFB_SECONDS.observe(time.monotonic() - started, provider=provider.name)
+                            emitted = True
+                            yield delta
+            except Exception as e:
+                self._record_failure(provider, e, started)
+                if emitted:
+                    raise ProviderError(f"{provider.name}: {str(e)}", status_code=502) from e
+                errors.append(f"{provider.name}: {str(e)}")
+                continue
+            self._record_success(provider, started)
+            return
+        raise self._exhausted(route, errors)
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_registry() -> ProviderRegistry:
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = ProviderRegistry.from_settings()
+    return _registry
+
+
+_flights = SingleFlight()
+
+
+def _flight_key(route, messages) -> str:
+    return hashlib.sha256(json.dumps([route, messages], sort_keys=True).encode()).hexdigest()
+
+
+def complete(route, messages) -> str:
+    """Complete on ``route``; concurrent identical requests share one upstream call (``LLM_SINGLE_FLIGHT``)."""
+    with metrics.timed("provider"):
+        if not settings.LLM_SINGLE_FLIGHT:
+            return get_registry().complete(route, messages)
+        return _flights.do(_flight_key(route, messages), lambda: get_registry().complete(route, messages))
+
+
+async def acomplete(route, messages) -> str:
+    with metrics.timed("provider"):
+        if not settings.LLM_SINGLE_FLIGHT:
+            return await get_registry().acomplete(route, messages)
+        return await _flights.ado(_flight_key(route, messages), lambda: get_registry().acomplete(route, messages))
+
+
+def flight_stats() -> dict:
+    """How many completions were requested and how many of them rode on an identical in-flight call."""
+    return _flights.stats()
+
+
+def stream(route, messages):
+    return get_registry().stream(route, messages)
+
+
+def astream(route, messages):
+    return get_registry().astream(route, messages)
@@ -0,0 +1,196 @@
+"""
+Rate limiting and concurrency caps for the LLM endpoints.
+
+Rates are token buckets (``"20/min"`` = bucket of 20, refilled at 20 per
+minute) keyed per user, per client IP for anonymous callers and per
+``chat_id`` for Telegram. Each bucket is stored GCRA-style as a single
+"theoretical arrival time" in the default cache, so it is shared across
+workers when the cache is Redis. Separately, ``CHAT_MAX_CONCURRENT_PER_USER``
+caps how many LLM calls one caller can have in flight at once.
+
+The read-modify-write on a bucket is only locked within a process, so
+concurrent workers can occasionally admit a request or two over the limit;
+that is fine for abuse protection and avoids a lock round trip per request.
+"""
+import math
+import time
+import logging
+import threading
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.exceptions import Throttled
+from rest_framework.throttling import BaseThrottle
+
+PERIODS = {"s": 1, "sec": 1, "m": 60, "min": 60, "h": 3600, "hour": 3600, "d": 86400, "day": 86400}
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_warned_untrusted_proxy = False
+
+
+class RateLimited(Throttled):
+    """A DRF ``Throttled``, so DRF views answer 429 with ``Retry-After`` without extra handling."""
+
+    def __init__(self, retry_after):
+        super().__init__(wait=retry_after)
+        self.retry_after = retry_after
+
+
+def parse_rate(rate):
+    """``"20/min"`` -> ``(20, 60.0)``; None or ``""`` means unlimited."""
+    if not rate:
+        return None
+    count, period = rate.split("/")
+    return int(count), float(PERIODS[period.strip().lower()])
+
+
+def client_ip(request) -> str:
+    global _warned_untrusted_proxy
+    # Behind N trusted proxies (Heroku's router is one) the client is the Nth address from the right
+    forwarded = request.META.get("HTTP_X_FORWARDED_FOR")
+    if forwarded and settings.RATE_LIMIT_TRUSTED_PROXIES:
+        addresses = [address.strip() for address in forwarded.split(",")]
+        return addresses[-min(settings.RATE_LIMIT_TRUSTED_PROXIES, len(addresses))]
+    if forwarded and not _warned_untrusted_proxy:
+        _warned_untrusted_proxy = True
+        logger.warning(
+            "⚠️ X-Forwarded-For is set but RATE_LIMIT_TRUSTED_PROXIES is 0: anonymous callers are limited "
+            "per proxy address, not per client"
+        )
+    return request.META.get("REMOTE_ADDR", "")
+
+
+def identity(request) -> str:
+    user = getattr(request, "user", None)
+    if user is not None and user.is_authenticated:
+        return f"user:{user.pk}"
+    return f"ip:{client_ip(request)}"
+
+
+def rate_for(ident) -> str:
+    return settings.RATE_LIMIT_USER if ident.startswith("user:") else settings.RATE_LIMIT_ANON
+
+
+def _bucket_key(ident) -> str:
+    return f"chat:ratelimit:{ident}"
+
+
+def _admit(tat, now, count, period):
+    """GCRA step: returns ``(new_tat, retry_after)``; ``retry_after`` is 0 when the request is allowed."""
+    interval = period / count
+    new_tat = max(tat or now, now) + interval
+    allow_at = new_tat - count * interval
+    return new_tat, max(0.0, allow_at - now)
+
+
+def _retry_seconds(wait) -> int:
+    return max(1, math.ceil(wait))
+
+
+def hit(ident, rate):
+    """Take one token from ``ident``'s bucket; raises ``RateLimited`` when it is empty."""
+    parsed = parse_rate(rate)
+    if parsed is None:
+        return
+    key = _bucket_key(ident)
+    with _lock:
+        now = time.time()
+        new_tat, wait = _admit(cache.get(key), now, *parsed)
+        if wait:
+            raise RateLimited(_retry_seconds(wait))
+        cache.set(key, new_tat, math.ceil(new_tat - now) + 1)
+
+
+async def ahit(ident, rate):
+    parsed = parse_rate(rate)
+    if parsed is None:
+        return
+    key = _bucket_key(ident)
+    now = time.time()
+    new_tat, wait = _admit(await cache.aget(key), now, *parsed)
+    if wait:
+        raise RateLimited(_retry_seconds(wait))
+    await cache.aset(key, new_tat, math.ceil(new_tat - now) + 1)
+
+
+def _slots_key(ident) -> str:
+    return f"chat:inflight:{ident}"
+
+
+def acquire_slot(ident):
+    """Count one more in-flight LLM call for ``ident``; raises ``RateLimited`` over the cap."""
+    key = _slots_key(ident)
+    # The key expires on its own if a worker dies without releasing its slot
+    cache.add(key, 0, settings.CHAT_SLOT_TIMEOUT)
+    try:
+        in_flight = cache.incr(key)
+    except ValueError:  # expired between add() and incr()
+        cache.add(key, 1, settings.CHAT_SLOT_TIMEOUT)
+        in_flight = 1
+    if in_flight > settings.CHAT_MAX_CONCURRENT_PER_USER:
+        release_slot(ident)
+        raise RateLimited(1)
+    cache.touch(key, settings.CHAT_SLOT_TIMEOUT)
+
+
+def release_slot(ident):
+    try:
+        cache.decr(_slots_key(ident))
+    except ValueError:
+        pass
+
+
+async def aacquire_slot(ident):
+    key = _slots_key(ident)
+    await cache.aadd(key, 0, settings.CHAT_SLOT_TIMEOUT)
+    try:
+        in_flight = await cache.aincr(key)
+    except ValueError:
+        await cache.aadd(key, 1, settings.CHAT_SLOT_TIMEOUT)
+        in_flight = 1
+    if in_flight > settings.CHAT_MAX_CONCURRENT_PER_USER:
+        await arelease_slot(ident)
+        raise RateLimited(1)
+    await cache.atouch(key, settings.CHAT_SLOT_TIMEOUT)
+
+
+async def arelease_slot(ident):
+    try:
+        await cache.adecr(_slots_key(ident))
+    except ValueError:
+        pass
+
+
+def releasing(events, ident):
+    """Hold ``ident``'s slot until a streamed response has been fully sent (or dropped)."""
+    try:
+        yield from events
+    finally:
+        release_slot(ident)
+
+
+async def areleasing(events, ident):
+    try:
+        async for event in events:
+            yield event
+    finally:
+        await arelease_slot(ident)
+
+
+class ChatRateThrottle(BaseThrottle):
+    """DRF throttle over the token buckets: per user, or per IP for anonymous callers."""
+
+    def allow_request(self, request, view):
+        self.retry_after = None
+        ident = identity(request)
+        try:
+            hit(ident, rate_for(ident))
+        except RateLimited as e:
+            self.retry_after = e.retry_after
+            return False
+        return True
+
+    def wait(self):
+        return self.retry_after
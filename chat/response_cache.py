@@ -0,0 +1,96 @@
+"""
+Cache of LLM replies for repeated prompts.
+
+Keys are built from the route, the system prompt template version (see
+chat/prompts.py) and the normalised user/assistant turns. Entries live in
+the ``CHAT_RESPONSE_CACHE_ALIAS`` cache: size-bounded locmem (LRU) by
+default, Redis when ``REDIS_URL`` is set. Exact misses fall through to
+the semantic tier in chat/semantic_cache.py (``SEMANTIC_CACHE_ENABLED``),
+which also serves paraphrases of a cached question.
+"""
+import json
+import hashlib
+import threading
+
+from django.conf import settings
+from django.core.cache import caches
+
+from chat import prompts, providers, semantic_cache
+
+_counters = {"hits": 0, "misses": 0, "bypassed": 0}
+_counters_lock = threading.Lock()
+
+
+def _count(name):
+    with _counters_lock:
+        _counters[name] += 1
+
+
+def stats() -> dict:
+    with _counters_lock:
+        return dict(_counters)
+
+
+def _cache():
+    return caches[settings.CHAT_RESPONSE_CACHE_ALIAS]
+
+
+def _normalise(text: str) -> str:
+    return " ".join(text.split()).casefold()
+
+
+def cache_key(route, template, messages) -> str:
+    turns = [[m["role"], _normalise(m["content"])] for m in messages if m["role"] != "system"]
+    digest = hashlib.sha256(json.dumps([route, template, turns]).encode()).hexdigest()
+    return f"chat:reply:{digest}"
+
+
+def is_cacheable(messages) -> bool:
+    # Replies about the time or date go stale within a minute
+    return not any(m["role"] == "user" and prompts.mentions_time(m["content"]) for m in messages)
+
+
+def cached_complete(route, messages, template) -> str:
+    """``providers.complete`` behind the response cache."""
+    if not is_cacheable(messages):
+        _count("bypassed")
+        return providers.complete(route, messages)
+
+    key = cache_key(route, template, messages)
+    reply = _cache().get(key)
+    if reply is not None:
+        _count("hits")
+        return reply
+    _count("misses")
+    if settings.SEMANTIC_CACHE_ENABLED:
+        reply = semantic_cache.lookup(route, template, messages)
+        if reply is not None:
+            return reply
+    reply = providers.complete(route, messages)
+    _cache().set(key, reply, settings.CHAT_RESPONSE_CACHE_TTL)
+    if settings.SEMANTIC_CACHE_ENABLED:
+        semantic_cache.store(route, template, messages, reply)
+    return reply
+
+
+async def acached_complete(route, messages, template) -> str:
+    if not is_cacheable(messages):
+        _count("bypassed")
+        return await providers.acomplete(route, messages)
+
+    key = cache_key(route, template, messages)
+    reply = await _cache().aget(key)
+    if reply is not None:
+        _count("hits")
+        return reply
+    _count("misses")
+    # The semantic tier is in-memory and sub-millisecond, so it is called directly
+    if settings.SEMANTIC_CACHE_ENABLED:
+        reply = semantic_cache.lookup(route, template, messages)
+        if reply is not None:
+            return reply
+    reply = await providers.acomplete(route, messages)
+    await _cache().aset(key, reply, settings.CHAT_RESPONSE_CACHE_TTL)
+    if settings.SEMANTIC_CACHE_ENABLED:
+        semantic_cache.store(route, template, messages, reply)
+    return reply
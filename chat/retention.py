@@ -0,0 +1,105 @@
+"""
+Bulk deletion of conversations and the retention purge.
+
+Deletes go through ``QuerySet.delete()``. Nothing references messages,
+Telegram updates or jobs and no delete signals are connected for them,
+so Django takes its fast path: a plain ``DELETE ... WHERE`` with no rows
+loaded. Deleting conversations only loads their ids; their messages are
+cascaded with one such ``DELETE``. The purge works through old
+conversations in bounded chunks, each chunk in its own short
+transaction, so it never holds long locks on ``chat_message``.
+"""
+import time
+import logging
+from datetime import timedelta
+
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from chat import context
+from .models import Conversation, Job, Message, TelegramUpdate
+
+logger = logging.getLogger(__name__)
+
+
+def delete_conversations(conversation_ids, chunk_size=None) -> int:
+    """
+    Delete the conversations and all of their messages; returns the number of messages removed.
+
+    With ``chunk_size`` the messages are removed ``chunk_size`` rows per
+    statement/transaction instead of in one statement.
+    """
+    conversation_ids = list(conversation_ids)
+    if not conversation_ids:
+        return 0
+    messages = Message.objects.filter(conversation_id__in=conversation_ids)
+    deleted = 0
+    if chunk_size:
+        while True:
+            pks = list(messages.values_list("pk", flat=True)[:chunk_size])
+            if not pks:
+                break
+            deleted += Message.objects.filter(pk__in=pks).delete()[0]
+    # Any messages left go with the cascade, in the same transaction as their conversations
+    _, per_model = Conversation.objects.filter(id__in=conversation_ids).only("id").delete()
+    deleted += per_model.get(Message._meta.label, 0)
+    for conversation_id in conversation_ids:
+        context.invalidate(conversation_id)
+    return deleted
+
+
+def stale_conversations(cutoff):
+    """Conversations started before ``cutoff`` with no message since."""
+    recent = Message.objects.filter(conversation=OuterRef("pk"), timestamp__gte=cutoff)
+    return Conversation.objects.filter(started_at__lt=cutoff).filter(~Exists(recent))
+
+
+def purge_old_conversations(days, batch_size=200, chunk_size=5000, pause=0.0, dry_run=False):
+    """
+    Delete conversations inactive for ``days`` days, ``batch_size`` conversations at a time.
+
+    ``pause`` seconds are slept between batches to leave room for live traffic.
+    Returns ``(conversations, messages)`` deleted (or that would be, with ``dry_run``).
+    """
+    cutoff = timezone.now() - timedelta(days=days)
+    if dry_run:
+        stale = stale_conversations(cutoff)
+        return stale.count(), Message.objects.filter(conversation__in=stale).count()
+
+    conversations = messages = 0
+    while True:
+        ids = list(stale_conversations(cutoff).order_by("id").values_list("id", flat=True)[:batch_size])
+        if not ids:
+            break
+        messages += delete_conversations(ids, chunk_size=chunk_size)
+        conversations += len(ids)
+        logger.info(f"🧹 Purged {conversations} conversations ({messages} messages) so far")
+        if pause:
+            time.sleep(pause)
+    return conversations, messages
+
+
+def purge_telegram_updates(days, chunk_size=5000) -> int:
+    """Delete finished (done or failed) webhook updates older than ``days`` days."""
+    cutoff = timezone.now() - timedelta(days=days)
+    finished = TelegramUpdate.objects.filter(
+        status__in=[TelegramUpdate.DONE, TelegramUpdate.FAILED], received_at__lt=cutoff
+    )
+    deleted = 0
+    while True:
+        pks = list(finished.values_list("pk", flat=True)[:chunk_size])
+        if not pks:
+            return deleted
+        deleted += TelegramUpdate.objects.filter(pk__in=pks).delete()[0]
+
+
+def purge_jobs(days, chunk_size=5000) -> int:
+    """Delete finished (done or failed) background jobs older than ``days`` days."""
+    cutoff = timezone.now() - timedelta(days=days)
+    finished = Job.objects.filter(status__in=[Job.DONE, Job.FAILED], created_at__lt=cutoff)
+    deleted = 0
+    while True:
+        pks = list(finished.values_list("pk", flat=True)[:chunk_size])
+        if not pks:
+            return deleted
+        deleted += Job.objects.filter(pk__in=pks).delete()[0]
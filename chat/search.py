@@ -0,0 +1,101 @@
+"""
+Full-text search over a user's messages.
+
+PostgreSQL uses an expression GIN index on ``to_tsvector('english',
+content)``; SQLite uses the ``chat_message_fts`` FTS5 table, kept in sync
+with ``chat_message`` by triggers. Both are created by migration 0006.
+Other backends fall back to a (slow) ``icontains`` scan.
+
+Hits come back best match first, with a short snippet where the matched
+terms are wrapped in ``HIGHLIGHT``.
+"""
+import re
+
+from django.db import connection
+
+from .models import Message
+
+HIGHLIGHT = "**"
+SNIPPET_WORDS = 16
+
+_TERM = re.compile(r"\w+", re.UNICODE)
+
+_POSTGRES_SQL = f"""
+    SELECT hit.id, hit.conversation_id, hit.sender, hit.timestamp,
+           ts_headline('english', m.content, hit.query,
+                       'MaxFragments=1, MaxWords={SNIPPET_WORDS}, MinWords=5, StartSel={HIGHLIGHT}, StopSel={HIGHLIGHT}'),
+           hit.rank
+    FROM (
+        SELECT m.id, m.conversation_id, m.sender, m.timestamp, q.query,
+               ts_rank(to_tsvector('english', m.content), q.query) AS rank
+        FROM chat_message m
+        JOIN chat_conversation c ON c.id = m.conversation_id
+        CROSS JOIN websearch_to_tsquery('english', %s) AS q(query)
+        WHERE c.user_id = %s AND to_tsvector('english', m.content) @@ q.query
+        ORDER BY rank DESC, m.id DESC
+        LIMIT %s OFFSET %s
+    ) hit
+    JOIN chat_message m ON m.id = hit.id
+    ORDER BY hit.rank DESC, hit.id DESC
+"""
+
+_SQLITE_SQL = f"""
+    SELECT m.id, m.conversation_id, m.sender, m.timestamp,
+           snippet(chat_message_fts, 0, '{HIGHLIGHT}', '{HIGHLIGHT}', '…', {SNIPPET_WORDS}),
+           -bm25(chat_message_fts) AS rank
+    FROM chat_message_fts
+    JOIN chat_message m ON m.id = chat_message_fts.rowid
+    JOIN chat_conversation c ON c.id = m.conversation_id
+    WHERE chat_message_fts MATCH %s AND c.user_id = %s
+    ORDER BY rank DESC, m.id DESC
+    LIMIT %s OFFSET %s
+"""
+
+_COLUMNS = ("id", "conversation_id", "sender", "timestamp", "snippet", "rank")
+
+
+def _fts5_query(query):
+    # Quote every term so user input can't be parsed as FTS5 syntax (AND/OR/NEAR, column filters...)
+    return " ".join(f'"{term}"' for term in _TERM.findall(query))
+
+
+def _fallback_snippet(content, terms):
+    words = content.split()
+    lowered = [word.casefold() for word in words]
+    first = next((i for i, word in enumerate(lowered) if any(term in word for term in terms)), 0)
+    start = max(0, first - SNIPPET_WORDS // 2)
+    return " ".join(words[start:start + SNIPPET_WORDS])
+
+
+def _fallback(user_id, query, limit, offset):
+    terms = [term.casefold() for term in _TERM.findall(query)]
+    messages = Message.objects.filter(conversation__user_id=user_id)
+    for term in terms:
+        messages = messages.filter(content__icontains=term)
+    rows = messages.order_by("-id").values_list("id", "conversation_id", "sender", "timestamp", "content")
+    return [
+        {"id": pk, "conversation_id": conversation_id, "sender": sender, "timestamp": timestamp,
+         "snippet": _fallback_snippet(content, terms), "rank": None}
+        for pk, conversation_id, sender, timestamp, content in rows[offset:offset + limit]
+    ]
+
+
+def search_messages(user_id, query, limit, offset=0):
+    """Return up to ``limit`` hits for ``query`` among the user's messages, skipping ``offset``."""
+    if not _TERM.search(query):
+        return []
+    if connection.vendor == "postgresql":
+        sql, params = _POSTGRES_SQL, [query, user_id, limit, offset]
+    elif connection.vendor == "sqlite":
+        sql, params = _SQLITE_SQL, [_fts5_query(query), user_id, limit, offset]
+    else:
+        return _fallback(user_id, query, limit, offset)
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+    hits = [dict(zip(_COLUMNS, row)) for row in rows]
+    if connection.vendor == "sqlite":
+        # Raw SQLite rows carry timestamps as text
+        for hit in hits:
+            hit["timestamp"] = connection.ops.convert_datetimefield_value(hit["timestamp"], None, connection)
+    return hits
@@ -0,0 +1,201 @@
+"""
+Semantic (near-duplicate) tier of the response cache.
+
+The exact cache in chat/response_cache.py misses rewordings ("How do I
+reset my password?" vs "how can i reset my password"). This tier embeds
+the latest user message as a hashed bag of its content words, content
+word bigrams and (lightly weighted) word bigrams (``SEMANTIC_CACHE_DIM``
+signed buckets, L2-normalised, NumPy only) and keeps the vectors in one
+in-memory matrix, so a lookup is a single matrix-vector product over
+every entry in the same scope. A cached reply is served when its cosine
+similarity reaches ``SEMANTIC_CACHE_THRESHOLD``.
+
+Function words ("do"/"can", "what is"/"what's", "please") carry no
+content weight, so rewordings land close together, while the bigrams
+keep word order: "celsius to fahrenheit" and "fahrenheit to celsius"
+share every word but not the pairs. Numbers and negations flip an answer
+while barely moving a vector, so they are part of an exact scope along
+with the route, prompt template version and earlier turns. A follow-up
+like "why?" is never answered from another conversation, and time and
+date questions are never cached.
+
+The threshold was measured on the labelled pairs in chat/tests.py. The
+tier is off by default (``SEMANTIC_CACHE_ENABLED``) until it has been
+checked against real traffic.
+
+The index is per process, holds at most ``SEMANTIC_CACHE_MAX_ENTRIES``
+entries for ``CHAT_RESPONSE_CACHE_TTL`` seconds, and evicts expired
+entries first, then the least recently used one.
+"""
+import re
+import json
+import time
+import zlib
+import hashlib
+import threading
+
+import numpy as np
+from django.conf import settings
+
+from chat import metrics
+
+_WORD = re.compile(r"\w+")
+# Tokens that flip the answer while barely moving the vector ("10 usd" vs "100 usd", "safe" vs "not safe")
+_GUARD = re.compile(r"\d+|\b(?:not|no|never|nor|none|nothing|without)\b|n't\b")
+# Words that can be swapped without changing the question ("how do I" / "how can I", "tell me" /
+# "give me"); they only count through the word bigrams. Question words, prepositions, tense and
+# modal verbs stay content words: "how"/"why", "to"/"from", "did"/"will" and "should"/"would"
+# change the answer.
+STOP_WORDS = frozenset("""
+    a an the is are am be do does can could i me my you your we our us it its this that
+    please just kindly tell give show s m t ll re ve d
+""".split())
+# Feature weights, measured on the labelled pairs in chat/tests.py
+_CONTENT, _CONTENT_BIGRAM, _BIGRAM = 1.0, 2.0, 0.5
+
+
+def embed(text: str, dim=None) -> np.ndarray:
+    """Unit-length hashed vector of ``text``'s content words and word bigrams (zeros without words)."""
+    dim = dim or settings.SEMANTIC_CACHE_DIM
+    words = _WORD.findall(text.casefold())
+    content = [word for word in words if word not in STOP_WORDS]
+    features = (
+        [(f"c:{word}", _CONTENT) for word in content]
+        # Bigrams carry word order; the ones with function words tell "can you help me" from "can I help you"
+        + [(f"cb:{a} {b}", _CONTENT_BIGRAM) for a, b in zip(content, content[1:])]
+        + [(f"b:{a} {b}", _BIGRAM) for a, b in zip(words, words[1:])]
+    )
+    hashes = np.fromiter((zlib.crc32(f.encode()) for f, _ in features), dtype=np.uint32, count=len(features))
+    weights = np.fromiter((w for _, w in features), dtype=np.float32, count=len(features))
+    vector = np.zeros(dim, dtype=np.float32)
+    # The top bit picks the sign, so colliding features tend to cancel rather than pile up
+    signs = np.where(hashes & 0x80000000, -1.0, 1.0).astype(np.float32)
+    np.add.at(vector, (hashes % dim).astype(np.intp), signs * weights)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def scope_of(route, template, messages) -> int:
+    """Hash of the earlier turns and the latest user message's guard tokens, as a signed 64-bit int."""
+    last_user = max((i for i, m in enumerate(messages) if m["role"] == "user"), default=-1)
+    context = [
+        [m["role"], " ".join(m["content"].split()).casefold()]
+        for i, m in enumerate(messages) if m["role"] != "system" and i != last_user
+    ]
+    text = messages[last_user]["content"] if last_user >= 0 else ""
+    guards = sorted(_GUARD.findall(text.casefold()))
+    digest = hashlib.blake2b(
+        json.dumps([route, template, context, guards]).encode(), digest_size=8
+    ).digest()
+    return int.from_bytes(digest, "big", signed=True)
+
+
+def latest_user_message(messages) -> str:
+    return next((m["content"] for m in reversed(messages) if m["role"] == "user"), "")
+
+
+class SemanticIndex:
+    def __init__(self, capacity, dim, threshold, ttl):
+        self.capacity, self.dim, self.threshold, self.ttl = capacity, dim, threshold, ttl
+        self._vectors = np.zeros((capacity, dim), dtype=np.float32)
+        self._scopes = np.zeros(capacity, dtype=np.int64)
+        self._expires = np.zeros(capacity, dtype=np.float64)  # 0 = free slot
+        self._used = np.zeros(capacity, dtype=np.float64)
+        self._replies = [None] * capacity
+        self._size = 0  # slots [0, size) have been written at least once
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def stats(self) -> dict:
+        with self._lock:
+            live = int(np.count_nonzero(self._expires[:self._size] > time.monotonic()))
+            return {**self._counters, "entries": live}
+
+    def _best(self, scope, vector, now):
+        # Caller holds self._lock; returns (slot, similarity) or (None, 0.0)
+        size = self._size
+        if not size:
+            return None, 0.0
+        scores = self._vectors[:size] @ vector
+        scores[(self._scopes[:size] != scope) | (self._expires[:size] <= now)] = -1.0
+        slot = int(np.argmax(scores))
+        return (slot, float(scores[slot])) if scores[slot] > -1.0 else (None, 0.0)
+
+    def get(self, scope, vector):
+        now = time.monotonic()
+        with self._lock:
+            slot, similarity = self._best(scope, vector, now)
+            hit = slot is not None and similarity >= self.threshold
+            self._counters["hits" if hit else "misses"] += 1
+            reply = None
+            if hit:
+                self._used[slot] = now
+                reply = self._replies[slot]
+        if slot is not None:
+            metrics.SEMANTIC_SIMILARITY.observe(similarity)
+        return reply
+
+    def _free_slot(self, now):
+        # Caller holds self._lock
+        if self._size < self.capacity:
+            self._size += 1
+            return self._size - 1
+        expired = np.flatnonzero(self._expires <= now)
+        if expired.size:
+            return int(expired[0])
+        self._counters["evictions"] += 1
+        return int(np.argmin(self._used))
+
+    def put(self, scope, vector, reply):
+        now = time.monotonic()
+        with self._lock:
+            slot, similarity = self._best(scope, vector, now)
+            if slot is None or similarity < 0.999:  # otherwise refresh the near-identical entry in place
+                slot = self._free_slot(now)
+            self._vectors[slot] = vector
+            self._scopes[slot] = scope
+            self._expires[slot] = now + self.ttl
+            self._used[slot] = now
+            self._replies[slot] = reply
+
+    def clear(self):
+        with self._lock:
+            self._expires[:] = 0
+            self._replies = [None] * self.capacity
+            self._size = 0
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_index() -> SemanticIndex:
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = SemanticIndex(
+                    settings.SEMANTIC_CACHE_MAX_ENTRIES,
+                    settings.SEMANTIC_CACHE_DIM,
+                    settings.SEMANTIC_CACHE_THRESHOLD,
+                    settings.CHAT_RESPONSE_CACHE_TTL,
+                )
+    return _index
+
+
+def stats() -> dict:
+    return get_index().stats() if _index is not None else {"hits": 0, "misses": 0, "evictions": 0, "entries": 0}
+
+
+def lookup(route, template, messages):
+    """A reply cached for a near-duplicate of the latest user message in the same scope, or None."""
+    vector = embed(latest_user_message(messages))
+    if not vector.any():
+        return None
+    return get_index().get(scope_of(route, template, messages), vector)
+
+
+def store(route, template, messages, reply):
+    vector = embed(latest_user_message(messages))
+    if vector.any():
+        get_index().put(scope_of(route, template, messages), vector, reply)
@@ -0,0 +1,80 @@
+"""
+Single-flight coalescing of identical in-flight calls.
+
+While a call for a key is running, further callers with the same key wait
+for it and get its result (or its exception) instead of starting their
+own. Nothing is kept once the call finishes; that is what the response
+cache is for. Coalescing is per process: threads share sync flights, and
+coroutines on the same event loop share async flights.
+"""
+import asyncio
+import threading
+import weakref
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    def __init__(self):
+        self._calls = {}
+        self._tasks = weakref.WeakKeyDictionary()  # event loop -> {key: task}
+        self._lock = threading.Lock()
+        self._counters = {"calls": 0, "collapsed": 0}
+
+    def _count(self, collapsed):
+        # Caller holds self._lock
+        self._counters["calls"] += 1
+        if collapsed:
+            self._counters["collapsed"] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {**self._counters, "in_flight": len(self._calls) + sum(len(t) for t in self._tasks.values())}
+
+    def do(self, key, fn):
+        """Run ``fn()``, or wait for the identical call already running under ``key``."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            self._count(collapsed=not leader)
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+    async def ado(self, key, fn):
+        """Async counterpart of ``do``; ``fn`` is a coroutine function."""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            tasks = self._tasks.setdefault(loop, {})
+            task = tasks.get(key)
+            self._count(collapsed=task is not None)
+            if task is None:
+                task = tasks[key] = loop.create_task(fn())
+                task.add_done_callback(lambda _: self._forget(loop, key))
+        # Shielded, so one caller going away (client disconnect) doesn't cancel the call for the others
+        return await asyncio.shield(task)
+
+    def _forget(self, loop, key):
+        with self._lock:
+            self._tasks.get(loop, {}).pop(key, None)
@@ -0,0 +1,70 @@
+import json
+import logging
+
+from django.http import StreamingHttpResponse
+
+from chat.providers import ProviderError
+
+logger = logging.getLogger(__name__)
+
+
+def sse_event(data: dict) -> str:
+    return f"data: {json.dumps(data)}\n\n"
+
+
+def stream_reply(deltas, on_complete=None, log_prefix=""):
+    """
+    Forward provider deltas as SSE events as they arrive.
+
+    Once the provider finishes, the stripped full reply is passed to
+    ``on_complete`` (e.g. to persist the bot ``Message``) and a final
+    ``done`` event carrying the whole reply is sent.
+    """
+    parts = []
+    try:
+        for delta in deltas:
+            parts.append(delta)
+            yield sse_event({"delta": delta})
+    except ProviderError as e:
+        logger.error(f"{log_prefix}❌ Provider error while streaming: {str(e)}")
+        yield sse_event({"error": "LLM provider error", "details": str(e)})
+        return
+    except Exception as e:
+        logger.error(f"{log_prefix}❌ General error while streaming: {str(e)}")
+        yield sse_event({"error": "Internal Server Error", "details": str(e)})
+        return
+
+    reply = "".join(parts).strip()
+    if on_complete is not None:
+        on_complete(reply)
+    yield sse_event({"reply": reply, "done": True})
+
+
+async def astream_reply(deltas, on_complete=None, log_prefix=""):
+    """Async counterpart of ``stream_reply``; ``on_complete`` must be a coroutine function."""
+    parts = []
+    try:
+        async for delta in deltas:
+            parts.append(delta)
+            yield sse_event({"delta": delta})
+    except ProviderError as e:
+        logger.error(f"{log_prefix}❌ Provider error while streaming: {str(e)}")
+        yield sse_event({"error": "LLM provider error", "details": str(e)})
+        return
+    except Exception as e:
+        logger.error(f"{log_prefix}❌ General error while streaming: {str(e)}")
+        yield sse_event({"error": "Internal Server Error", "details": str(e)})
+        return
+
+    reply = "".join(parts).strip()
+    if on_complete is not None:
+        await on_complete(reply)
+    yield sse_event({"reply": reply, "done": True})
+
+
+def sse_response(events):
+    response = StreamingHttpResponse(events, content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    # Stop nginx/Heroku router from buffering the stream
+    response["X-Accel-Buffering"] = "no"
+    return response
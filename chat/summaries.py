@@ -0,0 +1,102 @@
+"""
+Background rolling summarisation of long conversations.
+
+Once the un-summarised part of a conversation's context window grows past
+``CHAT_SUMMARY_TRIGGER_TOKENS``, the older messages are folded into
+``Conversation.summary`` by a background job (chat/jobs.py), keeping the newest
+``CHAT_SUMMARY_KEEP_RECENT`` messages verbatim. Requests then send the
+summary plus recent turns, so prompt size stays flat as chats grow.
+"""
+import logging
+
+from django.conf import settings
+from django.db.models import F
+
+from chat import context, jobs, providers
+from .models import Conversation, Message
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_PROMPT = (
+    "You maintain a running summary of a chat between a user and an assistant. "
+    "Merge the new messages into the current summary. Keep names, facts, preferences, "
+    "decisions and open questions; drop greetings and filler. "
+    "Reply with the updated summary only, in under 250 words."
+)
+
+TASK = "chat.summaries.summarize"
+
+
+def _job_key(conversation_id) -> str:
+    # One pending run per conversation; it covers every message up to when it runs
+    return f"summarize:{conversation_id}"
+
+
+def _backlog(conversation_id):
+    # The oldest message outside the summary that isn't among the newest KEEP_RECENT, if any. When a
+    # few long recent messages alone are over the trigger, there is nothing to fold and no job to run
+    keep = settings.CHAT_SUMMARY_KEEP_RECENT
+    return (
+        Message.objects.filter(conversation_id=conversation_id, id__gt=F("conversation__summarized_upto"))
+        .order_by("-id")
+        .values_list("id", flat=True)[keep:keep + 1]
+    )
+
+
+def schedule_if_needed(conversation_id):
+    """Queue a summarisation job when the cached window is over the trigger threshold and can be folded."""
+    if context.cached_tokens(conversation_id) <= settings.CHAT_SUMMARY_TRIGGER_TOKENS:
+        return
+    if _backlog(conversation_id).first() is not None:
+        jobs.enqueue(TASK, {"conversation_id": conversation_id}, key=_job_key(conversation_id))
+
+
+async def aschedule_if_needed(conversation_id):
+    if await context.acached_tokens(conversation_id) <= settings.CHAT_SUMMARY_TRIGGER_TOKENS:
+        return
+    if await _backlog(conversation_id).afirst() is not None:
+        await jobs.aenqueue(TASK, {"conversation_id": conversation_id}, key=_job_key(conversation_id))
+
+
+def summarize(conversation_id):
+    """Fold all but the newest messages into the stored summary, one bounded batch at a time."""
+    conversation = Conversation.objects.only("summary", "summarized_upto").filter(id=conversation_id).first()
+    if conversation is None:
+        return  # deleted since the job was queued
+    keep = settings.CHAT_SUMMARY_KEEP_RECENT
+    # id of the oldest message that stays verbatim in the prompt
+    kept = list(
+        Message.objects.filter(conversation_id=conversation_id)
+        .order_by("-id")
+        .values_list("id", flat=True)[keep - 1:keep]
+    )
+    if not kept:
+        return
+    while True:
+        batch = list(
+            Message.objects.filter(
+                conversation_id=conversation_id, id__gt=conversation.summarized_upto, id__lt=kept[0]
+            )
+            .order_by("id")
+            .values_list("id", "sender", "content")[:settings.CHAT_SUMMARY_MAX_BATCH]
+        )
+        if not batch:
+            return
+
+        transcript = "\n".join(
+            f"{'User' if sender == 'user' else 'Assistant'}: {content}" for _, sender, content in batch
+        )
+        summary = providers.complete(settings.CHAT_SUMMARY_ROUTE, [
+            {"role": "system", "content": SUMMARY_PROMPT},
+            {"role": "user", "content": f"Current summary:\n{conversation.summary or '(none)'}\n\nNew messages:\n{transcript}"},
+        ])
+
+        # Guard against a concurrent run (e.g. another worker process) having moved the summary on
+        updated = Conversation.objects.filter(
+            id=conversation_id, summarized_upto=conversation.summarized_upto
+        ).update(summary=summary, summarized_upto=batch[-1][0])
+        if not updated:
+            return
+        conversation.summary, conversation.summarized_upto = summary, batch[-1][0]
+        context.invalidate(conversation_id)
+        logger.info(f"[SUMMARY] Conversation {conversation_id} summarised up to message {batch[-1][0]}")
@@ -0,0 +1,228 @@
+"""
+Telegram webhook queue.
+
+The webhook only records the update (deduplicated by ``update_id``) and
+acks, so Telegram never waits on the LLM. Updates are processed by worker
+threads: an in-process pool kicked right after enqueue
+(``TELEGRAM_INLINE_WORKERS``) and/or ``manage.py run_telegram_worker``,
+which also retries failures and picks up updates whose worker died.
+
+Work is done per chat: a worker takes a lease on the ``TelegramChat``,
+waits until the chat has been quiet for ``TELEGRAM_COALESCE_WINDOW``,
+answers all pending messages with one LLM call (using the chat's bounded
+history) and queues a single reply, so bursts cost one upstream call.
+The reply is sent by a job (chat/jobs.py): a failed ``sendMessage`` is
+retried with backoff on its own instead of answering the burst again.
+"""
+import os
+import time
+import logging
+import threading
+from datetime import timedelta
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import F, Max, Q
+from django.utils import timezone
+
+from chat import context, jobs, metrics, prompts
+from chat.http_clients import get_client
+from chat.response_cache import cached_complete
+from .models import TelegramChat, TelegramUpdate
+
+logger = logging.getLogger(__name__)
+
+_inline_executor = None
+_inline_lock = threading.Lock()
+
+
+def parse_update(data):
+    """Return ``(update_id, chat_id, text)``; any of them may be None for updates we don't handle."""
+    if not isinstance(data, dict):
+        return None, None, None
+    message = data.get("message") or {}
+    return data.get("update_id"), message.get("chat", {}).get("id"), message.get("text")
+
+
+def enqueue(update_id, chat_id, text):
+    """Store the update; returns False if Telegram already delivered it."""
+    update, created = TelegramUpdate.objects.get_or_create(
+        update_id=update_id, defaults={"chat_id": chat_id, "text": text}
+    )
+    if created:
+        kick(chat_id)
+    return created
+
+
+async def aenqueue(update_id, chat_id, text):
+    update, created = await TelegramUpdate.objects.aget_or_create(
+        update_id=update_id, defaults={"chat_id": chat_id, "text": text}
+    )
+    if created:
+        kick(chat_id)
+    return created
+
+
+def kick(chat_id):
+    """Process the chat's pending updates on the in-process pool, if one is configured."""
+    global _inline_executor
+    if settings.TELEGRAM_INLINE_WORKERS <= 0:
+        return
+    if _inline_executor is None:
+        with _inline_lock:
+            if _inline_executor is None:
+                _inline_executor = ThreadPoolExecutor(
+                    max_workers=settings.TELEGRAM_INLINE_WORKERS, thread_name_prefix="telegram"
+                )
+    _inline_executor.submit(process_chat, chat_id)
+
+
+def _claimable():
+    now = timezone.now()
+    retry_after = now - timedelta(seconds=settings.TELEGRAM_RETRY_DELAY)
+    stale = now - timedelta(seconds=settings.TELEGRAM_CLAIM_TIMEOUT)
+    # New updates, failed attempts whose retry delay has passed, and updates whose worker died
+    return (
+        Q(status=TelegramUpdate.PENDING, claimed_at__isnull=True)
+        | Q(status=TelegramUpdate.PENDING, claimed_at__lt=retry_after)
+        | Q(status=TelegramUpdate.PROCESSING, claimed_at__lt=stale)
+    )
+
+
+def claim_chat(chat_id) -> bool:
+    """Take the chat's processing lease; False while another worker holds it."""
+    now = timezone.now()
+    return bool(
+        TelegramChat.objects.filter(chat_id=chat_id)
+        .filter(Q(locked_until__isnull=True) | Q(locked_until__lt=now))
+        .update(locked_until=now + timedelta(seconds=settings.TELEGRAM_CLAIM_TIMEOUT))
+    )
+
+
+def release_chat(chat_id):
+    TelegramChat.objects.filter(chat_id=chat_id).update(locked_until=None)
+
+
+def _has_claimable(chat_id) -> bool:
+    return TelegramUpdate.objects.filter(_claimable(), chat_id=chat_id).exists()
+
+
+def claimable_chat_ids(limit):
+    return list(
+        TelegramUpdate.objects.filter(_claimable())
+        .values_list("chat_id", flat=True)
+        .order_by("chat_id")
+        .distinct()[:limit]
+    )
+
+
+def _wait_for_quiet(chat_id):
+    """Sleep until no new message has arrived for the coalesce window (bounded by the max wait)."""
+    deadline = time.monotonic() + settings.TELEGRAM_COALESCE_MAX_WAIT
+    while True:
+        latest = TelegramUpdate.objects.filter(
+            chat_id=chat_id, status=TelegramUpdate.PENDING
+        ).aggregate(latest=Max("received_at"))["latest"]
+        if latest is None:
+            return
+        remaining = settings.TELEGRAM_COALESCE_WINDOW - (timezone.now() - latest).total_seconds()
+        if remaining <= 0 or time.monotonic() >= deadline:
+            return
+        time.sleep(min(remaining, deadline - time.monotonic()))
+
+
+def _claim_batch(chat_id):
+    pks = list(
+        TelegramUpdate.objects.filter(_claimable(), chat_id=chat_id)
+        .order_by("update_id")
+        .values_list("pk", flat=True)
+    )
+    TelegramUpdate.objects.filter(_claimable(), pk__in=pks).update(
+        status=TelegramUpdate.PROCESSING, claimed_at=timezone.now(), attempts=F("attempts") + 1
+    )
+    return list(TelegramUpdate.objects.filter(pk__in=pks, status=TelegramUpdate.PROCESSING).order_by("update_id"))
+
+
+ROUTE = "groq-8b"
+SEND_TASK = "chat.telegram.send_message"
+
+
+class TelegramError(Exception):
+    pass
+
+
+@metrics.timed("telegram_send")
+def send_message(chat_id, text):
+    telegram_api = f"{settings.TELEGRAM_API_URL}/bot{os.getenv('TELEGRAM_BOT_TOKEN')}/sendMessage"
+    response = get_client().post(telegram_api, json={"chat_id": chat_id, "text": text}, timeout=10)
+    if response.is_error:
+        # Not raise_for_status(): its message has the URL, bot token included, and ends up in Job.last_error
+        raise TelegramError(f"sendMessage returned {response.status_code}: {response.text[:200]}")
+    logger.info(f"✅ Telegram sent reply: {response.status_code}")
+
+
+def answer(chat, updates):
+    """Reply to a burst of messages from one chat with a single LLM call."""
+    text = "\n".join(update.text for update in updates)
+    logger.info(f"📩 Telegram message from {chat.chat_id} ({len(updates)} coalesced): {text}")
+    messages = prompts.with_time_context(context.messages_from_history(prompts.ASSISTANT.text, chat.history, text))
+    # A provider error propagates, so _process_batch leaves the burst for a retry rather than replying with it
+    reply = cached_complete(ROUTE, messages, prompts.ASSISTANT.version)
+    chat.history = (chat.history + [
+        {"role": "user", "content": text},
+        {"role": "assistant", "content": reply},
+    ])[-settings.TELEGRAM_HISTORY_MESSAGES:]
+    chat.save(update_fields=["history"])
+    jobs.enqueue(SEND_TASK, {"chat_id": chat.chat_id, "text": reply})
+
+
+def _process_batch(chat, updates) -> bool:
+    pks = [update.pk for update in updates]
+    try:
+        answer(chat, updates)
+    except Exception as e:
+        logger.error(f"❌ Failed to process Telegram updates {[u.update_id for u in updates]}: {str(e)}")
+        for update in updates:
+            failed = update.attempts >= settings.TELEGRAM_MAX_ATTEMPTS
+            TelegramUpdate.objects.filter(pk=update.pk).update(
+                status=TelegramUpdate.FAILED if failed else TelegramUpdate.PENDING
+            )
+        return False
+    TelegramUpdate.objects.filter(pk__in=pks).update(status=TelegramUpdate.DONE, processed_at=timezone.now())
+    return True
+
+
+def process_chat(chat_id):
+    """Drain one chat's pending updates in order, holding the chat lease throughout."""
+    try:
+        TelegramChat.objects.get_or_create(chat_id=chat_id)
+        # Re-check after releasing: an update may have landed while we held the lease
+        while _has_claimable(chat_id) and claim_chat(chat_id):
+            try:
+                chat = TelegramChat.objects.get(chat_id=chat_id)
+                while True:
+                    _wait_for_quiet(chat_id)
+                    updates = _claim_batch(chat_id)
+                    if not updates or not _process_batch(chat, updates):
+                        break
+            finally:
+                release_chat(chat_id)
+    except Exception as e:
+        logger.error(f"❌ Telegram worker error for chat {chat_id}: {str(e)}")
+    finally:
+        close_old_connections()
+
+
+def run_worker(concurrency, poll_interval, once=False, stop_event=None):
+    """Poll for chats with claimable updates and process them on ``concurrency`` threads."""
+    stop_event = stop_event or threading.Event()
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="telegram-worker") as executor:
+        while not stop_event.is_set():
+            chat_ids = claimable_chat_ids(concurrency * 4)
+            list(executor.map(process_chat, chat_ids))
+            close_old_connections()
+            if once:
+                return
+            if not chat_ids:
+                stop_event.wait(poll_interval)
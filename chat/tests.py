@@ -1,3 +1,847 @@
-from django.test import TestCase
+import asyncio
+import json
+import time
+import threading
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.contrib.auth import authenticate
+from django.contrib.auth.models import User
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.db import IntegrityError, connection, transaction
+from django.test import (
+    AsyncRequestFactory, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings,
+)
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework.authtoken.models import Token
+
+from chat import (
+    backends, context, email_index, exports, http_clients, jobs, persistence, prompts, providers, ratelimit,
+    response_cache, retention, search, semantic_cache, summaries, telegram, views,
+)
+from chat.async_views import AsyncChatAPIView, AsyncGroqChatAPIView
+from chat.fake_llm import FakeLLMConfig, start_server
+from chat.models import Conversation, Job, Message, TelegramChat, TelegramUpdate
+from chat.singleflight import SingleFlight
+
+class FakeLLMTestCase(TestCase):
+    """Runs against chat/fake_llm.py; set ``self.fake_llm.error_rate = 1`` for an outage."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.fake_llm = FakeLLMConfig(latency=0, token_rate=0, reply_tokens=3)
+        cls.fake_llm_server = start_server(config=cls.fake_llm)
+        url = f"http://127.0.0.1:{cls.fake_llm_server.server_address[1]}"
+        cls.enterClassContext(override_settings(
+            LLM_PROVIDERS={name: {**config, "url": f"{url}/v1/chat/completions"} for name, config in settings.LLM_PROVIDERS.items()},
+            TELEGRAM_API_URL=url,
+        ))
+        cls.addClassCleanup(cls.fake_llm_server.shutdown)
+
+    def setUp(self):
+        self.fake_llm.error_rate = 0.0
+        providers._registry = None  # fresh health stats and cooldowns
+        self.addCleanup(setattr, providers, "_registry", None)
+        cache.clear()
+        caches[settings.CHAT_RESPONSE_CACHE_ALIAS].clear()
+
+
+# Labelled pairs for the semantic cache threshold (SEMANTIC_CACHE_THRESHOLD)
+SAME_MEANING = [
+    ("How do I reset my password?", "how can i reset my password"),
+    ("What's the capital of France?", "what is the capital of france"),
+    ("tell me a joke", "tell me a joke please"),
+    ("who are you", "who are you?"),
+    ("Can you explain recursion?", "explain recursion"),
+    ("what is machine learning", "What's machine learning?"),
+    ("how do I make pancakes", "how can I make pancakes?"),
+]
+DIFFERENT_MEANING = [
+    ("how do I convert celsius to fahrenheit", "how do I convert fahrenheit to celsius"),
+    ("write a poem about love", "write a poem about loss"),
+    ("is python faster than java", "is java faster than python"),
+    ("list vs tuple", "tuple vs list"),
+    ("buy or sell bitcoin", "sell or buy bitcoin"),
+    ("convert 10 usd to pkr", "convert 100 usd to pkr"),
+    ("is it safe to eat raw eggs", "is it not safe to eat raw eggs"),
+    ("how do I reset my password", "why do I reset my password"),
+    # Same content words, told apart by the word bigrams
+    ("what can you do", "what do you do"),
+    ("can you help me", "can I help you"),
+    ("who are you", "who am I"),
+]
+
+
+class SemanticCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.index = semantic_cache.SemanticIndex(capacity=16, dim=512, threshold=0.82, ttl=600)
+
+    def _cached(self, question, reply, history=()):
+        messages = list(history) + [{"role": "user", "content": question}]
+        self.index.put(semantic_cache.scope_of("groq-8b", "v1", messages), semantic_cache.embed(question, 512), reply)
+
+    def _lookup(self, question, history=()):
+        messages = list(history) + [{"role": "user", "content": question}]
+        return self.index.get(semantic_cache.scope_of("groq-8b", "v1", messages), semantic_cache.embed(question, 512))
+
+    def test_rewordings_hit(self):
+        for cached, asked in SAME_MEANING:
+            with self.subTest(cached=cached, asked=asked):
+                self.index.clear()
+                self._cached(cached, "reply")
+                self.assertEqual(self._lookup(asked), "reply")
+
+    def test_different_questions_miss(self):
+        for cached, asked in DIFFERENT_MEANING:
+            with self.subTest(cached=cached, asked=asked):
+                self.index.clear()
+                self._cached(cached, "reply")
+                self.assertIsNone(self._lookup(asked))
+
+    def test_wording_is_left_to_the_vector(self):
+        def scope(question):
+            return semantic_cache.scope_of("groq-8b", "v1", [{"role": "user", "content": question}])
+
+        self.assertEqual(scope("write a poem about love"), scope("how do I reset my password"))
+        self.assertNotEqual(scope("convert 10 usd to pkr"), scope("convert 100 usd to pkr"))
+
+    def test_history_is_part_of_the_scope(self):
+        self._cached("why?", "because of the weather")
+        self.assertIsNone(self._lookup("why?", history=[{"role": "user", "content": "is the flight late"}]))
+
+    def test_least_recently_used_entry_is_evicted(self):
+        index = semantic_cache.SemanticIndex(capacity=2, dim=512, threshold=0.82, ttl=600)
+        for i, question in enumerate(["explain recursion", "explain closures", "explain generators"]):
+            messages = [{"role": "user", "content": question}]
+            index.put(semantic_cache.scope_of("r", "t", messages), semantic_cache.embed(question, 512), i)
+        self.assertEqual(index.stats()["evictions"], 1)
+        self.assertEqual(index.stats()["entries"], 2)
+
+
+class TimeContextTests(SimpleTestCase):
+    def test_time_and_date_questions_get_the_time(self):
+        for text in [
+            "What time is it?", "what's the date today", "today's date please", "what day is it",
+            "what year is it", "current time in karachi", "how many days until eid", "tell me the time",
+            "time?", "time please", "which day is it today", "when is it now", "kya time hua hai",
+        ]:
+            with self.subTest(text=text):
+                self.assertTrue(prompts.mentions_time(text))
+
+    def test_other_mentions_of_time_words_do_not(self):
+        for text in [
+            "a day in the life of a doctor", "right now I'm busy", "what happened in the year 1947",
+            "I need more time to study", "what's today's weather", "how are you today", "tomorrow I have an exam",
+        ]:
+            with self.subTest(text=text):
+                self.assertFalse(prompts.mentions_time(text))
+
+    def test_every_prompt_ends_with_the_time(self):
+        for text in ["hello", "kya time hua hai"]:
+            messages = prompts.with_time_context([prompts.ASSISTANT.message(), {"role": "user", "content": text}])
+            self.assertEqual(messages[-1]["role"], "system")
+            self.assertIn("Current date and time", messages[-1]["content"])
+
+
+class RateLimitTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+
+    @mock.patch("chat.ratelimit.time.time", return_value=1000.0)
+    def test_burst_up_to_the_bucket_size_then_limited(self, now):
+        for _ in range(3):
+            ratelimit.hit("user:1", "3/min")
+        with self.assertRaises(ratelimit.RateLimited) as raised:
+            ratelimit.hit("user:1", "3/min")
+        # One token comes back every 60 / 3 seconds
+        self.assertEqual(raised.exception.retry_after, 20)
+        ratelimit.hit("user:2", "3/min")  # buckets are per identity
+
+    def test_bucket_refills_over_time(self):
+        with mock.patch("chat.ratelimit.time.time", return_value=1000.0):
+            for _ in range(3):
+                ratelimit.hit("user:1", "3/min")
+        with mock.patch("chat.ratelimit.time.time", return_value=1020.0):
+            ratelimit.hit("user:1", "3/min")
+            with self.assertRaises(ratelimit.RateLimited):
+                ratelimit.hit("user:1", "3/min")
+
+    def test_no_rate_means_unlimited(self):
+        for _ in range(100):
+            ratelimit.hit("user:1", "")
+
+    @override_settings(CHAT_MAX_CONCURRENT_PER_USER=2)
+    def test_in_flight_calls_are_capped(self):
+        ratelimit.acquire_slot("user:1")
+        ratelimit.acquire_slot("user:1")
+        with self.assertRaises(ratelimit.RateLimited):
+            ratelimit.acquire_slot("user:1")
+        ratelimit.release_slot("user:1")
+        ratelimit.acquire_slot("user:1")
+
+    @override_settings(CHAT_MAX_CONCURRENT_PER_USER=1)
+    async def test_streamed_response_holds_its_slot_until_sent(self):
+        async def events():
+            yield "data: hi"
+
+        await ratelimit.aacquire_slot("user:1")
+        response = ratelimit.areleasing(events(), "user:1")
+        with self.assertRaises(ratelimit.RateLimited):
+            await ratelimit.aacquire_slot("user:1")
+        self.assertEqual([event async for event in response], ["data: hi"])
+        await ratelimit.aacquire_slot("user:1")
+
+    def test_anonymous_callers_are_told_apart_behind_the_proxy(self):
+        request = RequestFactory().get("/", HTTP_X_FORWARDED_FOR="6.6.6.6, 1.2.3.4", REMOTE_ADDR="10.0.0.1")
+        self.assertEqual(ratelimit.identity(request), "ip:1.2.3.4")  # the address the router saw
+        with override_settings(RATE_LIMIT_TRUSTED_PROXIES=0), mock.patch("chat.ratelimit._warned_untrusted_proxy", False):
+            with self.assertLogs("chat.ratelimit", "WARNING"):
+                self.assertEqual(ratelimit.client_ip(request), "10.0.0.1")
+
+
+class SingleFlightTests(SimpleTestCase):
+    def _wait_for_calls(self, flight, calls):
+        for _ in range(500):
+            if flight.stats()["calls"] >= calls:
+                return
+            time.sleep(0.01)
+        self.fail("callers never joined the flight")
+
+    def test_concurrent_identical_calls_run_once(self):
+        flight, started, release = SingleFlight(), threading.Event(), threading.Event()
+        runs, results = [], []
+
+        def slow_call():
+            runs.append(1)
+            started.set()
+            release.wait(5)
+            return "reply"
+
+        threads = [threading.Thread(target=lambda: results.append(flight.do("key", slow_call))) for _ in range(4)]
+        threads[0].start()
+        started.wait(5)
+        for thread in threads[1:]:
+            thread.start()
+        self._wait_for_calls(flight, 4)
+        release.set()
+        for thread in threads:
+            thread.join(5)
+
+        self.assertEqual(runs, [1])
+        self.assertEqual(results, ["reply"] * 4)
+        self.assertEqual(flight.stats(), {"calls": 4, "collapsed": 3, "in_flight": 0})
+
+    def test_waiters_get_the_leaders_exception(self):
+        flight, started, release = SingleFlight(), threading.Event(), threading.Event()
+        errors = []
+
+        def failing_call():
+            started.set()
+            release.wait(5)
+            raise ValueError("upstream down")
+
+        def call():
+            try:
+                flight.do("key", failing_call)
+            except ValueError as e:
+                errors.append(str(e))
+
+        threads = [threading.Thread(target=call) for _ in range(2)]
+        threads[0].start()
+        started.wait(5)
+        threads[1].start()
+        self._wait_for_calls(flight, 2)
+        release.set()
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual(errors, ["upstream down"] * 2)
+
+    async def test_concurrent_identical_coroutines_run_once(self):
+        flight, runs = SingleFlight(), []
+
+        async def slow_call():
+            runs.append(1)
+            await asyncio.sleep(0.01)
+            return "reply"
+
+        results = await asyncio.gather(*(flight.ado("key", slow_call) for _ in range(3)))
+        self.assertEqual(results, ["reply"] * 3)
+        self.assertEqual(runs, [1])
+        self.assertEqual(await flight.ado("other", slow_call), "reply")
+
+
+TASK_CALLS = []
+
+
+def recording_task(value):
+    TASK_CALLS.append(value)
+
+
+def failing_task():
+    raise RuntimeError("boom")
+
+
+@override_settings(JOB_INLINE_WORKERS=0, JOB_RETRY_BASE_DELAY=5, JOB_RETRY_MAX_DELAY=60)
+class JobTests(TestCase):
+    def setUp(self):
+        TASK_CALLS.clear()
+
+    def test_claimed_job_runs_once(self):
+        job = jobs.enqueue("chat.tests.recording_task", {"value": 1})
+        claimed = jobs.claim_due(10)
+        self.assertEqual([j.pk for j in claimed], [job.pk])
+        self.assertEqual(jobs._claim([job.pk]), [])  # a second worker doesn't get it
+        self.assertTrue(jobs.run_job(claimed[0]))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.DONE, 1))
+        self.assertEqual(TASK_CALLS, [1])
+
+    def test_one_pending_job_per_key(self):
+        self.assertIsNotNone(jobs.enqueue("chat.tests.recording_task", {"value": 1}, key="k"))
+        self.assertIsNone(jobs.enqueue("chat.tests.recording_task", {"value": 2}, key="k"))
+        for job in jobs.claim_due(10):
+            jobs.run_job(job)
+        # Once it has run, the key can be queued again
+        self.assertIsNotNone(jobs.enqueue("chat.tests.recording_task", {"value": 3}, key="k"))
+
+    def test_delayed_job_is_not_due(self):
+        jobs.enqueue("chat.tests.recording_task", {"value": 1}, delay=60)
+        self.assertEqual(jobs.claim_due(10), [])
+
+    def test_failed_job_is_retried_after_backoff_then_given_up(self):
+        job = jobs.enqueue("chat.tests.failing_task", max_attempts=2)
+        self.assertFalse(jobs.run_job(jobs.claim_due(10)[0]))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.PENDING, 1))
+        self.assertIn("RuntimeError: boom", job.last_error)
+        self.assertGreater(job.run_after, timezone.now())
+        self.assertEqual(jobs.claim_due(10), [])  # not before the backoff has passed
+
+        Job.objects.filter(pk=job.pk).update(run_after=timezone.now() - timedelta(seconds=1))
+        self.assertFalse(jobs.run_job(jobs.claim_due(10)[0]))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.FAILED, 2))
+        self.assertEqual(jobs.claim_due(10), [])
+
+    def test_job_of_a_dead_worker_is_reclaimed(self):
+        job = jobs.enqueue("chat.tests.recording_task", {"value": 1})
+        jobs.claim_due(10)
+        Job.objects.filter(pk=job.pk).update(claimed_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual([j.pk for j in jobs.claim_due(10)], [job.pk])
+
+    @mock.patch("chat.jobs.random.uniform", return_value=1.0)
+    def test_backoff_doubles_up_to_the_cap(self, uniform):
+        self.assertEqual([jobs.backoff(attempt) for attempt in range(1, 6)], [5, 10, 20, 40, 60])
+
+
+@override_settings(TELEGRAM_INLINE_WORKERS=0, JOB_INLINE_WORKERS=0, TELEGRAM_COALESCE_WINDOW=0)
+@mock.patch("chat.telegram.close_old_connections")
+class TelegramTests(FakeLLMTestCase):
+    def test_redelivered_update_is_ignored(self, close_old_connections):
+        self.assertTrue(telegram.enqueue(1, 7, "hello"))
+        self.assertFalse(telegram.enqueue(1, 7, "hello"))
+        self.assertEqual(TelegramUpdate.objects.count(), 1)
+
+    def test_burst_is_answered_with_one_reply(self, close_old_connections):
+        for update_id, text in enumerate(["hi", "are you there", "?"], 1):
+            telegram.enqueue(update_id, 7, text)
+        telegram.enqueue(10, 8, "another chat")
+
+        with mock.patch("chat.telegram.cached_complete", wraps=telegram.cached_complete) as complete:
+            telegram.process_chat(7)
+
+        complete.assert_called_once()
+        self.assertEqual(complete.call_args.args[1][-2], {"role": "user", "content": "hi\nare you there\n?"})
+        self.assertEqual(
+            set(TelegramUpdate.objects.filter(chat_id=7).values_list("status", flat=True)), {TelegramUpdate.DONE}
+        )
+        self.assertEqual(TelegramUpdate.objects.get(chat_id=8).status, TelegramUpdate.PENDING)
+        self.assertEqual(
+            list(Job.objects.values_list("task", "kwargs")),
+            [(telegram.SEND_TASK, {"chat_id": 7, "text": "word0 word1 word2"})],
+        )
+        self.assertEqual(len(TelegramChat.objects.get(chat_id=7).history), 2)
+
+    @override_settings(TELEGRAM_MAX_ATTEMPTS=2)
+    def test_provider_outage_is_retried_not_answered(self, close_old_connections):
+        self.fake_llm.error_rate = 1
+        telegram.enqueue(1, 7, "hi")
+
+        telegram.process_chat(7)
+        update = TelegramUpdate.objects.get()
+        self.assertEqual((update.status, update.attempts), (TelegramUpdate.PENDING, 1))
+        self.assertEqual(TelegramChat.objects.get(chat_id=7).history, [])
+        self.assertFalse(Job.objects.exists())  # no error text is sent to the user
+
+        TelegramUpdate.objects.update(claimed_at=timezone.now() - timedelta(hours=1))
+        providers._registry = None  # past the cooldown
+        telegram.process_chat(7)
+        update.refresh_from_db()
+        self.assertEqual((update.status, update.attempts), (TelegramUpdate.FAILED, 2))
+        self.assertFalse(Job.objects.exists())
+
+
+class ExportImportTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user("owner", "owner@example.com", "pw")
+        for texts in (["hello", "hi, how can I help?"], ["pancake recipe", "flour, eggs, milk"]):
+            conversation = Conversation.objects.create(user=self.owner)
+            for sender, text in zip(["user", "bot"], texts):
+                Message.objects.create(conversation=conversation, sender=sender, content=text)
+        self.other = User.objects.create_user("other", "other@example.com", "pw")
+
+    def _history(self, user):
+        return [
+            list(conversation.messages.order_by("id").values_list("sender", "content"))
+            for conversation in Conversation.objects.filter(user=user).order_by("id")
+        ]
+
+    def test_round_trip(self):
+        lines = list(exports.export_lines(self.owner.id, chunk_size=1))
+        self.assertEqual(exports.import_lines(self.other, [line.encode() for line in lines]), (2, 4))
+        self.assertEqual(self._history(self.other), self._history(self.owner))
+
+    async def test_async_export_matches(self):
+        lines = [line async for line in exports.aexport_lines(self.owner.id, chunk_size=1)]
+        self.assertEqual(lines, await sync_to_async(list)(exports.export_lines(self.owner.id)))
+
+    def test_malformed_line_rolls_back(self):
+        lines = list(exports.export_lines(self.owner.id)) + ["{not json"]
+        with self.assertRaises(exports.InvalidExport):
+            exports.import_lines(self.other, lines)
+        self.assertFalse(Conversation.objects.filter(user=self.other).exists())
+
+    def test_import_is_capped(self):
+        lines = list(exports.export_lines(self.owner.id))
+        with self.assertRaises(exports.ImportTooLarge):
+            exports.import_lines(self.other, lines, max_lines=len(lines) - 1)
+        self.assertFalse(Conversation.objects.filter(user=self.other).exists())
+
+    @override_settings(CHAT_IMPORT_MAX_BYTES=100)
+    def test_oversized_upload_is_refused(self):
+        token = Token.objects.create(user=self.other)
+        response = self.client.post(
+            "/api/import-conversations/", "".join(exports.export_lines(self.owner.id)),
+            content_type="application/x-ndjson", headers={"Authorization": f"Token {token.key}"},
+        )
+        self.assertEqual(response.status_code, 413)
+
+    def test_non_numeric_content_length_is_refused(self):
+        token = Token.objects.create(user=self.other)
+        response = self.client.post(
+            "/api/import-conversations/", "", content_type="application/x-ndjson", CONTENT_LENGTH="lots",
+            headers={"Authorization": f"Token {token.key}"},
+        )
+        self.assertEqual(response.status_code, 400)
+
+    async def test_export_streams_under_asgi(self):
+        token = await Token.objects.acreate(user=self.owner)
+        response = await self.async_client.get(
+            "/api/export-conversations/", headers={"Authorization": f"Token {token.key}"}
+        )
+        self.assertTrue(response.is_async)
+        lines = [line async for line in response.streaming_content]
+        self.assertEqual(b"".join(lines).decode(), "".join(await sync_to_async(list)(exports.export_lines(self.owner.id))))
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("a", "a@example.com", "pw")
+        conversation = Conversation.objects.create(user=self.user)
+        for text in ["how do I make pancakes", "mix flour and milk, then fry", "pancakes with maple syrup are best"]:
+            Message.objects.create(conversation=conversation, sender="user", content=text)
+        stranger = User.objects.create_user("b", "b@example.com", "pw")
+        Message.objects.create(
+            conversation=Conversation.objects.create(user=stranger), sender="user", content="pancakes for dinner"
+        )
+
+    def test_finds_own_messages_with_highlighted_snippets(self):
+        hits = search.search_messages(self.user.id, "pancakes", limit=10)
+        self.assertEqual(len(hits), 2)
+        for hit in hits:
+            self.assertIn(f"{search.HIGHLIGHT}pancakes{search.HIGHLIGHT}", hit["snippet"])
+
+    def test_all_terms_must_match(self):
+        hits = search.search_messages(self.user.id, "maple pancakes", limit=10)
+        self.assertEqual([hit["snippet"].count(search.HIGHLIGHT) for hit in hits], [4])
+
+    def test_query_syntax_is_treated_as_words(self):
+        self.assertEqual(search.search_messages(self.user.id, 'pancakes OR "', limit=10), [])
+        self.assertEqual(search.search_messages(self.user.id, "***", limit=10), [])
+
+    def test_paging(self):
+        first = search.search_messages(self.user.id, "pancakes", limit=1)
+        second = search.search_messages(self.user.id, "pancakes", limit=1, offset=1)
+        self.assertNotEqual(first[0]["id"], second[0]["id"])
+
+
+class MetricsTests(TestCase):
+    def test_closed_without_a_configured_token(self):
+        with override_settings(METRICS_TOKEN=""):
+            self.assertEqual(self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer ").status_code, 403)
+
+    @override_settings(METRICS_TOKEN="s3cret")
+    def test_bearer_token_required(self):
+        self.assertEqual(self.client.get("/metrics").status_code, 403)
+        self.assertEqual(self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer wrong").status_code, 403)
+        response = self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer s3cret")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b"chat_response_cache_total", response.content)
+
+
+class RetentionTests(TestCase):
+    def setUp(self):
+        user = User.objects.create_user("a", "a@example.com", "pw")
+        self.old, self.recent = Conversation.objects.create(user=user), Conversation.objects.create(user=user)
+        for conversation in (self.old, self.recent):
+            for text in ["hi", "hello", "bye"]:
+                Message.objects.create(conversation=conversation, sender="user", content=text)
+        long_ago = timezone.now() - timedelta(days=100)
+        Conversation.objects.filter(pk=self.old.pk).update(started_at=long_ago)
+        Message.objects.filter(conversation=self.old).update(timestamp=long_ago)
+
+    def test_messages_are_deleted_once(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(retention.delete_conversations([self.old.pk]), 3)
+        deletes = [q["sql"] for q in queries.captured_queries if q["sql"].startswith('DELETE FROM "chat_message"')]
+        self.assertEqual(len(deletes), 1)
+        self.assertFalse(Conversation.objects.filter(pk=self.old.pk).exists())
+
+    def test_purge_keeps_active_conversations(self):
+        self.assertEqual(retention.purge_old_conversations(30, dry_run=True), (1, 3))
+        self.assertEqual(retention.purge_old_conversations(30, chunk_size=2), (1, 3))
+        self.assertEqual(list(Conversation.objects.values_list("pk", flat=True)), [self.recent.pk])
+        self.assertEqual(Message.objects.count(), 3)
+
+
+class APIMiddlewareTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("a", "a@example.com", "pw")
+        self.headers = {"Authorization": f"Token {Token.objects.create(user=self.user).key}"}
+
+    def test_api_requests_skip_the_session_stack(self):
+        response = self.client.get("/api/get-conversations/", headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(hasattr(response.wsgi_request, "session"))
+        self.assertEqual(response["X-Content-Type-Options"], "nosniff")  # API_MIDDLEWARE still runs
+        self.assertIn("chat.middleware.APIMiddlewareRouter", settings.MIDDLEWARE)
+
+    async def test_api_requests_skip_the_session_stack_under_asgi(self):
+        response = await self.async_client.get("/api/get-conversations/", headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(hasattr(response.asgi_request, "session"))
+
+    def test_auth_and_admin_keep_the_full_stack(self):
+        for path in ["/api/auth/user/", "/admin/login/"]:
+            with self.subTest(path=path):
+                self.assertTrue(hasattr(self.client.get(path, headers=self.headers).wsgi_request, "session"))
+
+
+def sse_events(content: bytes) -> list:
+    return [json.loads(line[len("data: "):]) for line in content.decode().split("\n\n") if line]
+
+
+class ChatViewTests(FakeLLMTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user("a", "a@example.com", "pw")
+        self.headers = {"Authorization": f"Token {Token.objects.create(user=self.user).key}"}
+        self.conversation = Conversation.objects.create(user=self.user)
+
+    def _chat(self, path="/api/chat/", **data):
+        data = {"conversation_id": self.conversation.pk, **data}
+        return self.client.post(path, data, "application/json", headers=self.headers)
+
+    def test_streamed_reply_is_sent_as_events_and_saved(self):
+        response = self._chat(message="hi", stream=True)
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        events = sse_events(b"".join(response.streaming_content))
+        self.assertEqual("".join(event["delta"] for event in events[:-1]).strip(), "word0 word1 word2")
+        self.assertEqual(events[-1], {"reply": "word0 word1 word2", "done": True})
+        self.assertEqual(
+            list(self.conversation.messages.order_by("id").values_list("sender", "content")),
+            [("user", "hi"), ("bot", "word0 word1 word2")],
+        )
+
+    def test_failed_stream_ends_with_an_error_event_and_saves_nothing(self):
+        self.fake_llm.error_rate = 1
+        events = sse_events(b"".join(self._chat(message="hi", stream=True).streaming_content))
+        self.assertEqual(events[-1]["error"], "LLM provider error")
+        self.assertFalse(self.conversation.messages.exists())
+
+    async def _async_chat(self, view, body, **headers):
+        request = AsyncRequestFactory().post("/", body, "application/json", headers=headers)
+        return await view.as_view()(request)
+
+    async def test_async_view_replies_and_saves_the_turn(self):
+        body = {"conversation_id": self.conversation.pk, "message": "hi"}
+        response = await self._async_chat(AsyncChatAPIView, body, **self.headers)
+        self.assertEqual(json.loads(response.content), {"reply": "word0 word1 word2"})
+        self.assertEqual(await self.conversation.messages.acount(), 2)
+
+    async def test_async_view_rejects_bad_requests(self):
+        self.assertEqual((await self._async_chat(AsyncChatAPIView, {"message": "hi"})).status_code, 401)
+        self.assertEqual((await self._async_chat(AsyncGroqChatAPIView, ["hi"])).status_code, 400)
+        response = await self._async_chat(AsyncChatAPIView, {"message": "hi"}, **self.headers)
+        self.assertEqual(json.loads(response.content), {"error": "Missing message or conversation_id"})
+
+
+class ProviderFailoverTests(FakeLLMTestCase):
+    def setUp(self):
+        super().setUp()
+        url = settings.LLM_PROVIDERS["groq-llama3-8b"]["url"]
+        self.down = providers.Provider("down", "http://127.0.0.1:1/v1/chat/completions", "m", "NO_KEY")
+        self.up = providers.Provider("up", url, "m", "NO_KEY")
+        self.registry = providers.ProviderRegistry([self.down, self.up], {"route": ["down", "up"]})
+
+    @override_settings(LLM_MIN_SAMPLES=2)
+    def test_fails_over_and_demotes_the_failing_provider(self):
+        for _ in range(2):
+            self.assertEqual(self.registry.complete("route", [{"role": "user", "content": "hi"}]), "word0 word1 word2")
+        stats = self.registry.stats()
+        self.assertEqual((stats["down"]["samples"], stats["down"]["error_rate"]), (2, 1.0))
+        self.assertEqual((stats["up"]["samples"], stats["up"]["error_rate"]), (2, 0.0))
+        self.assertEqual(self.registry.candidates("route"), [self.up, self.down])
+
+    def test_route_outage_is_a_provider_error(self):
+        self.fake_llm.error_rate = 1
+        with self.assertRaises(providers.ProviderError) as raised:
+            self.registry.complete("route", [{"role": "user", "content": "hi"}])
+        self.assertEqual(raised.exception.status_code, 503)
+
+
+class HTTPClientTests(SimpleTestCase):
+    def test_one_pooled_client_per_process_and_event_loop(self):
+        self.assertIs(http_clients.get_client(), http_clients.get_client())
+
+        async def clients():
+            return http_clients.get_async_client(), http_clients.get_async_client()
+
+        first, again = asyncio.run(clients())
+        self.assertIs(first, again)
+        self.assertIsNot(asyncio.run(clients())[0], first)  # a pool is bound to the loop that opened it
+
+
+@override_settings(CHAT_CONTEXT_TOKEN_BUDGET=50)  # a 4-token system prompt and three 14-token messages
+class ContextWindowTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.conversation = Conversation.objects.create(user=User.objects.create_user("a", "a@example.com", "pw"))
+        self.messages = [self._add(i) for i in range(5)]
+
+    def _add(self, i):
+        sender = "user" if i % 2 == 0 else "bot"
+        return Message.objects.create(conversation=self.conversation, sender=sender, content=f"{i}".ljust(40, "."))
+
+    def _window(self):
+        return [m["content"][0] for m in context.build_messages(self.conversation, "sys")[1:]]
+
+    def test_oldest_turns_are_dropped_to_fit_the_budget(self):
+        messages = context.build_messages(self.conversation, "sys")
+        self.assertEqual(messages[0], {"role": "system", "content": "sys"})
+        self.assertEqual([m["role"] for m in messages[1:]], ["user", "assistant", "user"])
+        self.assertEqual(self._window(), ["2", "3", "4"])
+
+    def test_cached_window_only_reads_new_rows(self):
+        self._window()
+        self._add(5)
+        with self.assertNumQueries(1):
+            self.assertEqual(self._window(), ["3", "4", "5"])
+
+    def test_summarised_messages_are_replaced_by_the_summary(self):
+        self._window()  # cached before the summary was written
+        self.conversation.summary, self.conversation.summarized_upto = "earlier", self.messages[3].pk
+        messages = context.build_messages(self.conversation, "sys")
+        self.assertIn("earlier", messages[1]["content"])
+        self.assertEqual([m["content"][0] for m in messages[2:]], ["4"])
+
+
+@override_settings(
+    JOB_INLINE_WORKERS=0, CHAT_SUMMARY_TRIGGER_TOKENS=20, CHAT_SUMMARY_KEEP_RECENT=2, CHAT_SUMMARY_MAX_BATCH=3
+)
+class SummaryTests(FakeLLMTestCase):
+    def setUp(self):
+        super().setUp()
+        self.conversation = Conversation.objects.create(user=User.objects.create_user("a", "a@example.com", "pw"))
+
+    def _add(self, count):
+        return [
+            Message.objects.create(conversation=self.conversation, sender="user", content=f"message {i}".ljust(40, "."))
+            for i in range(count)
+        ]
+
+    def test_long_conversation_queues_one_summary_job(self):
+        self._add(6)
+        context.build_messages(self.conversation, "sys")
+        summaries.schedule_if_needed(self.conversation.pk)
+        summaries.schedule_if_needed(self.conversation.pk)
+        self.assertEqual(list(Job.objects.values_list("task", flat=True)), [summaries.TASK])
+
+    def test_nothing_to_fold_queues_nothing(self):
+        self._add(2)  # over the trigger, but both are kept verbatim
+        context.build_messages(self.conversation, "sys")
+        summaries.schedule_if_needed(self.conversation.pk)
+        self.assertFalse(Job.objects.exists())
+
+    def test_older_messages_are_folded_in_batches(self):
+        messages = self._add(6)
+        with mock.patch("chat.summaries.providers.complete", wraps=providers.complete) as complete:
+            summaries.summarize(self.conversation.pk)
+        self.assertEqual(complete.call_count, 2)
+        self.conversation.refresh_from_db()
+        self.assertEqual(self.conversation.summary, "word0 word1 word2")
+        self.assertEqual(self.conversation.summarized_upto, messages[3].pk)
+        window = context.build_messages(self.conversation, "sys")
+        self.assertEqual([m["content"] for m in window[2:]], [m.content for m in messages[4:]])
+
+
+class ResponseCacheTests(FakeLLMTestCase):
+    def _ask(self, text, template="v1"):
+        messages = prompts.with_time_context([{"role": "system", "content": "sys"}, {"role": "user", "content": text}])
+        return response_cache.cached_complete("groq-8b", messages, template)
+
+    def test_repeated_prompt_is_served_from_the_cache(self):
+        with mock.patch("chat.response_cache.providers.complete", wraps=providers.complete) as complete:
+            self.assertEqual(self._ask("Tell me a joke"), "word0 word1 word2")
+            self.assertEqual(self._ask("  tell me   a JOKE "), "word0 word1 word2")  # same after normalising
+            self.assertEqual(complete.call_count, 1)
+            self._ask("Tell me a joke", template="v2")  # a new prompt template invalidates old replies
+            self.assertEqual(complete.call_count, 2)
+
+    def test_time_questions_bypass_the_cache(self):
+        with mock.patch("chat.response_cache.providers.complete", wraps=providers.complete) as complete:
+            self._ask("what time is it")
+            self._ask("what time is it")
+        self.assertEqual(complete.call_count, 2)
+
+
+class ConversationListTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("a", "a@example.com", "pw")
+        self.client.defaults["HTTP_AUTHORIZATION"] = f"Token {Token.objects.create(user=self.user).key}"
+        self.conversations = [Conversation.objects.create(user=self.user) for _ in range(3)]
+        Conversation.objects.create(user=User.objects.create_user("b", "b@example.com", "pw"))
+
+    def test_pages_follow_the_cursor(self):
+        first = self.client.get("/api/get-conversations/", {"page_size": 2}).json()
+        self.assertEqual([c["id"] for c in first["results"]], [c.pk for c in self.conversations[:0:-1]])
+        second = self.client.get(first["next"]).json()
+        self.assertEqual([c["id"] for c in second["results"]], [self.conversations[0].pk])
+        self.assertIsNone(second["next"])
+
+    def test_plain_list_without_page_parameters(self):
+        response = self.client.get("/api/get-conversations/").json()
+        self.assertEqual([c["id"] for c in response], [c.pk for c in reversed(self.conversations)])
+
+    def test_messages_are_paged_oldest_first(self):
+        conversation = self.conversations[0]
+        for text in ["one", "two", "three"]:
+            Message.objects.create(conversation=conversation, sender="user", content=text)
+        url = f"/api/get-messages/{conversation.pk}/"
+        first = self.client.get(url, {"page_size": 2}).json()
+        self.assertEqual([m["content"] for m in first["results"]], ["one", "two"])
+        self.assertEqual([m["content"] for m in self.client.get(first["next"]).json()["results"]], ["three"])
+
+    def test_each_conversation_carries_its_latest_message(self):
+        conversation = self.conversations[0]
+        Message.objects.create(conversation=conversation, sender="user", content="hi")
+        latest = Message.objects.create(conversation=conversation, sender="bot", content="x" * 200)
+        rows = {c["id"]: c for c in self.client.get("/api/get-conversations/").json()}
+
+        row = rows[conversation.pk]
+        self.assertEqual((row["message_count"], row["last_sender"]), (2, "bot"))
+        self.assertEqual(row["last_message"], "x" * views.PREVIEW_LENGTH)
+        self.assertEqual(parse_datetime(row["last_activity"]), latest.timestamp)
+        empty = rows[self.conversations[1].pk]
+        self.assertEqual((empty["message_count"], empty["last_message"]), (0, None))
+        self.assertEqual(empty["last_activity"], empty["started_at"])
+
+    def test_query_count_does_not_grow_with_the_list(self):
+        self.client.get("/api/get-conversations/")  # caches the token
+        with CaptureQueriesContext(connection) as few:
+            self.client.get("/api/get-conversations/")
+        for conversation in [Conversation.objects.create(user=self.user) for _ in range(5)]:
+            Message.objects.create(conversation=conversation, sender="user", content="hi")
+        with self.assertNumQueries(len(few)):
+            self.client.get("/api/get-conversations/")
+
+
+@override_settings(CHAT_WRITE_BEHIND=True)
+class WriteBehindTests(TransactionTestCase):  # foreign keys are checked on insert, not at the end of the test
+    def setUp(self):
+        cache.clear()
+        user = User.objects.create_user("a", "a@example.com", "pw")
+        self.conversation, self.other = Conversation.objects.create(user=user), Conversation.objects.create(user=user)
+        # Flushed by hand: the background thread exits straight away
+        self.buffer = persistence.WriteBehindBuffer(max_batch=100, interval=3600)
+        self.buffer._run = lambda: None
+        patcher = mock.patch("chat.persistence._buffer", self.buffer)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_turns_are_buffered_until_the_conversation_is_read(self):
+        persistence.save_turn(self.conversation.pk, "hi", "hello")
+        persistence.save_turn(self.other.pk, "bye", "see you")
+        self.assertFalse(Message.objects.exists())
+
+        messages = context.build_messages(self.conversation, "sys")
+        self.assertEqual([m["content"] for m in messages[1:]], ["hi", "hello"])
+        self.assertEqual(Message.objects.count(), 4)  # one flush writes every buffered turn
+
+    def test_a_failing_conversation_does_not_drop_the_others(self):
+        persistence.save_turn(self.conversation.pk, "hi", "hello")
+        persistence.save_turn(self.other.pk, "bye", "see you")
+        Conversation.objects.filter(pk=self.other.pk).delete()  # deleted while its turn was buffered
+        with self.assertLogs("chat.persistence", "ERROR"):
+            self.buffer.flush()
+        self.assertEqual(list(Message.objects.values_list("conversation_id", flat=True)), [self.conversation.pk] * 2)
+
+
+class TokenCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user("a", "a@example.com", "pw")
+        self.client.defaults["HTTP_AUTHORIZATION"] = f"Token {Token.objects.create(user=self.user).key}"
+
+    def _status(self):
+        return self.client.get("/api/get-conversations/").status_code
+
+    def test_cached_token_needs_no_query(self):
+        self.assertEqual(self._status(), 200)
+        with self.assertNumQueries(1):  # the conversation list only
+            self.assertEqual(self._status(), 200)
+
+    def test_logout_revokes_the_cached_token(self):
+        self.assertEqual(self._status(), 200)
+        self.assertEqual(self.client.post("/api/auth/logout/").status_code, 200)
+        self.assertEqual(self._status(), 401)
+
+    def test_deactivation_revokes_the_cached_token(self):
+        self.assertEqual(self._status(), 200)
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self._status(), 401)
+
+
+class EmailLoginTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("alice", "Alice@Example.com", "pw")
+
+    def test_email_login_ignores_case(self):
+        self.assertEqual(authenticate(email="alice@example.COM", password="pw"), self.user)
+        self.assertIsNone(authenticate(email="alice@example.com", password="wrong"))
+        self.assertIsNone(authenticate(email="bob@example.com", password="pw"))
+        self.assertEqual(authenticate(username="alice", password="pw"), self.user)  # the admin login
+
+    def test_lookup_uses_the_unique_index(self):
+        self.assertIs(email_index.is_unique(), True)
+        self.assertIn(email_index.INDEX, backends.users_by_email("alice@example.com").explain())
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            User.objects.create_user("alice2", "ALICE@example.com", "pw")
+        User.objects.create_user("nomail1", "", "pw")
+        User.objects.create_user("nomail2", "", "pw")  # blank addresses aren't indexed
@@ -0,0 +1,101 @@
+"""
+One chat turn, shared by the DRF views (chat/views.py) and their async
+twins (chat/async_views.py): request validation, building the prompt,
+completing it, saving the turn and mapping errors to a response body.
+The views only add their framework's response class and rate limiting.
+"""
+import logging
+
+from django.shortcuts import aget_object_or_404, get_object_or_404
+
+from chat import context, metrics, persistence, prompts, providers, summaries
+from chat.providers import ProviderError
+from chat.response_cache import acached_complete, cached_complete
+from .models import Conversation
+
+logger = logging.getLogger(__name__)
+
+
+class InvalidTurn(ValueError):
+    pass
+
+
+def parse(data, conversation_required=False):
+    """Return ``(user_message, conversation_id)`` from a request body; raises ``InvalidTurn``."""
+    if not isinstance(data, dict):
+        raise InvalidTurn("Expected a JSON object")
+    user_message = data.get("message", "")
+    conversation_id = data.get("conversation_id")
+    if conversation_required and (not user_message or not conversation_id):
+        raise InvalidTurn("Missing message or conversation_id")
+    if not user_message:
+        raise InvalidTurn("No message provided")
+    return user_message, conversation_id
+
+
+def get_conversation(conversation_id, user_pk):
+    """The caller's conversation, None without an id; raises ``Http404``."""
+    if not conversation_id:
+        return None
+    # pk rather than the user object so anonymous callers simply miss (404)
+    with metrics.timed("db_read"):
+        return get_object_or_404(Conversation, id=conversation_id, user=user_pk)
+
+
+async def aget_conversation(conversation_id, user_pk):
+    if not conversation_id:
+        return None
+    with metrics.timed("db_read"):
+        return await aget_object_or_404(Conversation, id=conversation_id, user=user_pk)
+
+
+def build_messages(conversation, data, user_message):
+    # Context comes from the stored turns when there is a conversation, from the client otherwise
+    if conversation is not None:
+        messages = context.build_messages(conversation, prompts.ASSISTANT.text, pending_user_message=user_message)
+    else:
+        messages = context.messages_from_history(prompts.ASSISTANT.text, data.get("history", []), user_message)
+    return prompts.with_time_context(messages)
+
+
+async def abuild_messages(conversation, data, user_message):
+    if conversation is not None:
+        messages = await context.abuild_messages(conversation, prompts.ASSISTANT.text, pending_user_message=user_message)
+    else:
+        messages = context.messages_from_history(prompts.ASSISTANT.text, data.get("history", []), user_message)
+    return prompts.with_time_context(messages)
+
+
+def complete(route, messages, conversation):
+    if conversation is None:
+        # Stateless (anonymous) chats repeat the same short prompts a lot
+        return cached_complete(route, messages, prompts.ASSISTANT.version)
+    return providers.complete(route, messages)
+
+
+async def acomplete(route, messages, conversation):
+    if conversation is None:
+        return await acached_complete(route, messages, prompts.ASSISTANT.version)
+    return await providers.acomplete(route, messages)
+
+
+def save_turn(conversation, user_message, reply):
+    """Persist the turn and queue a summary if needed; stateless chats aren't stored."""
+    if conversation is not None:
+        persistence.save_turn(conversation.id, user_message, reply)
+        summaries.schedule_if_needed(conversation.id)
+
+
+async def asave_turn(conversation, user_message, reply):
+    if conversation is not None:
+        await persistence.asave_turn(conversation.id, user_message, reply)
+        await summaries.aschedule_if_needed(conversation.id)
+
+
+def error_response(e, log_prefix=""):
+    """Log a failed completion and return ``(body, status, headers)`` for it."""
+    if isinstance(e, ProviderError):
+        logger.error(f"{log_prefix}❌ Provider error: {str(e)}")
+        return {"error": "LLM provider error", "details": str(e)}, e.status_code, e.headers()
+    logger.error(f"{log_prefix}❌ General error: {str(e)}")
+    return {"error": "Internal Server Error", "details": str(e)}, 500, None
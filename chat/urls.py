@@ -1,11 +1,24 @@
+from django.conf import settings
 from django.urls import path, include
 from .views import ChatAPIView, GroqChatAPIView, GroqChatTwoAPIView, TelegramBotAPIView, GoogleLogin, start_conversation, get_conversations, get_messages
 from . import views
 
+if settings.CHAT_ASYNC_VIEWS:
+    # Served under ASGI (uvicorn workers) so in-flight LLM calls don't pin a worker each
+    from .async_views import (
+        AsyncChatAPIView as ChatAPIView,
+        AsyncGroqChatAPIView as GroqChatAPIView,
+        AsyncGroqChatTwoAPIView as GroqChatTwoAPIView,
+        AsyncTelegramBotAPIView as TelegramBotAPIView,
+    )
+
 urlpatterns = [
     path("start-conversation/", views.start_conversation),
     path("get-conversations/", views.get_conversations),
     path("get-messages/<int:conversation_id>/", views.get_messages),
+    path("search-messages/", views.search_messages),
+    path("export-conversations/", views.export_conversations),
+    path("import-conversations/", views.import_conversations),
     path("delete-conversation/<int:conversation_id>/", views.delete_conversation),
     path("chat/", ChatAPIView.as_view(), name="chat"),
     path("groq-chat/", GroqChatAPIView.as_view(), name="groq_chat"),  # NEW
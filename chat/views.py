@@ -1,23 +1,24 @@
-import os
 import logging
-import httpx
 from dotenv import load_dotenv
 from rest_framework.views import APIView
 from rest_framework.response import Response
 
 # telegram related imports
 import json
-import requests
 from rest_framework.permissions import AllowAny
-from chat.groq_ai import get_groq_reply
-import pytz
-from datetime import datetime
+from chat import exports, providers, ratelimit, retention, search, telegram, turns
+from chat.pagination import ConversationCursorPagination, MessageCursorPagination, SearchPagination, wants_pagination
+from chat.ratelimit import ChatRateThrottle
+from chat.streaming import sse_response, stream_reply
 
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from .models import Conversation, Message
-from django.shortcuts import get_object_or_404
+from django.conf import settings
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Substr
+from django.http import Http404, StreamingHttpResponse
 from django.utils.timesince import timesince
 
 from allauth.socialaccount.providers.google.views import GoogleOAuth2Adapter
@@ -32,6 +33,8 @@ load_dotenv()
 
 logger = logging.getLogger(__name__)
 
+PREVIEW_LENGTH = 120  # characters of the last message shown in the conversation list
+
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def start_conversation(request):
@@ -41,226 +44,151 @@ def start_conversation(request):
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def get_conversations(request):
-    convs = Conversation.objects.filter(user=request.user).order_by('-started_at')
-    data = []
-    for c in convs:
-        started_display = c.started_at.strftime("%b %d, %Y %I:%M %p")  # Example: Jul 05, 2025 10:23 AM
-        data.append({
-            "id": c.id,
-            "started_at": c.started_at,
-            "title": f"Chat - {started_display}"
-        })
-    return Response(data)
+    paginator = ConversationCursorPagination()
+    # Correlated subqueries (not a JOIN + GROUP BY) so only the rows on the page are aggregated
+    conv_messages = Message.objects.filter(conversation=OuterRef("pk"))
+    latest = conv_messages.order_by("-timestamp", "-id")
+    convs = Conversation.objects.filter(user=request.user).annotate(
+        message_count=Coalesce(
+            Subquery(conv_messages.order_by().values("conversation").annotate(n=Count("id")).values("n")), 0
+        ),
+        last_activity=Coalesce(Subquery(latest.values("timestamp")[:1]), F("started_at")),
+        last_message=Subquery(latest.annotate(snippet=Substr("content", 1, PREVIEW_LENGTH)).values("snippet")[:1]),
+        last_sender=Subquery(latest.values("sender")[:1]),
+    ).values("id", "started_at", "message_count", "last_activity", "last_message", "last_sender")
+    paginated = wants_pagination(request)
+    page = paginator.paginate_queryset(convs, request) if paginated else convs.order_by(*paginator.ordering)
+    data = [
+        {
+            "id": c["id"],
+            "started_at": c["started_at"],
+            "title": f"Chat - {c['started_at'].strftime('%b %d, %Y %I:%M %p')}",  # Example: Jul 05, 2025 10:23 AM
+            "message_count": c["message_count"],
+            "last_activity": c["last_activity"],
+            "last_message": c["last_message"],
+            "last_sender": c["last_sender"],
+        }
+        for c in page
+    ]
+    return paginator.get_paginated_response(data) if paginated else Response(data)
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def get_messages(request, conversation_id):
-    conv = get_object_or_404(Conversation, id=conversation_id, user=request.user)
-    msgs = conv.messages.order_by('timestamp')
-    data = [{"sender": m.sender, "content": m.content, "timestamp": m.timestamp} for m in msgs]
-    return Response(data)
+    if not Conversation.objects.filter(id=conversation_id, user=request.user).exists():
+        raise Http404
+    paginator = MessageCursorPagination()
+    msgs = Message.objects.filter(conversation_id=conversation_id).values("sender", "content", "timestamp")
+    if wants_pagination(request):
+        return paginator.get_paginated_response(list(paginator.paginate_queryset(msgs, request)))
+    return Response(list(msgs.order_by(*paginator.ordering)))
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def search_messages(request):
+    query = request.query_params.get("q", "").strip()
+    if not query:
+        return Response({"error": "Missing search query"}, status=400)
+    paginator = SearchPagination()
+    hits = paginator.paginate_hits(
+        lambda limit, offset: search.search_messages(request.user.id, query, limit, offset), request
+    )
+    return paginator.get_paginated_response(hits)
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def export_conversations(request):
+    # Streamed straight from the DB cursors; the export is never held in memory. Under ASGI the
+    # response must be an async iterator, or Django collects a sync one into a list first
+    if request.META.get("wsgi.input") is None:  # only WSGI requests carry the WSGI environ
+        lines = exports.aexport_lines(request.user.id)
+    else:
+        lines = exports.export_lines(request.user.id)
+    response = StreamingHttpResponse(lines, content_type="application/x-ndjson")
+    response["Content-Disposition"] = 'attachment; filename="conversations.ndjson"'
+    return response
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def import_conversations(request):
+    # Read the body line by line rather than through request.data
+    max_bytes = settings.CHAT_IMPORT_MAX_BYTES
+    try:
+        content_length = int(request.META.get("CONTENT_LENGTH") or 0)
+    except ValueError:
+        return Response({"error": "Invalid Content-Length"}, status=400)
+    if content_length > max_bytes:
+        return Response({"error": "Import too large", "details": f"more than {max_bytes} bytes"}, status=413)
+    try:
+        conversations, messages = exports.import_lines(
+            request.user, request.stream or [], max_lines=settings.CHAT_IMPORT_MAX_LINES, max_bytes=max_bytes
+        )
+    except exports.ImportTooLarge as e:
+        return Response({"error": "Import too large", "details": str(e)}, status=413)
+    except exports.InvalidExport as e:
+        return Response({"error": "Invalid export", "details": str(e)}, status=400)
+    return Response({"conversations": conversations, "messages": messages}, status=201)
 
 @api_view(['DELETE'])
 @permission_classes([IsAuthenticated])
 def delete_conversation(request, conversation_id):
-    conversation = get_object_or_404(Conversation, id=conversation_id, user=request.user)
-    conversation.delete()
+    if not Conversation.objects.filter(id=conversation_id, user=request.user).exists():
+        raise Http404
+    # Plain DELETEs; the messages are never loaded
+    retention.delete_conversations([conversation_id])
     return Response({"message": "Conversation deleted successfully"})
 
 
 
 class ChatAPIView(APIView):
     permission_classes = [IsAuthenticated]
+    throttle_classes = [ChatRateThrottle]
+    route = "openrouter"
+    conversation_required = True
+    log_prefix = ""
 
     def post(self, request):
-        user_message = request.data.get("message", "")
-        conversation_id = request.data.get("conversation_id")
-        history = request.data.get("history", [])
-        if not user_message or not conversation_id:
-            return Response({"error": "Missing message or conversation_id"}, status=400)
-            # return Response({"error": "No message provided"}, status=400)
-        conversation = get_object_or_404(Conversation, id=conversation_id, user=request.user)
-        Message.objects.create(
-            conversation=conversation,
-            sender="user",
-            content=user_message
-        )
-
-        logger.info(f"User message: {user_message}")
-
-
-        # Get current time in Pakistan timezone
-        pakistan_time = datetime.now(pytz.timezone('Asia/Karachi'))
-        formatted_time = pakistan_time.strftime("%Y-%m-%d %H:%M:%S")
-
-        system_prompt = (
-            f"You are a friendly and helpful assistant. "
-            f"The current exact timestamp in Pakistan (Asia/Karachi) is: {formatted_time}. "
-            f"Only mention the time or date when the user directly asks about it. "
-            f"- Do NOT include the time/date in general greetings or unrelated responses. "
-            f"- When the user asks about the time or date, respond naturally using the provided timestamp. "
-            f"- For time, respond like: 'It's 2:30 PM in Pakistan!' "
-            f"- For dates, use formats like 'June 23, 2025' or 'Monday, June 23rd'. "
-            f"- If the user asks for **both date and time**, respond like: "
-            f"  'It's 2:30 PM on June 23, 2025 in Pakistan.' "
-            f"- NEVER say you lack real-time access. "
-            f"Examples: "
-            f"1. User: 'What time is it?' → 'It's 2:08 PM in Pakistan!' "
-            f"2. User: 'What's today's date?' → 'Today is June 23, 2025.' "
-            f"3. User: 'What's the current date and time in Pakistan?' → 'It's 2:30 PM on June 23, 2025 in Pakistan.' "
-            f"4. User: 'Hey' → 'Hello! How can I help you today?' (❌ Do NOT mention time here)"
-        )
-        
-        full_messages = [{"role": "system", "content": system_prompt}] + history
-        headers = {
-            "Authorization": f"Bearer {os.getenv('OPENROUTER_API_KEY')}",
-            "HTTP-Referer": "http://localhost",  # optional
-            "X-Title": "ReactChatWithOpenRouter"
-        }
-
-        json_data = {
-            "model": "deepseek/deepseek-r1-distill-llama-70b:free",
-            "messages": full_messages
-        }
-
         try:
-            response = httpx.post("https://openrouter.ai/api/v1/chat/completions", headers=headers, json=json_data)
-            response.raise_for_status()
-            reply = response.json()["choices"][0]["message"]["content"]
-            Message.objects.create(
-                conversation=conversation,
-                sender="bot",
-                content=reply.strip()
-            )
-            return Response({"reply": reply.strip()})
-        except httpx.HTTPStatusError as e:
-            logger.error(f"❌ HTTP error: {str(e)}")
-            return Response({"error": "OpenRouter API Error", "details": str(e)}, status=500)
-        except Exception as e:
-            logger.error(f"❌ General error: {str(e)}")
-            return Response({"error": "Internal Server Error", "details": str(e)}, status=500)
-        
+            user_message, conversation_id = turns.parse(request.data, self.conversation_required)
+        except turns.InvalidTurn as e:
+            return Response({"error": str(e)}, status=400)
+        conversation = turns.get_conversation(conversation_id, request.user.pk)
 
-class GroqChatAPIView(APIView):
-    def post(self, request):
-        user_message = request.data.get("message", "")
-        history = request.data.get("history", [])
-        if not user_message:
-            return Response({"error": "No message provided"}, status=400)
+        logger.info(f"{self.log_prefix}User message: {user_message}")
 
-        logger.info(f"[GROQ] User message: {user_message}")
+        # Both messages are written once the reply is in
+        messages = turns.build_messages(conversation, request.data, user_message)
 
-        headers = {
-            "Authorization": f"Bearer {os.getenv('GROQ_API_KEY')}",
-            "Content-Type": "application/json"
-        }
-        # Get current time in Pakistan timezone
-        pakistan_time = datetime.now(pytz.timezone('Asia/Karachi'))
-        formatted_time = pakistan_time.strftime("%Y-%m-%d %H:%M:%S")
-        system_prompt = (
-            f"You are a friendly and helpful assistant. "
-            f"The current exact timestamp in Pakistan (Asia/Karachi) is: {formatted_time}. "
-            f"Only mention the time or date when the user directly asks about it. "
-            f"- Do NOT include the time/date in general greetings or unrelated responses. "
-            f"- When the user asks about the time or date, respond naturally using the provided timestamp. "
-            f"- For time, respond like: 'It's 2:30 PM in Pakistan!' "
-            f"- For dates, use formats like 'June 23, 2025' or 'Monday, June 23rd'. "
-            f"- If the user asks for **both date and time**, respond like: "
-            f"  'It's 2:30 PM on June 23, 2025 in Pakistan.' "
-            f"- NEVER say you lack real-time access. "
-            f"Examples: "
-            f"1. User: 'What time is it?' → 'It's 2:08 PM in Pakistan!' "
-            f"2. User: 'What's today's date?' → 'Today is June 23, 2025.' "
-            f"3. User: 'What's the current date and time in Pakistan?' → 'It's 2:30 PM on June 23, 2025 in Pakistan.' "
-            f"4. User: 'Hey' → 'Hello! How can I help you today?' (❌ Do NOT mention time here)"
-        )
-        
-        json_data = {
-                "model": "llama3-8b-8192",  # Or another one listed above
-            "messages": [
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_message}
-            ] + history
-        }
+        def save_turn(reply):
+            turns.save_turn(conversation, user_message, reply)
+
+        ident = ratelimit.identity(request)
+        ratelimit.acquire_slot(ident)
+        if request.data.get("stream"):
+            events = stream_reply(providers.stream(self.route, messages), on_complete=save_turn, log_prefix=self.log_prefix)
+            return sse_response(ratelimit.releasing(events, ident))
 
         try:
-            response = httpx.post("https://api.groq.com/openai/v1/chat/completions", headers=headers, json=json_data)
-            response.raise_for_status()
-            reply = response.json()["choices"][0]["message"]["content"]
-            conversation_id = request.data.get("conversation_id")
-            if conversation_id:
-                conversation = get_object_or_404(Conversation, id=conversation_id, user=request.user)
-                Message.objects.create(conversation=conversation, sender="user", content=user_message)
-                Message.objects.create(conversation=conversation, sender="bot", content=reply.strip())
-            return Response({"reply": reply.strip()})
-        except httpx.HTTPStatusError as e:
-            logger.error(f"[GROQ] ❌ HTTP error: {str(e)}")
-            return Response({"error": "Groq API Error", "details": str(e)}, status=500)
+            reply = turns.complete(self.route, messages, conversation)
+            save_turn(reply)
+            return Response({"reply": reply})
         except Exception as e:
-            logger.error(f"[GROQ] ❌ General error: {str(e)}")
-            return Response({"error": "Internal Server Error", "details": str(e)}, status=500)
+            body, status, headers = turns.error_response(e, self.log_prefix)
+            return Response(body, status=status, headers=headers)
+        finally:
+            ratelimit.release_slot(ident)
 
 
-class GroqChatTwoAPIView(APIView):
-    def post(self, request):
-        user_message = request.data.get("message", "")
-        history = request.data.get("history", [])
-        if not user_message:
-            return Response({"error": "No message provided"}, status=400)
+class GroqChatAPIView(ChatAPIView):
+    # Open to anonymous callers (history comes from the client); they are rate limited per IP
+    permission_classes = [AllowAny]
+    route = "groq-8b"
+    conversation_required = False
+    log_prefix = "[GROQ] "
 
-        logger.info(f"[GROQ] User message: {user_message}")
-
-        headers = {
-            "Authorization": f"Bearer {os.getenv('GROQ_API_KEY')}",
-            "Content-Type": "application/json"
-        }
-        # Get current time in Pakistan timezone
-        pakistan_time = datetime.now(pytz.timezone('Asia/Karachi'))
-        formatted_time = pakistan_time.strftime("%Y-%m-%d %H:%M:%S")
-        system_prompt = (
-            f"You are a friendly and helpful assistant. "
-            f"The current exact timestamp in Pakistan (Asia/Karachi) is: {formatted_time}. "
-            f"Only mention the time or date when the user directly asks about it. "
-            f"- Do NOT include the time/date in general greetings or unrelated responses. "
-            f"- When the user asks about the time or date, respond naturally using the provided timestamp. "
-            f"- For time, respond like: 'It's 2:30 PM in Pakistan!' "
-            f"- For dates, use formats like 'June 23, 2025' or 'Monday, June 23rd'. "
-            f"- If the user asks for **both date and time**, respond like: "
-            f"  'It's 2:30 PM on June 23, 2025 in Pakistan.' "
-            f"- NEVER say you lack real-time access. "
-            f"Examples: "
-            f"1. User: 'What time is it?' → 'It's 2:08 PM in Pakistan!' "
-            f"2. User: 'What's today's date?' → 'Today is June 23, 2025.' "
-            f"3. User: 'What's the current date and time in Pakistan?' → 'It's 2:30 PM on June 23, 2025 in Pakistan.' "
-            f"4. User: 'Hey' → 'Hello! How can I help you today?' (❌ Do NOT mention time here)"
-        )
 
-
-        json_data = {
-                "model": "llama3-70b-8192",  # Or another one listed above
-            "messages": [
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_message}
-            ] + history
-        }
-
-        try:
-            response = httpx.post("https://api.groq.com/openai/v1/chat/completions", headers=headers, json=json_data)
-            response.raise_for_status()
-            reply = response.json()["choices"][0]["message"]["content"]
-            conversation_id = request.data.get("conversation_id")
-            if conversation_id:
-                conversation = get_object_or_404(Conversation, id=conversation_id, user=request.user)
-                Message.objects.create(conversation=conversation, sender="user", content=user_message)
-                Message.objects.create(conversation=conversation, sender="bot", content=reply.strip())
-
-            return Response({"reply": reply.strip()})
-        except httpx.HTTPStatusError as e:
-            logger.error(f"[GROQ] ❌ HTTP error: {str(e)}")
-            return Response({"error": "Groq API Error", "details": str(e)}, status=500)
-        except Exception as e:
-            logger.error(f"[GROQ] ❌ General error: {str(e)}")
-            return Response({"error": "Internal Server Error", "details": str(e)}, status=500)
+class GroqChatTwoAPIView(GroqChatAPIView):
+    route = "groq-70b"
 
 
 class TelegramBotAPIView(APIView):
@@ -268,51 +196,25 @@ class TelegramBotAPIView(APIView):
 
     
     def get(self, request):  # Optional GET handler to avoid 500
-        print(os.getenv('TELEGRAM_BOT_TOKEN'))
         return Response({"message": "Telegram Bot Webhook is ready."})
 
 
     def post(self, request):
-        data = request.data
-        message = data.get("message", {}).get("text")
-        chat_id = data.get("message", {}).get("chat", {}).get("id")
+        update_id, chat_id, message = telegram.parse_update(request.data)
 
-        if not message or not chat_id:
-            logger.warning("Invalid Telegram request: Missing chat_id or message")
+        if not message or not chat_id or update_id is None:
+            logger.warning("Invalid Telegram request: Missing update_id, chat_id or message")
             return Response({"status": "ignored"})
 
-        logger.info(f"📩 Telegram message from {chat_id}: {message}")
-
-        # Process message with your AI backend (Groq/OpenRouter)
-        try:
-            reply = get_groq_reply(message)  # or get_openrouter_reply(message)
-        except Exception as e:
-            logger.error(f"❌ Error getting AI reply: {str(e)}")
-            reply = "Oops! AI backend error."
-
-        # Send reply back to Telegram
-        telegram_api = f"https://api.telegram.org/bot{os.getenv('TELEGRAM_BOT_TOKEN')}/sendMessage"
-        print(f"Sending reply to Telegram: {telegram_api}")
-        payload = {
-            "chat_id": chat_id,
-            "text": reply,
-        }
         try:
-            # proxies = {
-            #     "http": "http://102.23.235.205",    # Sample public proxy
-            #     "https": "http://102.23.235.205"
-            # }
-
-            response = requests.post(telegram_api, json=payload, timeout=10)
-            response.raise_for_status()
-            logger.info(f"✅ Telegram sent reply: {response.status_code} - {response.text}")
-        except Exception as e:
-            logger.error(f"❌ Failed to send Telegram reply: {str(e)}")
-        # try:
-        #     requests.post(telegram_api, json=payload)
-        # except Exception as e:
-        #     logger.error(f"❌ Failed to send Telegram reply: {str(e)}")
-
-        return Response({"status": "ok"})
-
-
+            ratelimit.hit(f"telegram:{chat_id}", settings.RATE_LIMIT_TELEGRAM)
+        except ratelimit.RateLimited:
+            # Still a 200: an error status would only make Telegram redeliver the update
+            logger.warning(f"Telegram chat {chat_id} is over its rate limit; update {update_id} dropped")
+            return Response({"status": "rate_limited"})
+
+        # Ack straight away; the reply is generated and sent by chat/telegram.py workers
+        if not telegram.enqueue(update_id, chat_id, message):
+            logger.info(f"Duplicate Telegram update {update_id} ignored")
+            return Response({"status": "duplicate"})
+        return Response({"status": "queued"})
@@ -52,6 +52,8 @@ INSTALLED_APPS = [
 SITE_ID = 1
 
 MIDDLEWARE = [
+    'chat.metrics.MetricsMiddleware',  # first, so it times everything below
+    'chat.middleware.APIMiddlewareRouter',  # /api/ requests continue with API_MIDDLEWARE instead
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
@@ -63,6 +65,14 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'allauth.account.middleware.AccountMiddleware',
 ]
+# API MIDDLEWARE - see chat/middleware.py; token-authenticated JSON routes skip static files, sessions and CSRF
+API_PREFIX = "/api/"
+API_FULL_STACK_PREFIXES = ["/api/auth/"]  # dj-rest-auth/allauth use sessions and messages
+API_MIDDLEWARE = [
+    'corsheaders.middleware.CorsMiddleware',
+    'django.middleware.security.SecurityMiddleware',
+    'django.middleware.common.CommonMiddleware',
+]
 
 ROOT_URLCONF = 'core.urls'
 
@@ -83,13 +93,154 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'core.wsgi.application'
+ASGI_APPLICATION = 'core.asgi.application'
+
+# Route the LLM endpoints to the async views in chat/async_views.py (use with ASGI workers)
+CHAT_ASYNC_VIEWS = os.getenv("DJANGO_ASYNC_VIEWS", "False").lower() == "true"
 
 # DATABASE
 DATABASE_URL = os.getenv('DATABASE_URL', 'sqlite:///db.sqlite3').replace('postgres://', 'postgresql://')
+# Persistent connections, checked before reuse. Off by default under ASGI: sync code there runs on
+# a pool of threads, each of which would keep its own connection open (use PgBouncer instead)
+DB_CONN_MAX_AGE = int(os.getenv("DB_CONN_MAX_AGE", "0" if CHAT_ASYNC_VIEWS else "600"))
 DATABASES = {
-    'default': dj_database_url.parse(DATABASE_URL)
+    'default': dj_database_url.parse(DATABASE_URL, conn_max_age=DB_CONN_MAX_AGE, conn_health_checks=True)
 }
 
+# CACHES - Redis when REDIS_URL is set (shared across workers), otherwise per-process locmem
+REDIS_URL = os.getenv("REDIS_URL")
+CHAT_RESPONSE_CACHE_ALIAS = "responses"
+CHAT_RESPONSE_CACHE_TTL = int(os.getenv("CHAT_RESPONSE_CACHE_TTL", "600"))
+if REDIS_URL:
+    # Eviction is Redis' own; run it with maxmemory-policy allkeys-lru
+    CACHES = {
+        'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': REDIS_URL},
+        CHAT_RESPONSE_CACHE_ALIAS: {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+            'KEY_PREFIX': 'responses',
+        },
+    }
+else:
+    CACHES = {
+        'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'default'},
+        # LocMemCache evicts least-recently-used entries once MAX_ENTRIES is reached
+        CHAT_RESPONSE_CACHE_ALIAS: {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'responses',
+            'OPTIONS': {'MAX_ENTRIES': int(os.getenv("CHAT_RESPONSE_CACHE_MAX_ENTRIES", "5000")), 'CULL_FREQUENCY': 10},
+        },
+    }
+
+# SEMANTIC RESPONSE CACHE - see chat/semantic_cache.py (per process, entries live CHAT_RESPONSE_CACHE_TTL)
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "False").lower() == "true"  # off until checked on real traffic
+# Cosine similarity to serve a hit. On the labelled pairs in chat/tests.py, rewordings score 0.93-1.0
+# and same-scope pairs that mean different things at most 0.72
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.82"))
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "5000"))
+SEMANTIC_CACHE_DIM = int(os.getenv("SEMANTIC_CACHE_DIM", "512"))  # hashed buckets; the index is MAX_ENTRIES * DIM * 4 bytes
+
+# OUTBOUND HTTP (LLM providers, Telegram) - see chat/http_clients.py
+PROVIDER_HTTP2 = os.getenv("PROVIDER_HTTP2", "True").lower() == "true"
+PROVIDER_MAX_CONNECTIONS = int(os.getenv("PROVIDER_MAX_CONNECTIONS", "100"))
+PROVIDER_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("PROVIDER_MAX_KEEPALIVE_CONNECTIONS", "20"))
+PROVIDER_KEEPALIVE_EXPIRY = float(os.getenv("PROVIDER_KEEPALIVE_EXPIRY", "60"))
+PROVIDER_CONNECT_TIMEOUT = float(os.getenv("PROVIDER_CONNECT_TIMEOUT", "5"))
+PROVIDER_READ_TIMEOUT = float(os.getenv("PROVIDER_READ_TIMEOUT", "60"))
+
+# LLM PROVIDERS - see chat/providers.py
+LLM_PROVIDERS = {
+    "openrouter-deepseek-70b": {
+        "url": os.getenv("OPENROUTER_API_URL", "https://openrouter.ai/api/v1/chat/completions"),
+        "model": "deepseek/deepseek-r1-distill-llama-70b:free",
+        "api_key_env": "OPENROUTER_API_KEY",
+        "headers": {"HTTP-Referer": "http://localhost", "X-Title": "ReactChatWithOpenRouter"},
+    },
+    "groq-llama3-8b": {
+        "url": os.getenv("GROQ_API_URL", "https://api.groq.com/openai/v1/chat/completions"),
+        "model": "llama3-8b-8192",
+        "api_key_env": "GROQ_API_KEY",
+    },
+    "groq-llama3-70b": {
+        "url": os.getenv("GROQ_API_URL", "https://api.groq.com/openai/v1/chat/completions"),
+        "model": "llama3-70b-8192",
+        "api_key_env": "GROQ_API_KEY",
+    },
+}
+# Each route lists interchangeable providers in preference order; the fastest healthy one is used
+LLM_ROUTES = {
+    "openrouter": ["openrouter-deepseek-70b", "groq-llama3-70b"],
+    "groq-8b": ["groq-llama3-8b", "groq-llama3-70b"],
+    "groq-70b": ["groq-llama3-70b", "groq-llama3-8b"],
+}
+LLM_STATS_WINDOW = int(os.getenv("LLM_STATS_WINDOW", "100"))  # samples kept per provider
+LLM_STATS_MAX_AGE = float(os.getenv("LLM_STATS_MAX_AGE", "300"))  # seconds before a sample expires
+LLM_MIN_SAMPLES = int(os.getenv("LLM_MIN_SAMPLES", "5"))
+LLM_MAX_ERROR_RATE = float(os.getenv("LLM_MAX_ERROR_RATE", "0.5"))
+LLM_COOLDOWN_SECONDS = float(os.getenv("LLM_COOLDOWN_SECONDS", "30"))  # after a 429 without Retry-After
+LLM_MAX_COOLDOWN_SECONDS = float(os.getenv("LLM_MAX_COOLDOWN_SECONDS", "300"))
+LLM_SINGLE_FLIGHT = os.getenv("LLM_SINGLE_FLIGHT", "True").lower() == "true"  # share identical in-flight completions
+
+# CONVERSATION CONTEXT - see chat/context.py
+CHAT_CONTEXT_TOKEN_BUDGET = int(os.getenv("CHAT_CONTEXT_TOKEN_BUDGET", "6000"))  # system prompt + history
+CHAT_CONTEXT_MAX_MESSAGES = int(os.getenv("CHAT_CONTEXT_MAX_MESSAGES", "100"))
+CHAT_CONTEXT_CACHE_TTL = int(os.getenv("CHAT_CONTEXT_CACHE_TTL", "3600"))
+
+# MESSAGE PERSISTENCE - see chat/persistence.py
+CHAT_WRITE_BEHIND = os.getenv("CHAT_WRITE_BEHIND", "False").lower() == "true"  # buffer turns and insert them in batches
+CHAT_WRITE_BEHIND_BATCH = int(os.getenv("CHAT_WRITE_BEHIND_BATCH", "100"))  # messages per flush
+CHAT_WRITE_BEHIND_INTERVAL = float(os.getenv("CHAT_WRITE_BEHIND_INTERVAL", "0.5"))  # seconds between flushes
+
+# RATE LIMITS - see chat/ratelimit.py ("<requests>/<s|min|hour|day>", empty = unlimited)
+RATE_LIMIT_USER = os.getenv("RATE_LIMIT_USER", "30/min")  # per authenticated user
+RATE_LIMIT_ANON = os.getenv("RATE_LIMIT_ANON", "10/min")  # per client IP
+RATE_LIMIT_TELEGRAM = os.getenv("RATE_LIMIT_TELEGRAM", "20/min")  # per Telegram chat_id
+# Proxies in front of the app that append to X-Forwarded-For: Heroku's router is one. Set 0 only when
+# clients connect directly, or every anonymous caller shares the proxy's bucket
+RATE_LIMIT_TRUSTED_PROXIES = int(os.getenv("RATE_LIMIT_TRUSTED_PROXIES", "1"))
+CHAT_MAX_CONCURRENT_PER_USER = int(os.getenv("CHAT_MAX_CONCURRENT_PER_USER", "2"))  # in-flight LLM calls
+CHAT_SLOT_TIMEOUT = int(os.getenv("CHAT_SLOT_TIMEOUT", "300"))  # seconds before a leaked in-flight slot expires
+
+# TOKEN AUTH CACHE - see chat/authentication.py
+AUTH_TOKEN_CACHE_TTL = int(os.getenv("AUTH_TOKEN_CACHE_TTL", "300"))  # shared cache, invalidated on logout
+AUTH_TOKEN_LOCAL_TTL = float(os.getenv("AUTH_TOKEN_LOCAL_TTL", "10"))  # per-process; bounds revocation lag across workers
+AUTH_TOKEN_LOCAL_MAX = int(os.getenv("AUTH_TOKEN_LOCAL_MAX", "10000"))
+
+# METRICS - see chat/metrics.py; /metrics requires "Authorization: Bearer <token>" and is closed while unset
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+
+# IMPORTS - see chat/exports.py; an API import is a single transaction, so it is capped
+CHAT_IMPORT_MAX_BYTES = int(os.getenv("CHAT_IMPORT_MAX_BYTES", str(20 * 1024 * 1024)))
+CHAT_IMPORT_MAX_LINES = int(os.getenv("CHAT_IMPORT_MAX_LINES", "100000"))
+
+# RETENTION - see chat/retention.py and manage.py purge_old_conversations
+CHAT_RETENTION_DAYS = int(os.getenv("CHAT_RETENTION_DAYS", "365"))  # conversations inactive this long are purged
+TELEGRAM_RETENTION_DAYS = int(os.getenv("TELEGRAM_RETENTION_DAYS", "30"))  # processed webhook updates
+
+# CONVERSATION SUMMARIES - see chat/summaries.py
+CHAT_SUMMARY_TRIGGER_TOKENS = int(os.getenv("CHAT_SUMMARY_TRIGGER_TOKENS", "3000"))
+CHAT_SUMMARY_KEEP_RECENT = int(os.getenv("CHAT_SUMMARY_KEEP_RECENT", "6"))  # messages kept verbatim, >= 1
+CHAT_SUMMARY_MAX_BATCH = int(os.getenv("CHAT_SUMMARY_MAX_BATCH", "40"))  # messages folded per LLM call
+CHAT_SUMMARY_ROUTE = os.getenv("CHAT_SUMMARY_ROUTE", "groq-8b")
+
+# BACKGROUND JOBS - see chat/jobs.py and manage.py run_workers
+JOB_INLINE_WORKERS = int(os.getenv("JOB_INLINE_WORKERS", "2"))  # 0 = only run_workers runs jobs
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "5"))
+JOB_RETRY_BASE_DELAY = float(os.getenv("JOB_RETRY_BASE_DELAY", "5"))  # seconds, doubled per attempt
+JOB_RETRY_MAX_DELAY = float(os.getenv("JOB_RETRY_MAX_DELAY", "600"))
+JOB_CLAIM_TIMEOUT = int(os.getenv("JOB_CLAIM_TIMEOUT", "300"))  # seconds before a running job is presumed dead
+JOB_RETENTION_DAYS = int(os.getenv("JOB_RETENTION_DAYS", "7"))  # finished jobs
+
+# TELEGRAM WEBHOOK QUEUE - see chat/telegram.py
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "https://api.telegram.org")
+TELEGRAM_INLINE_WORKERS = int(os.getenv("TELEGRAM_INLINE_WORKERS", "4"))  # 0 = only run_telegram_worker processes updates
+TELEGRAM_MAX_ATTEMPTS = int(os.getenv("TELEGRAM_MAX_ATTEMPTS", "3"))
+TELEGRAM_RETRY_DELAY = int(os.getenv("TELEGRAM_RETRY_DELAY", "10"))  # seconds before a failed update is retried
+TELEGRAM_CLAIM_TIMEOUT = int(os.getenv("TELEGRAM_CLAIM_TIMEOUT", "120"))  # seconds before a stuck update or chat lease is reclaimed
+TELEGRAM_COALESCE_WINDOW = float(os.getenv("TELEGRAM_COALESCE_WINDOW", "1.5"))  # quiet seconds before answering a burst
+TELEGRAM_COALESCE_MAX_WAIT = float(os.getenv("TELEGRAM_COALESCE_MAX_WAIT", "5"))
+TELEGRAM_HISTORY_MESSAGES = int(os.getenv("TELEGRAM_HISTORY_MESSAGES", "20"))  # per-chat context kept for replies
+
 # PASSWORD VALIDATION
 AUTH_PASSWORD_VALIDATORS = [
     {'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator'},
@@ -98,6 +249,25 @@ AUTH_PASSWORD_VALIDATORS = [
     {'NAME': 'django.contrib.auth.password_validation.NumericPasswordValidator'},
 ]
 
+# PASSWORD HASHING - see chat/hashers.py
+PASSWORD_HASHER = os.getenv("PASSWORD_HASHER", "scrypt")  # scrypt | pbkdf2 | argon2 (needs argon2-cffi)
+PASSWORD_SCRYPT_WORK_FACTOR = int(os.getenv("PASSWORD_SCRYPT_WORK_FACTOR", str(2 ** 14)))
+PASSWORD_SCRYPT_BLOCK_SIZE = int(os.getenv("PASSWORD_SCRYPT_BLOCK_SIZE", "8"))
+PASSWORD_SCRYPT_PARALLELISM = int(os.getenv("PASSWORD_SCRYPT_PARALLELISM", "1"))
+PASSWORD_PBKDF2_ITERATIONS = int(os.getenv("PASSWORD_PBKDF2_ITERATIONS", "1000000"))
+PASSWORD_ARGON2_TIME_COST = int(os.getenv("PASSWORD_ARGON2_TIME_COST", "2"))
+PASSWORD_ARGON2_MEMORY_COST = int(os.getenv("PASSWORD_ARGON2_MEMORY_COST", "102400"))  # KiB
+PASSWORD_ARGON2_PARALLELISM = int(os.getenv("PASSWORD_ARGON2_PARALLELISM", "8"))
+_PASSWORD_HASHERS = {
+    "scrypt": "chat.hashers.ScryptPasswordHasher",
+    "pbkdf2": "chat.hashers.PBKDF2PasswordHasher",
+    "argon2": "chat.hashers.Argon2PasswordHasher",
+}
+# The first one hashes new passwords; the rest only verify (and get rehashed on login)
+PASSWORD_HASHERS = [_PASSWORD_HASHERS[PASSWORD_HASHER]] + [
+    path for name, path in _PASSWORD_HASHERS.items() if name != PASSWORD_HASHER
+] + ['django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher']
+
 # INTERNATIONALIZATION
 LANGUAGE_CODE = 'en-us'
 TIME_ZONE = 'UTC'
@@ -120,12 +290,12 @@ CORS_ALLOWED_ORIGINS = [
 ]
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
-    ],
-    'DEFAULT_RENDERER_CLASSES': [
-        'rest_framework.renderers.JSONRenderer',
-        'rest_framework.renderers.BrowsableAPIRenderer',
+        'chat.authentication.CachedTokenAuthentication',
     ],
+    # The browsable API renders templates and extra queries per response; development only
+    'DEFAULT_RENDERER_CLASSES': ['rest_framework.renderers.JSONRenderer'] + (
+        ['rest_framework.renderers.BrowsableAPIRenderer'] if DEBUG else []
+    ),
 }
 ACCOUNT_AUTHENTICATION_METHOD = "email"
 ACCOUNT_USERNAME_REQUIRED = True   
@@ -136,10 +306,9 @@ ACCOUNT_USER_MODEL_USERNAME_FIELD = 'username'
 REST_AUTH_SERIALIZERS = {
     'LOGIN_SERIALIZER': 'chat.serializers.CustomLoginSerializer',
 }
+# One backend: email logins hit the LOWER(email) index, usernames fall back to ModelBackend
 AUTHENTICATION_BACKENDS = (
     'chat.backends.EmailBackend',
-    'django.contrib.auth.backends.ModelBackend',
-    'allauth.account.auth_backends.AuthenticationBackend',
 )
 CORS_ALLOW_HEADERS = [
     "accept",
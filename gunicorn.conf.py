@@ -0,0 +1,52 @@
+"""
+Gunicorn settings for the web dyno (``gunicorn -c gunicorn.conf.py``).
+
+``WEB_WORKER_CLASS`` picks how requests are served:
+
+- ``uvicorn`` (default): ASGI workers running core.asgi with the async LLM
+  views (``DJANGO_ASYNC_VIEWS``), one per core. Each worker's event loop
+  keeps many slow LLM calls in flight at once.
+- ``gthread``: WSGI workers running core.wsgi, ``WEB_THREADS`` threads
+  each, for when the async views aren't wanted. Threads hold persistent
+  DB connections (``DB_CONN_MAX_AGE``).
+
+``WEB_CONCURRENCY`` overrides the worker count either way.
+"""
+import os
+
+WORKER_CLASSES = {
+    "uvicorn": ("uvicorn_worker.UvicornWorker", "core.asgi:application"),
+    "gthread": ("gthread", "core.wsgi:application"),
+}
+
+
+def _cores() -> int:
+    # The CPUs this container may use, not the host's
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+_kind = os.getenv("WEB_WORKER_CLASS", "uvicorn")
+worker_class, wsgi_app = WORKER_CLASSES[_kind]
+# Read by the settings when the workers load the app
+os.environ.setdefault("DJANGO_ASYNC_VIEWS", "true" if _kind == "uvicorn" else "false")
+
+if _kind == "uvicorn":
+    workers = int(os.getenv("WEB_CONCURRENCY", str(_cores())))
+else:
+    workers = int(os.getenv("WEB_CONCURRENCY", str(2 * _cores() + 1)))
+    threads = int(os.getenv("WEB_THREADS", "8"))
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+# LLM calls take up to PROVIDER_READ_TIMEOUT per provider, with failover on top
+timeout = int(os.getenv("WEB_TIMEOUT", "150"))
+graceful_timeout = int(os.getenv("WEB_GRACEFUL_TIMEOUT", "30"))
+keepalive = int(os.getenv("WEB_KEEPALIVE", "5"))
+# Recycle workers now and then, staggered so they don't all restart together
+max_requests = int(os.getenv("WEB_MAX_REQUESTS", "5000"))
+max_requests_jitter = max_requests // 10
+# Heartbeat files on tmpfs; a disk-backed /tmp can stall workers into timeouts
+if os.path.isdir("/dev/shm"):
+    worker_tmp_dir = "/dev/shm"